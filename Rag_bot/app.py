@@ -1,12 +1,18 @@
 import streamlit as st
 import os
-import tempfile
 import sys
 import os
+import re
+import uuid
 sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 
-from src.dataprocessor import run as process_pdf
-from src.QueryProcessor import process_user_query
+# Bare module names, as the modules in src/ import each other: importing one of them as
+# src.<name> too would load a second copy with its own caches, metrics and clients
+from QueryProcessor import stream_user_query
+from conversation import ConversationMemory
+from jobs import get_job_queue
+from manifest import list_manifests
+from tracing import snapshot
 
 # Page Config
 st.set_page_config(page_title="RAG Chatbot", page_icon="🤖", layout="wide")
@@ -100,33 +106,72 @@ st.markdown("<h1>✨ Intelligent Document Chat</h1>", unsafe_allow_html=True)
 
 # Application Logic
 def main():
+    # Each browser session gets its own namespace unless the user joins a shared workspace,
+    # so uploads and searches never see another tenant's documents. It is kept in the URL
+    # (?workspace=...), so a refresh comes back to the same documents and background jobs
+    if "namespace" not in st.session_state:
+        st.session_state.namespace = st.query_params.get("workspace") or f"session-{uuid.uuid4().hex[:12]}"
+
     # Sidebar for File Upload
     with st.sidebar:
+        st.header("🗂️ Workspace")
+        workspace = st.text_input("Workspace name", value=st.session_state.namespace)
+        # Namespaces double as directory names for the local index, keep them path-safe
+        workspace = re.sub(r"[^A-Za-z0-9_-]", "-", workspace.strip())
+        st.session_state.namespace = workspace or st.session_state.namespace
+        namespace = st.session_state.namespace
+        if st.query_params.get("workspace") != namespace:
+            st.query_params["workspace"] = namespace
+
+        documents = {manifest["document_name"]: manifest["document_id"] for manifest in list_manifests(namespace)}
+        selected = st.multiselect("Search only in", options=list(documents), help="Leave empty to search all documents")
+        document_ids = [documents[name] for name in selected] or None
+
         st.header("📂 Upload Document")
         uploaded_file = st.file_uploader("Choose a PDF file", type="pdf")
         
         if uploaded_file is not None:
             if st.button("Process Document"):
-                with st.spinner("Processing... Chunking... Embedding..."):
-                    # Save uploaded file to temp file
-                    with tempfile.NamedTemporaryFile(delete=False, suffix=".pdf") as tmp_file:
-                        tmp_file.write(uploaded_file.read())
-                        tmp_path = tmp_file.name
-                    
-                    try:
-                        # process_pdf with the temp file path
-                        process_pdf(tmp_path)
-                        st.success("✅ Document processed and added to Knowledge Base!")
-                    except Exception as e:
-                        st.error(f"Error processing file: {e}")
-                    finally:
-                        # Cleanup temp file
-                        if os.path.exists(tmp_path):
-                            os.remove(tmp_path)
+                # Indexed in the background: the page stays responsive, and a refresh
+                # or closed tab does not stop the work
+                # getbuffer() is a view of the upload, so it is hashed and saved without copying it
+                get_job_queue().submit(uploaded_file.getbuffer(), document_name=uploaded_file.name,
+                                       namespace=namespace)
+                st.success("✅ Document queued! Progress is shown below.")
+
+        jobs = get_job_queue().list_jobs(namespace, limit=10)
+        if jobs:
+            st.header("⏳ Ingestion Jobs")
+            st.button("🔄 Refresh")
+            for job in jobs:
+                st.caption(f"**{job['document_name']}** · {job['status']} · {job['pages']} pages read · "
+                           f"{job['embedded']} chunks embedded · {job['upserted']} vectors upserted")
+                if job["error"]:
+                    st.caption(f"⚠️ {job['error']}")
+                if job["status"] in ("queued", "running"):
+                    if st.button("Cancel", key=f"cancel-{job['id']}"):
+                        get_job_queue().cancel(job["id"])
+                        st.rerun()
+                elif job["status"] in ("cancelled", "failed"):
+                    if st.button("Resume", key=f"resume-{job['id']}"):
+                        get_job_queue().resume(job["id"])
+                        st.rerun()
+
+        if st.checkbox("⏱️ Show latency metrics"):
+            metrics = snapshot()
+            st.dataframe(
+                [{"stage": name, **{key: round(value, 1) for key, value in stats.items()}}
+                 for name, stats in metrics["spans"].items()],
+                hide_index=True,
+            )
+            st.json(metrics["counters"])
 
     # Main Chat Interface
     if "messages" not in st.session_state:
         st.session_state.messages = []
+    # Recent questions and the last retrieved candidates, for follow-up questions
+    if "conversation" not in st.session_state:
+        st.session_state.conversation = ConversationMemory()
 
     # Display chat history
     for message in st.session_state.messages:
@@ -144,16 +189,24 @@ def main():
         st.session_state.messages.append({"role": "user", "content": query})
         st.markdown(f'<div class="user-message">{query}</div>', unsafe_allow_html=True)
         
-        with st.spinner("Thinking..."):
-            try:
-                response, context = process_user_query(query)
-                
-                # Add bot response to history
-                st.session_state.messages.append({"role": "assistant", "content": response, "context": context})
-                st.markdown(f'<div class="bot-message">{response}</div>', unsafe_allow_html=True)
-
-            except Exception as e:
-                st.error(f"Error generating response: {e}")
+        try:
+            with st.spinner("Thinking..."):
+                answer_pieces, context = stream_user_query(query, namespace=namespace, document_ids=document_ids,
+                                                           memory=st.session_state.conversation)
+
+            # Render the answer as the model generates it instead of waiting for all of it
+            placeholder = st.empty()
+            response = ""
+            for piece in answer_pieces:
+                response += piece
+                placeholder.markdown(f'<div class="bot-message">{response}▌</div>', unsafe_allow_html=True)
+            placeholder.markdown(f'<div class="bot-message">{response}</div>', unsafe_allow_html=True)
+
+            # Add bot response to history
+            st.session_state.messages.append({"role": "assistant", "content": response, "context": context})
+
+        except Exception as e:
+            st.error(f"Error generating response: {e}")
 
 if __name__ == "__main__":
     main()
@@ -1,16 +1,109 @@
+import clients  # noqa: F401 - loads .env before any module reads its settings
+import time
 from embedder import embed_User_query
-from vectorstore import search_in_pinecone
-from llm import query_llm_with_context
+from typing import Dict, Iterator, List, Optional, Tuple
+from answer_cache import get_answer_cache
+from context_packer import CONTEXT_CANDIDATES, pack_context
+from conversation import ConversationMemory
+from manifest import corpus_version
+from reranker import RERANK_FETCH
+from retrieval import RETRIEVAL_MODE, rerank_matches, retrieve, retrieve_candidates
+from llm import RATE_LIMIT_MESSAGE, stream_llm_with_context
+from tracing import increment, record, span
+
+def stream_user_query(query: str, namespace: str = "", document_ids: Optional[List[str]] = None,
+                      mode: str = RETRIEVAL_MODE, query_vector: Optional[List[float]] = None,
+                      timings: Optional[Dict[str, float]] = None,
+                      memory: Optional[ConversationMemory] = None) -> Tuple[Iterator[str], str]:
+    """
+    Like process_user_query, but returns the answer as an iterator over the pieces the
+    LLM generates, so they can be shown as they arrive.
+
+    :param query_vector: Embedding of the query, if the caller already has it (e.g. batched).
+    :param memory: The chat session's ConversationMemory. Follow-ups are then condensed with
+        the earlier questions, and reuse the previous turn's candidates when close enough.
+    :param timings: If given, filled with the seconds spent in each stage: "embed", "cache",
+        "retrieve", "pack", and once the answer is consumed "first_token" and "generate".
+    :return: (answer pieces, context used). The answer is added to the answer cache
+        once the iterator has been consumed.
+    """
+    timings = timings if timings is not None else {}
+    if memory is not None:
+        # "explain that more" -> "What is multi-head attention? explain that more"
+        query = memory.condense(query)
 
-def process_user_query(query: str):
     # Embed the user's query to create a vector representation
-    query_vector = embed_User_query(query)
-    
-    # Search the vector DB to find top matching chunks related to the user's question
-    matched_chunks_context = search_in_pinecone(query_vector, top_k=3)
-    
+    if query_vector is None:
+        with span("query.embed") as stage:
+            query_vector = embed_User_query(query)
+        timings["embed"] = stage.duration
+
+    # Paraphrases of a question already answered over the same document versions
+    # are served from the semantic answer cache without retrieval or an LLM call
+    with span("query.answer_cache") as stage:
+        answer_cache = get_answer_cache()
+        scope = f"{namespace}:{mode}:{corpus_version(namespace, document_ids)}"
+        cached = answer_cache.lookup(query_vector, scope) if answer_cache is not None else None
+        stage.set(hit=cached is not None)
+    timings["cache"] = stage.duration
+    if answer_cache is not None:
+        increment("answer_cache.hit" if cached is not None else "answer_cache.miss")
+    if cached is not None:
+        answer, context = cached
+        return iter([answer]), context
+
+    # Search the vector DB (only this tenant's namespace, optionally only some documents)
+    # to find top matching chunks related to the user's question; in hybrid mode BM25
+    # keyword matches are fused in so exact terms (acronyms, equation names) are not missed
+    with span("query.retrieve", mode=mode) as stage:
+        if memory is None:
+            matches = retrieve(query, query_vector, top_k=CONTEXT_CANDIDATES, namespace=namespace,
+                               document_ids=document_ids, mode=mode)
+        else:
+            # A follow-up close to the previous question re-ranks that turn's candidates
+            # instead of searching again
+            candidates = memory.reusable_candidates(query_vector, scope)
+            stage.set(reused=candidates is not None)
+            increment("conversation.reuse" if candidates is not None else "conversation.search")
+            if candidates is None:
+                candidates = retrieve_candidates(query, query_vector, max(CONTEXT_CANDIDATES, RERANK_FETCH),
+                                                 namespace, document_ids, mode, include_values=True)
+                memory.remember_candidates(query_vector, scope, candidates)
+            matches = rerank_matches(query_vector, candidates, CONTEXT_CANDIDATES)
+    timings["retrieve"] = stage.duration
+    # Keep as many whole, de-overlapped chunks as fit the prompt's token budget, best first
+    with span("query.pack") as stage:
+        matched_chunks_context = pack_context(matches)
+    timings["pack"] = stage.duration
+
     # Send the user query and the search results (query + context) to the LLM for Generating response
-    bot_response = query_llm_with_context(query, matched_chunks_context)
+    def answer_pieces():
+        # Timed by hand rather than with a span: the consumer may resume this generator
+        # from another thread (see async_query), and spans must end where they started
+        pieces = []
+        start = time.perf_counter()
+        for piece in stream_llm_with_context(query, matched_chunks_context):
+            if not pieces:
+                timings["first_token"] = time.perf_counter() - start
+                record("query.first_token", timings["first_token"])
+            pieces.append(piece)
+            yield piece
+        timings["generate"] = time.perf_counter() - start
+        record("query.generate", timings["generate"])
+        bot_response = "".join(pieces)
+        if answer_cache is not None and bot_response != RATE_LIMIT_MESSAGE:
+            answer_cache.store(query, query_vector, bot_response, matched_chunks_context, scope)
+
+    return answer_pieces(), matched_chunks_context
+
+
+def process_user_query(query: str, namespace: str = "", document_ids: Optional[List[str]] = None,
+                       mode: str = RETRIEVAL_MODE, query_vector: Optional[List[float]] = None,
+                       timings: Optional[Dict[str, float]] = None,
+                       memory: Optional[ConversationMemory] = None):
+    answer_pieces, matched_chunks_context = stream_user_query(query, namespace, document_ids, mode,
+                                                              query_vector, timings, memory)
+    bot_response = "".join(answer_pieces)
     return bot_response, matched_chunks_context
 
 if __name__ == "__main__":
@@ -0,0 +1,174 @@
+import os
+from typing import List, Optional
+
+import numpy as np
+
+from local_vectorstore import top_k_indices
+
+# Rows are assigned to centroids in slices to bound the size of the score matrix
+ASSIGN_BATCH = 8192
+
+
+def assign_to_centroids(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_BATCH):
+        scores = vectors[start:start + ASSIGN_BATCH] @ centroids.T
+        assignments[start:start + ASSIGN_BATCH] = np.argmax(scores, axis=1)
+    return assignments
+
+
+def cluster_sums(vectors: np.ndarray, assignments: np.ndarray, k: int):
+    """
+    Per-cluster vector sums and counts; sorting once and using reduceat is much
+    faster than np.add.at for this scatter-add.
+    """
+    counts = np.bincount(assignments, minlength=k)
+    sums = np.zeros((k, vectors.shape[1]), dtype=np.float32)
+    order = np.argsort(assignments, kind="stable")
+    present = np.flatnonzero(counts)
+    starts = np.concatenate([[0], np.cumsum(counts[present])[:-1]])
+    sums[present] = np.add.reduceat(vectors[order], starts, axis=0)
+    return sums, counts
+
+
+def train_kmeans(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """
+    Spherical k-means: centroids are re-normalized after every step so that the
+    dot product ranks them the same way cosine similarity would.
+    """
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = assign_to_centroids(vectors, centroids)
+        sums, counts = cluster_sums(vectors, assignments, nlist)
+        # Re-seed empty clusters with random points so every list stays useful
+        empty = counts == 0
+        if empty.any():
+            sums[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+        norms = np.linalg.norm(sums, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        centroids = (sums / norms).astype(np.float32)
+    return centroids
+
+
+class IVFIndex:
+    """
+    Inverted-file ANN index over the rows of a LocalNamespace.
+
+    A k-means coarse quantizer splits the rows into `nlist` lists; a query only scores
+    the rows in its `nprobe` closest lists, trading recall for latency. Rows added
+    after training are assigned to their nearest centroid, so inserts stay cheap.
+
+    :param nlist: Number of inverted lists (centroids).
+    :param nprobe: Lists scanned per query; raise it for better recall.
+    :param path: Directory for centroids and the assignment log; None keeps it in memory.
+    """
+
+    def __init__(self, nlist: int = 1024, nprobe: int = 16, path: Optional[str] = None):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.path = path
+        self.centroids: Optional[np.ndarray] = None
+        self.lists: List[List[int]] = []
+        self.row_list = {}
+        self._arrays = {}
+        if path and os.path.exists(self._centroids_file()):
+            self._load()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    def _centroids_file(self) -> str:
+        return os.path.join(self.path, "ivf_centroids.npy")
+
+    def _assignments_file(self) -> str:
+        return os.path.join(self.path, "ivf_assignments.i32")
+
+    def _load(self) -> None:
+        self.centroids = np.load(self._centroids_file())
+        self.nlist = len(self.centroids)
+        self.lists = [[] for _ in range(self.nlist)]
+        # The log holds (row, list) pairs; later pairs override earlier ones
+        pairs = np.fromfile(self._assignments_file(), dtype=np.int32).reshape(-1, 2)
+        latest = {}
+        for row, list_id in pairs.tolist():
+            latest[row] = list_id
+        # -1 marks a removed row
+        assigned = {row: list_id for row, list_id in latest.items() if list_id >= 0}
+        self._assign(list(assigned.keys()), np.array(list(assigned.values()), dtype=np.int32), persist=False)
+
+    def train(self, vectors: np.ndarray, sample_size: int = 64) -> None:
+        """
+        Learns the coarse quantizer from (a sample of) the normalized vectors and assigns all of them.
+        """
+        self.nlist = min(self.nlist, len(vectors))
+        rng = np.random.default_rng(0)
+        limit = sample_size * self.nlist
+        sample = vectors if len(vectors) <= limit else vectors[np.sort(rng.choice(len(vectors), limit, replace=False))]
+        self.centroids = train_kmeans(np.asarray(sample, dtype=np.float32), self.nlist)
+        self.lists = [[] for _ in range(self.nlist)]
+        self.row_list = {}
+        self._arrays = {}
+        if self.path:
+            os.makedirs(self.path, exist_ok=True)
+            np.save(self._centroids_file(), self.centroids)
+            if os.path.exists(self._assignments_file()):
+                os.remove(self._assignments_file())
+        self.add(list(range(len(vectors))), vectors)
+
+    def add(self, rows: List[int], vectors: np.ndarray) -> None:
+        """
+        Assigns (possibly overwritten) rows to their nearest centroid.
+        """
+        if not self.is_trained or not rows:
+            return
+        self._assign(rows, assign_to_centroids(np.asarray(vectors, dtype=np.float32), self.centroids))
+
+    def _assign(self, rows: List[int], list_ids: np.ndarray, persist: bool = True) -> None:
+        for row, list_id in zip(rows, list_ids.tolist()):
+            previous = self.row_list.get(row)
+            if previous == list_id:
+                continue
+            if previous is not None:
+                self.lists[previous].remove(row)
+                self._arrays.pop(previous, None)
+            self.lists[list_id].append(row)
+            self.row_list[row] = list_id
+            self._arrays.pop(list_id, None)
+
+        if persist:
+            self._log(rows, list_ids)
+
+    def _log(self, rows: List[int], list_ids: np.ndarray) -> None:
+        if self.path:
+            pairs = np.column_stack([np.asarray(rows, dtype=np.int32), list_ids.astype(np.int32)])
+            with open(self._assignments_file(), "ab") as f:
+                pairs.tofile(f)
+
+    def remove(self, rows: List[int]) -> None:
+        """
+        Drops deleted rows from their inverted lists.
+        """
+        removed = [row for row in rows if row in self.row_list]
+        for row in removed:
+            list_id = self.row_list.pop(row)
+            self.lists[list_id].remove(row)
+            self._arrays.pop(list_id, None)
+        if removed:
+            self._log(removed, np.full(len(removed), -1, dtype=np.int32))
+
+    def _list_rows(self, list_id: int) -> np.ndarray:
+        if list_id not in self._arrays:
+            self._arrays[list_id] = np.asarray(self.lists[list_id], dtype=np.int64)
+        return self._arrays[list_id]
+
+    def candidates(self, query: np.ndarray, nprobe: Optional[int] = None) -> np.ndarray:
+        """
+        Sorted rows of the `nprobe` lists whose centroids are closest to the query.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probes = top_k_indices(self.centroids @ query, nprobe)
+        rows = np.concatenate([self._list_rows(list_id) for list_id in probes])
+        rows.sort()  # sequential reads from the memory-mapped matrix
+        return rows
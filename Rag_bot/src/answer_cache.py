@@ -0,0 +1,153 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Set ANSWER_CACHE_PATH to an empty string to disable the semantic answer cache
+ANSWER_CACHE_PATH = os.getenv("ANSWER_CACHE_PATH", ".cache/answers.sqlite")
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.95"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", str(24 * 3600)))
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "10000"))
+
+
+class SemanticAnswerCache:
+    """
+    Persistent LLM answer cache looked up by query-embedding similarity.
+
+    Answers are stored per `scope` (namespace + document versions), so re-indexing a
+    document never serves answers computed from its old text. A lookup hits when a
+    cached query in the same scope has cosine similarity >= `threshold` with the new
+    one and is younger than `ttl` seconds. Past `max_entries`, the least recently
+    used answers are evicted.
+
+    :param path: SQLite file to use; parent directories are created.
+    :param threshold: Minimum cosine similarity for a hit.
+    :param ttl: Seconds an answer stays valid.
+    :param max_entries: Maximum number of cached answers.
+    """
+
+    def __init__(self, path: str, threshold: float = 0.95, ttl: float = 24 * 3600, max_entries: int = 10000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # scope -> (row ids, normalized embedding matrix), rebuilt when the scope changes
+        self._matrices: Dict[str, Tuple[List[int], np.ndarray]] = {}
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS answers (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                scope TEXT NOT NULL,
+                query TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                answer TEXT NOT NULL,
+                context TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_scope ON answers(scope)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_answers_last_used ON answers(last_used)")
+        self.conn.commit()
+
+    def _matrix(self, scope: str) -> Tuple[List[int], np.ndarray]:
+        if scope not in self._matrices:
+            rows = self.conn.execute(
+                "SELECT id, embedding FROM answers WHERE scope = ? AND created_at >= ?",
+                (scope, time.time() - self.ttl),
+            ).fetchall()
+            ids = [row_id for row_id, _ in rows]
+            matrix = np.array([np.frombuffer(blob, dtype=np.float32) for _, blob in rows], dtype=np.float32)
+            self._matrices[scope] = (ids, matrix)
+        return self._matrices[scope]
+
+    def lookup(self, query_vector: List[float], scope: str = "") -> Optional[Tuple[str, str]]:
+        """
+        Returns (answer, context) of the most similar cached query, or None on a miss.
+        """
+        query = np.asarray(query_vector, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self.lock:
+            ids, matrix = self._matrix(scope)
+            if len(ids):
+                scores = matrix @ query
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    row = self.conn.execute(
+                        "SELECT answer, context, created_at FROM answers WHERE id = ?", (ids[best],)
+                    ).fetchone()
+                    if row is not None and row[2] >= time.time() - self.ttl:
+                        self.conn.execute("UPDATE answers SET last_used = ? WHERE id = ?", (time.time(), ids[best]))
+                        self.conn.commit()
+                        self.hits += 1
+                        return row[0], row[1]
+                    # Expired or evicted since the matrix was built
+                    self._matrices.pop(scope, None)
+            self.misses += 1
+            return None
+
+    def store(self, query: str, query_vector: List[float], answer: str, context: str, scope: str = "") -> None:
+        embedding = np.asarray(query_vector, dtype=np.float32)
+        embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        now = time.time()
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO answers (scope, query, embedding, answer, context, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (scope, query, embedding.tobytes(), answer, context, now, now),
+            )
+            self.conn.execute("DELETE FROM answers WHERE created_at < ?", (now - self.ttl,))
+            size = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+            if size > self.max_entries:
+                self.conn.execute(
+                    "DELETE FROM answers WHERE id IN (SELECT id FROM answers ORDER BY last_used LIMIT ?)",
+                    (size - self.max_entries,),
+                )
+                self._matrices.clear()
+            else:
+                self._matrices.pop(scope, None)
+            self.conn.commit()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        with self.lock:
+            entries = self.conn.execute("SELECT COUNT(*) FROM answers").fetchone()[0]
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+        }
+
+
+# Not opened yet; None means disabled
+_UNSET = object()
+_cache = _UNSET
+
+
+def get_answer_cache() -> Optional[SemanticAnswerCache]:
+    """
+    Returns the shared answer cache (None when disabled), opening it on first use.
+    """
+    global _cache
+    if _cache is _UNSET:
+        _cache = SemanticAnswerCache(ANSWER_CACHE_PATH, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL,
+                                     ANSWER_CACHE_MAX_ENTRIES) if ANSWER_CACHE_PATH else None
+    return _cache
+
+
+def set_answer_cache(cache: Optional[SemanticAnswerCache]) -> None:
+    """
+    Replaces the answer cache; pass None to disable caching.
+    """
+    global _cache
+    _cache = cache
@@ -0,0 +1,213 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from answer_cache import get_answer_cache
+from context_packer import CONTEXT_CANDIDATES, pack_context
+from conversation import ConversationMemory
+from embedder import embed_User_query
+from llm import RATE_LIMIT_MESSAGE, stream_llm_with_context
+from manifest import corpus_version
+from reranker import RERANK_FETCH
+from retrieval import RETRIEVAL_MODE, rerank_matches, retrieve, retrieve_candidates
+from tracing import increment, record, span
+
+# The SDK clients are blocking: their calls run on one shared, bounded pool, so any number
+# of concurrent sessions on the event loop use at most this many threads
+ASYNC_WORKERS = int(os.getenv("ASYNC_WORKERS", "16"))
+# A speculative retrieval is kept if its vector is at least this similar to the query's
+SPECULATION_THRESHOLD = float(os.getenv("SPECULATION_THRESHOLD", "0.98"))
+# Normalized queries whose last embedding is kept to retrieve with speculatively
+SPECULATION_CACHE_SIZE = int(os.getenv("SPECULATION_CACHE_SIZE", "10000"))
+
+_executor = ThreadPoolExecutor(max_workers=ASYNC_WORKERS, thread_name_prefix="rag-async")
+_DONE = object()
+
+# Normalized query -> embedding of the last query with that form, least recently used first.
+# Kept apart from the embedding cache, which is keyed by exact text: "what is bleu" must
+# not be answered there with the vector of "What is BLEU?"
+_speculative_vectors: "OrderedDict[str, List[float]]" = OrderedDict()
+_speculative_lock = threading.Lock()
+
+
+async def _run(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, functools.partial(fn, *args, **kwargs))
+
+
+async def aembed_query(query: str, model: str = "models/text-embedding-004") -> List[float]:
+    return await _run(embed_User_query, query, model)
+
+
+async def aretrieve(query: str, query_vector: List[float], top_k: int = 3, namespace: str = "",
+                    document_ids: Optional[List[str]] = None, mode: str = RETRIEVAL_MODE) -> List[dict]:
+    return await _run(retrieve, query, query_vector, top_k=top_k, namespace=namespace,
+                      document_ids=document_ids, mode=mode)
+
+
+async def astream_llm_with_context(query: str, context: str) -> AsyncIterator[str]:
+    """
+    Async version of llm.stream_llm_with_context: each piece is awaited on the shared
+    pool, so the event loop keeps serving other sessions while the model generates.
+    """
+    pieces = stream_llm_with_context(query, context)
+    while True:
+        piece = await _run(next, pieces, _DONE)
+        if piece is _DONE:
+            return
+        yield piece
+
+
+def normalize_query(query: str) -> str:
+    """
+    Case- and whitespace-insensitive form of a query, used to find a cached embedding
+    to retrieve with speculatively.
+    """
+    return " ".join(query.lower().split())
+
+
+def _speculative_vector(key: str) -> Optional[List[float]]:
+    with _speculative_lock:
+        vector = _speculative_vectors.get(key)
+        if vector is not None:
+            _speculative_vectors.move_to_end(key)
+        return vector
+
+
+def _remember_speculative_vector(key: str, vector: List[float]) -> None:
+    with _speculative_lock:
+        _speculative_vectors[key] = vector
+        _speculative_vectors.move_to_end(key)
+        while len(_speculative_vectors) > SPECULATION_CACHE_SIZE:
+            _speculative_vectors.popitem(last=False)
+
+
+def _similarity(a: List[float], b: List[float]) -> float:
+    a = np.asarray(a, dtype=np.float32)
+    b = np.asarray(b, dtype=np.float32)
+    return float(a @ b / ((np.linalg.norm(a) * np.linalg.norm(b)) or 1.0))
+
+
+async def astream_user_query(query: str, namespace: str = "", document_ids: Optional[List[str]] = None,
+                             mode: str = RETRIEVAL_MODE,
+                             embed: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+                             timings: Optional[Dict[str, float]] = None,
+                             memory: Optional[ConversationMemory] = None) -> Tuple[AsyncIterator[str], str]:
+    """
+    Async version of QueryProcessor.stream_user_query with overlapping stages, used by
+    `server.py serve --async`.
+
+    If the normalized query was embedded before, retrieval starts with that vector right
+    away (speculative prefetch) while the exact query is embedded; the prefetched matches
+    are used when both vectors agree, otherwise retrieval runs again. The answer cache
+    lookup and the document-version fingerprint are computed concurrently with the embedding.
+    Stages are traced under the same "query.*" names as the synchronous path.
+
+    :param embed: Coroutine function embedding the query (default aembed_query), e.g. to
+        batch it with concurrent requests.
+    :param timings: Filled like stream_user_query's: "embed", "cache", "retrieve", "pack",
+        and once the answer is consumed "first_token" and "generate".
+    :param memory: The chat session's ConversationMemory, as for stream_user_query. Its
+        candidates are re-ranked rather than prefetched, so there is no speculation then.
+    :return: (async iterator over answer pieces, context used).
+    """
+    timings = timings if timings is not None else {}
+    embed = embed or aembed_query
+    if memory is not None:
+        query = memory.condense(query)
+    key = normalize_query(query)
+    speculative_vector = _speculative_vector(key) if memory is None else None
+    prefetch = None
+    if speculative_vector is not None:
+        prefetch = asyncio.ensure_future(aretrieve(query, speculative_vector, top_k=CONTEXT_CANDIDATES,
+                                                   namespace=namespace, document_ids=document_ids, mode=mode))
+
+    version_task = asyncio.ensure_future(_run(corpus_version, namespace, document_ids))
+    with span("query.embed") as stage:
+        query_vector = await embed(query)
+    timings["embed"] = stage.duration
+    _remember_speculative_vector(key, query_vector)
+
+    with span("query.answer_cache") as stage:
+        scope = f"{namespace}:{mode}:{await version_task}"
+        answer_cache = get_answer_cache()
+        cached = await _run(answer_cache.lookup, query_vector, scope) if answer_cache is not None else None
+        stage.set(hit=cached is not None)
+    timings["cache"] = stage.duration
+    if answer_cache is not None:
+        increment("answer_cache.hit" if cached is not None else "answer_cache.miss")
+    if cached is not None:
+        if prefetch is not None:
+            prefetch.cancel()
+        answer, context = cached
+
+        async def cached_pieces():
+            yield answer
+
+        return cached_pieces(), context
+
+    with span("query.retrieve", mode=mode) as stage:
+        if memory is not None:
+            # As in stream_user_query: a follow-up close to the previous question re-ranks
+            # that turn's candidates instead of searching again
+            candidates = memory.reusable_candidates(query_vector, scope)
+            stage.set(reused=candidates is not None)
+            increment("conversation.reuse" if candidates is not None else "conversation.search")
+            if candidates is None:
+                candidates = await _run(retrieve_candidates, query, query_vector, max(CONTEXT_CANDIDATES, RERANK_FETCH),
+                                        namespace, document_ids, mode, include_values=True)
+                memory.remember_candidates(query_vector, scope, candidates)
+            matches = await _run(rerank_matches, query_vector, candidates, CONTEXT_CANDIDATES)
+        else:
+            speculation_hit = prefetch is not None and _similarity(speculative_vector, query_vector) >= SPECULATION_THRESHOLD
+            if prefetch is not None:
+                stage.set(speculative=speculation_hit)
+                increment("speculation.hit" if speculation_hit else "speculation.miss")
+            if speculation_hit:
+                matches = await prefetch
+            else:
+                if prefetch is not None:
+                    prefetch.cancel()
+                matches = await aretrieve(query, query_vector, top_k=CONTEXT_CANDIDATES, namespace=namespace,
+                                          document_ids=document_ids, mode=mode)
+    timings["retrieve"] = stage.duration
+    with span("query.pack") as stage:
+        matched_chunks_context = pack_context(matches)
+    timings["pack"] = stage.duration
+
+    async def answer_pieces():
+        # Timed by hand like the synchronous path: the consumer may resume this generator
+        # in another task, and spans must end where they started
+        pieces = []
+        start = time.perf_counter()
+        async for piece in astream_llm_with_context(query, matched_chunks_context):
+            if not pieces:
+                timings["first_token"] = time.perf_counter() - start
+                record("query.first_token", timings["first_token"])
+            pieces.append(piece)
+            yield piece
+        timings["generate"] = time.perf_counter() - start
+        record("query.generate", timings["generate"])
+        bot_response = "".join(pieces)
+        if answer_cache is not None and bot_response != RATE_LIMIT_MESSAGE:
+            await _run(answer_cache.store, query, query_vector, bot_response, matched_chunks_context, scope)
+
+    return answer_pieces(), matched_chunks_context
+
+
+async def aprocess_user_query(query: str, namespace: str = "", document_ids: Optional[List[str]] = None,
+                              mode: str = RETRIEVAL_MODE,
+                              embed: Optional[Callable[[str], Awaitable[List[float]]]] = None,
+                              timings: Optional[Dict[str, float]] = None,
+                              memory: Optional[ConversationMemory] = None) -> Tuple[str, str]:
+    answer_pieces, matched_chunks_context = await astream_user_query(query, namespace, document_ids, mode,
+                                                                     embed, timings, memory)
+    bot_response = "".join([piece async for piece in answer_pieces])
+    return bot_response, matched_chunks_context
@@ -0,0 +1,661 @@
+"""
+Offline benchmarks for the RAG pipeline. Run from Rag_bot/src:
+
+    python benchmark.py embed
+    python benchmark.py schedule
+    python benchmark.py cache
+    python benchmark.py search
+    python benchmark.py ann
+    python benchmark.py compress
+    python benchmark.py ingest
+    python benchmark.py pdf
+    python benchmark.py e2e
+    python benchmark.py startup
+    python benchmark.py chunk
+    python benchmark.py upsert
+"""
+import argparse
+import os
+import time
+
+from local_models import HashEmbedder
+
+
+def _percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def _random_vectors(n: int, dim: int, seed: int = 0):
+    import numpy as np
+    return np.random.default_rng(seed).standard_normal((n, dim), dtype=np.float32)
+
+
+def _clustered_vectors(n: int, dim: int, num_clusters: int = 1000, noise: float = 1.5, seed: int = 0):
+    """
+    Points scattered around random centers, closer to real embedding corpora than pure noise.
+    """
+    import numpy as np
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((num_clusters, dim), dtype=np.float32)
+    labels = rng.integers(0, num_clusters, size=n)
+    return centers[labels] + noise * rng.standard_normal((n, dim), dtype=np.float32)
+
+
+def _sample_pages(n: int, words_per_page: int = 450):
+    vocabulary = ["attention", "encoder", "decoder", "layer", "token", "softmax", "query", "key",
+                  "value", "head", "position", "embedding", "training", "model", "sequence"]
+    for page in range(n):
+        words = [vocabulary[(page * 7 + i * 3) % len(vocabulary)] for i in range(words_per_page)]
+        yield f"Page {page}. " + " ".join(words) + ".\n"
+
+
+def _sample_text_pages(n: int, lines_per_page: int = 45, words_per_line: int = 12, seed: int = 0):
+    """
+    Deterministic prose-like pages that do not repeat, so no chunk is deduplicated away.
+    """
+    import random
+    rng = random.Random(seed)
+    vocabulary = ["attention", "encoder", "decoder", "layer", "token", "softmax", "query", "key", "value",
+                  "head", "position", "embedding", "training", "model", "sequence", "residual", "dropout",
+                  "normalization", "gradient", "optimizer", "batch", "vocabulary", "translation", "beam",
+                  "convolution", "recurrent", "parallel", "memory", "distance", "dimension", "matrix",
+                  "projection", "benchmark", "label", "smoothing", "schedule", "warmup", "checkpoint"]
+    for page in range(n):
+        lines = [f"Section {page + 1}."]
+        for _ in range(lines_per_page):
+            lines.append(" ".join(rng.choice(vocabulary) for _ in range(words_per_line)) + ".")
+        yield lines
+
+
+def _write_text_pdf(path: str, pages) -> None:
+    """
+    Writes a minimal PDF (Helvetica, one text line per entry) that pypdf can extract.
+    """
+    def escape(line: str) -> str:
+        return line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>", None, "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for lines in pages:
+        text = " T* ".join(f"({escape(line)}) Tj" for line in lines)
+        stream = f"BT /F1 10 Tf 14 TL 40 760 Td {text} ET".encode("latin-1")
+        objects.append(f"<< /Length {len(stream)} >>\nstream\n".encode("latin-1") + stream + b"\nendstream")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       f"/Resources << /Font << /F1 3 0 R >> >> /Contents {len(objects)} 0 R >>")
+        page_refs.append(f"{len(objects)} 0 R")
+    objects[1] = f"<< /Type /Pages /Kids [{' '.join(page_refs)}] /Count {len(page_refs)} >>"
+
+    with open(path, "wb") as f:
+        f.write(b"%PDF-1.4\n")
+        offsets = []
+        for number, body in enumerate(objects, start=1):
+            offsets.append(f.tell())
+            body = body if isinstance(body, bytes) else body.encode("latin-1")
+            f.write(f"{number} 0 obj\n".encode("latin-1") + body + b"\nendobj\n")
+        xref = f.tell()
+        f.write(f"xref\n0 {len(objects) + 1}\n0000000000 65535 f \n".encode("latin-1"))
+        for offset in offsets:
+            f.write(f"{offset:010d} 00000 n \n".encode("latin-1"))
+        f.write(f"trailer\n<< /Size {len(objects) + 1} /Root 1 0 R >>\nstartxref\n{xref}\n%%EOF\n".encode("latin-1"))
+
+
+def _sample_chunks(n: int):
+    return [f"Chunk {i}: the transformer uses multi-head attention over token {i % 97}." for i in range(n)]
+
+
+def bench_embedding(num_chunks: int = 1000, latency_per_call: float = 0.05, latency_per_item: float = 0.0005):
+    """
+    Compares per-chunk requests with batched requests against a HashEmbedder that
+    sleeps like a remote API would.
+    """
+    import embedder
+
+    chunks = _sample_chunks(num_chunks)
+    embedder.set_embedding_cache(None)
+    for batch_size in (1, 10, 50, 100):
+        backend = HashEmbedder(latency_per_call=latency_per_call, latency_per_item=latency_per_item)
+        embedder.set_embedding_backend(backend)
+        start = time.perf_counter()
+        embeddings = embedder.embed_chunks(chunks, batch_size=batch_size)
+        elapsed = time.perf_counter() - start
+        assert len(embeddings) == len(chunks)
+        print(f"batch_size={batch_size:<4} requests={backend.calls:<5} "
+              f"time={elapsed:7.2f}s  chunks/sec={num_chunks / elapsed:8.1f}")
+
+
+def bench_scheduler(num_chunks: int = 2000, batch_size: int = 20, latency_per_call: float = 0.3,
+                    quota_per_minute: int = 600, max_workers: int = 8):
+    """
+    Runs sequential and concurrent ingestion against a HashEmbedder that enforces a
+    requests-per-minute quota, reporting throughput and how many requests were rejected.
+    """
+    import embedder
+    import embed_scheduler
+
+    chunks = _sample_chunks(num_chunks)
+    embedder.set_embedding_cache(None)
+    embed_scheduler.set_rate_limit(quota_per_minute * 0.95)
+
+    for label, workers in (("sequential", 1), ("concurrent", max_workers)):
+        backend = HashEmbedder(latency_per_call=latency_per_call, requests_per_minute=quota_per_minute)
+        embedder.set_embedding_backend(backend)
+        start = time.perf_counter()
+        embeddings = embed_scheduler.embed_chunks_concurrent(chunks, batch_size=batch_size, max_workers=workers)
+        elapsed = time.perf_counter() - start
+        assert len(embeddings) == len(chunks)
+        print(f"{label:<11} workers={workers:<3} requests={backend.calls:<5} rejected={backend.rejected:<3} "
+              f"time={elapsed:7.2f}s  chunks/sec={num_chunks / elapsed:8.1f}")
+
+
+def bench_cache(num_chunks: int = 1000, latency_per_call: float = 0.05):
+    """
+    Embeds the same document twice through a fresh on-disk cache, as happens when a
+    PDF is uploaded again, and reports the time and hit rate of each pass.
+    """
+    import tempfile
+    import embedder
+    from embedding_cache import EmbeddingCache
+
+    chunks = _sample_chunks(num_chunks)
+    embedder.set_embedding_backend(HashEmbedder(latency_per_call=latency_per_call))
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        cache = EmbeddingCache(os.path.join(tmp_dir, "embeddings.sqlite"))
+        embedder.set_embedding_cache(cache)
+        for label in ("cold", "warm"):
+            start = time.perf_counter()
+            embedder.embed_chunks(chunks)
+            elapsed = time.perf_counter() - start
+            print(f"{label}  time={elapsed:6.3f}s  {cache.stats()}")
+        cache.conn.close()
+
+
+def bench_search(sizes=(10_000, 100_000, 1_000_000), dim: int = 768, top_k: int = 3, num_queries: int = 50):
+    """
+    Query latency of the memory-mapped LocalVectorStore at several corpus sizes.
+    Vectors are inserted in slices so the benchmark itself never holds two copies.
+    """
+    import tempfile
+    from local_vectorstore import LocalNamespace
+
+    queries = _random_vectors(num_queries, dim, seed=1)
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            namespace = LocalNamespace(os.path.join(tmp_dir, "bench"))
+            start = time.perf_counter()
+            for offset in range(0, size, 50_000):
+                count = min(50_000, size - offset)
+                ids = [f"chunk_{i}" for i in range(offset, offset + count)]
+                namespace.add(ids, _random_vectors(count, dim, seed=offset), [{"chunk_index": i} for i in range(offset, offset + count)])
+            build_time = time.perf_counter() - start
+
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                namespace.search(query, top_k)
+                latencies.append((time.perf_counter() - start) * 1000)
+            print(f"chunks={size:<9} build={build_time:6.1f}s  "
+                  f"query p50={_percentile(latencies, 50):7.2f}ms  p95={_percentile(latencies, 95):7.2f}ms")
+            del namespace
+
+
+def bench_ann(size: int = 100_000, dim: int = 768, nlist: int = 256, top_k: int = 10, num_queries: int = 100):
+    """
+    Recall@k and latency of the IVF index for several nprobe values, against exact search.
+    """
+    from local_vectorstore import LocalNamespace
+
+    vectors = _clustered_vectors(size + num_queries, dim)
+    queries, vectors = vectors[:num_queries], vectors[num_queries:]
+    ids = [f"chunk_{i}" for i in range(size)]
+
+    namespace = LocalNamespace(index_type="ivf", nlist=nlist, train_threshold=size)
+    start = time.perf_counter()
+    namespace.add(ids, vectors, [{} for _ in range(size)])
+    print(f"chunks={size} nlist={nlist}  build+train={time.perf_counter() - start:.1f}s")
+
+    def run(**search_args):
+        latencies, results = [], []
+        for query in queries:
+            start = time.perf_counter()
+            matches = namespace.search(query, top_k, **search_args)
+            latencies.append((time.perf_counter() - start) * 1000)
+            results.append({match["id"] for match in matches})
+        return latencies, results
+
+    exact_latencies, truth = run(exact=True)
+    print(f"exact       recall@{top_k}=1.000  p50={_percentile(exact_latencies, 50):7.2f}ms  "
+          f"p95={_percentile(exact_latencies, 95):7.2f}ms")
+    for nprobe in (1, 2, 4, 8, 16, 32, 64):
+        latencies, results = run(nprobe=nprobe)
+        recall = sum(len(found & expected) for found, expected in zip(results, truth)) / (top_k * num_queries)
+        print(f"nprobe={nprobe:<4} recall@{top_k}={recall:.3f}  p50={_percentile(latencies, 50):7.2f}ms  "
+              f"p95={_percentile(latencies, 95):7.2f}ms")
+
+
+def bench_compression(size: int = 100_000, dim: int = 768, top_k: int = 10, num_queries: int = 100):
+    """
+    Bytes scanned per query, recall@k and latency for float32, int8 and PQ storage,
+    each re-ranking its shortlist against the memory-mapped full-precision vectors.
+    """
+    import tempfile
+    from local_vectorstore import LocalNamespace
+
+    vectors = _clustered_vectors(size + num_queries, dim)
+    queries, vectors = vectors[:num_queries], vectors[num_queries:]
+    ids = [f"chunk_{i}" for i in range(size)]
+    metadatas = [{} for _ in range(size)]
+
+    truth = None
+    for label, options in (("float32", {"compression": "none"}),
+                           ("int8", {"compression": "int8"}),
+                           ("pq m=96", {"compression": "pq", "pq_subvectors": 96}),
+                           ("pq m=48", {"compression": "pq", "pq_subvectors": 48})):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            namespace = LocalNamespace(os.path.join(tmp_dir, "bench"), train_threshold=size, **options)
+            start = time.perf_counter()
+            namespace.add(ids, vectors, metadatas)
+            build_time = time.perf_counter() - start
+
+            latencies, results = [], []
+            for query in queries:
+                start = time.perf_counter()
+                matches = namespace.search(query, top_k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                results.append({match["id"] for match in matches})
+            if truth is None:
+                truth = results
+            recall = sum(len(found & expected) for found, expected in zip(results, truth)) / (top_k * num_queries)
+            scanned_mb = namespace.memory_footprint()["scanned_bytes"] / 2 ** 20
+            print(f"{label:<8} scanned={scanned_mb:8.1f}MB  build={build_time:5.1f}s  recall@{top_k}={recall:.3f}  "
+                  f"p50={_percentile(latencies, 50):7.2f}ms  p95={_percentile(latencies, 95):7.2f}ms")
+            del namespace
+
+
+def bench_ingest(num_pages: int = 500, latency_per_call: float = 0.05):
+    """
+    Load-everything ingestion (read all pages, chunk, embed, then upsert) versus the
+    streaming pipeline: total time, time until the first chunk is searchable, and
+    peak traced memory.
+    """
+    import tempfile
+    import tracemalloc
+    import bm25
+    import embedder
+    import vectorstore
+    from chunker import chunk_pages
+    from embed_scheduler import embed_chunks_concurrent
+    from local_vectorstore import LocalVectorStore
+    from pipeline import ingest_stream
+
+    embedder.set_embedding_cache(None)
+
+    def load_everything():
+        pages = list(_sample_pages(num_pages))
+        chunks = chunk_pages(pages)
+        embeddings = embed_chunks_concurrent(chunks)
+        vectorstore.store_in_pinecone(chunks, embeddings)
+        return None
+
+    first_upsert = []
+
+    def streaming():
+        start = time.perf_counter()
+        ingest_stream(_sample_pages(num_pages),
+                      on_progress=lambda _: first_upsert or first_upsert.append(time.perf_counter() - start))
+        return first_upsert[0]
+
+    # The streaming pipeline also fills the keyword index; keep it away from the real one
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bm25.set_bm25_index(bm25.BM25Index(os.path.join(tmp_dir, "bm25.sqlite")))
+        for label, run in (("load-all", load_everything), ("streaming", streaming)):
+            embedder.set_embedding_backend(HashEmbedder(latency_per_call=latency_per_call))
+            vectorstore.set_vector_store(LocalVectorStore())
+            tracemalloc.start()
+            start = time.perf_counter()
+            first = run()
+            elapsed = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            first = elapsed if first is None else first
+            print(f"{label:<10} pages={num_pages}  total={elapsed:6.2f}s  first searchable={first:6.2f}s  "
+                  f"peak={peak / 2 ** 20:7.1f}MB")
+
+
+def bench_pdf(copies: int = 20, workers: int = None):
+    """
+    Sequential vs process-pool text extraction on the bundled paper replicated
+    `copies` times (15 pages each, so 300 pages by default).
+    """
+    import tempfile
+    from pypdf import PdfReader, PdfWriter
+    from pdfreader import iter_pages, iter_pages_parallel
+
+    source = os.path.join(os.path.dirname(__file__), "..", "resources", "Attention is all u need new.pdf")
+    workers = workers or os.cpu_count() or 1
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "replicated.pdf")
+        writer = PdfWriter()
+        reader = PdfReader(source)
+        for _ in range(copies):
+            for page in reader.pages:
+                writer.add_page(page)
+        with open(path, "wb") as f:
+            writer.write(f)
+
+        for label, pages in (("sequential", lambda: iter_pages(path)),
+                             (f"parallel x{workers}", lambda: iter_pages_parallel(path, workers=workers))):
+            start = time.perf_counter()
+            count = sum(1 for _ in pages())
+            elapsed = time.perf_counter() - start
+            print(f"{label:<13} pages={count}  time={elapsed:6.2f}s  pages/sec={count / elapsed:7.1f}")
+
+
+def bench_end_to_end(sizes=(10, 50, 200), num_queries: int = 50, embed_latency: float = 0.05,
+                     llm_first_token: float = 0.3, llm_per_token: float = 0.01):
+    """
+    Runs dataprocessor.run and process_user_query end to end, fully offline: generated
+    PDFs, a HashEmbedder and FakeLLM with simulated latency, and a local vector store.
+    Reports ingestion pages/sec and chunks/sec, query p50/p95 and peak RSS per document size.
+
+    Sizes run smallest first in one process; peak RSS is the process high-water mark
+    after each size, so growth from one row to the next is attributable to that size.
+    """
+    import random
+    import resource
+    import tempfile
+    import answer_cache
+    import bm25
+    import embed_scheduler
+    import embedder
+    import llm
+    import manifest
+    import tracing
+    import vectorstore
+    from dataprocessor import run
+    from local_models import FakeLLM
+    from local_vectorstore import LocalVectorStore
+    from QueryProcessor import process_user_query
+
+    embedder.set_embedding_backend(HashEmbedder(latency_per_call=embed_latency))
+    embedder.set_embedding_cache(None)
+    embed_scheduler.set_rate_limit(1_000_000)
+    answer_cache.set_answer_cache(None)
+    llm.set_llm_backend(FakeLLM(latency_first_token=llm_first_token, latency_per_token=llm_per_token))
+
+    rng = random.Random(0)
+    words = ["attention", "encoder", "decoder", "softmax", "embedding", "dropout", "optimizer", "beam",
+             "warmup", "residual", "projection", "translation", "memory", "position"]
+    queries = [f"How does the {rng.choice(words)} relate to {rng.choice(words)}?" for _ in range(num_queries)]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vectorstore.set_vector_store(LocalVectorStore(os.path.join(tmp_dir, "index")))
+        bm25.set_bm25_index(bm25.BM25Index(os.path.join(tmp_dir, "bm25.sqlite")))
+        manifest.MANIFEST_DIR = os.path.join(tmp_dir, "manifests")
+
+        for size in sorted(sizes):
+            path = os.path.join(tmp_dir, f"document-{size}.pdf")
+            _write_text_pdf(path, _sample_text_pages(size, seed=size))
+            namespace = f"bench-{size}"
+
+            start = time.perf_counter()
+            result = run(path, namespace=namespace)
+            ingest_time = time.perf_counter() - start
+
+            tracing.reset()
+            latencies = []
+            for query in queries:
+                start = time.perf_counter()
+                process_user_query(query, namespace=namespace)
+                latencies.append(time.perf_counter() - start)
+            first_token = tracing.snapshot()["spans"]["query.first_token"]
+
+            peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+            print(f"pages={size:<5} chunks={result['chunks']:<6} ingest={ingest_time:6.2f}s  "
+                  f"pages/sec={size / ingest_time:7.1f}  chunks/sec={result['chunks'] / ingest_time:7.1f}  "
+                  f"query p50={_percentile(latencies, 50) * 1000:6.1f}ms  p95={_percentile(latencies, 95) * 1000:6.1f}ms  "
+                  f"first token p50={first_token['p50_ms']:6.1f}ms  peak RSS={peak_rss:7.1f}MB")
+
+
+def bench_startup(modules=("QueryProcessor", "dataprocessor", "server"), repeats: int = 3, top: int = 5):
+    """
+    Import-time profile (python -X importtime) of the entry-point modules, each in a fresh
+    interpreter: best cumulative time over `repeats` runs and the slowest imports it pulls in.
+    """
+    import subprocess
+    import sys
+
+    src_dir = os.path.dirname(os.path.abspath(__file__))
+    for module in modules:
+        best = None
+        for _ in range(repeats):
+            completed = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                                       cwd=src_dir, capture_output=True, text=True, check=True)
+            # Lines look like "import time:  self [us] | cumulative | imported package"
+            timings = []
+            for line in completed.stderr.splitlines():
+                if line.startswith("import time:") and "|" in line:
+                    _, cumulative, name = line[len("import time:"):].split("|")
+                    if cumulative.strip().isdigit():
+                        timings.append((int(cumulative), name.rstrip()))
+            total = next(us for us, name in timings if name.strip() == module)
+            if best is None or total < best[0]:
+                best = (total, timings)
+
+        total, timings = best
+        print(f"{module:<16} {total / 1000:8.1f}ms")
+        top_level = [(us, name.strip()) for us, name in timings if name.startswith("   ") and not name.startswith("    ")]
+        for us, name in sorted(top_level, reverse=True)[:top]:
+            print(f"    {name:<40} {us / 1000:8.1f}ms")
+
+
+def bench_chunking(copies: int = 100, repeats: int = 5):
+    """
+    LangChain recursive splitting (whole text and streaming) versus the native sentence
+    chunker on the text extracted from the bundled paper, repeated `copies` times (15 pages
+    each, so 1500 pages by default): best time of `repeats` runs, pages/sec, chunk count
+    and mean chunk size.
+    """
+    from chunker import chunk_pages, iter_chunks, iter_sentence_chunks
+    from context_packer import estimate_tokens
+    from pdfreader import read_pdf
+
+    source = os.path.join(os.path.dirname(__file__), "..", "resources", "Attention is all u need new.pdf")
+    pages = read_pdf(source) * copies
+    num_pages = len(pages)
+    chunk_pages(pages[:2])  # import langchain outside the timed runs
+
+    runs = (
+        ("recursive", lambda: chunk_pages(pages)),
+        ("recursive-stream", lambda: list(iter_chunks(iter(pages)))),
+        ("sentence", lambda: [chunk["text"] for chunk in iter_sentence_chunks(iter(pages))]),
+    )
+    best = {label: float("inf") for label, _ in runs}
+    results = {}
+    # Interleaved, so a slow spell of the machine does not land on one chunker only
+    for _ in range(repeats):
+        for label, run in runs:
+            start = time.perf_counter()
+            results[label] = run()
+            best[label] = min(best[label], time.perf_counter() - start)
+    for label, _ in runs:
+        chunks, elapsed = results[label], best[label]
+        mean_tokens = sum(estimate_tokens(chunk) for chunk in chunks) / len(chunks)
+        print(f"{label:<17} pages={num_pages}  time={elapsed:6.2f}s  pages/sec={num_pages / elapsed:8.1f}  "
+              f"chunks={len(chunks):<6} mean tokens={mean_tokens:6.1f}")
+
+
+def _mock_pinecone_server(latency: float, fail_every: int):
+    """
+    Starts an HTTP server answering Pinecone's upsert endpoint after `latency` seconds,
+    with a 503 for every `fail_every`-th request (0 never fails). Returns the server,
+    whose `requests` and `failures` attributes count the requests received and failed.
+    """
+    import json
+    import threading
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                server.requests += 1
+                fail = fail_every and server.requests % fail_every == 0
+                server.failures += bool(fail)
+            time.sleep(latency)
+            if fail:
+                response, status = {"error": "unavailable"}, 503
+            else:
+                response, status = {"upsertedCount": len(body.get("vectors", []))}, 200
+            payload = json.dumps(response).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    server.daemon_threads = True
+    server.requests = server.failures = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def bench_upsert(num_chunks: int = 2000, latency: float = 0.05, embed_latency: float = 0.05, fail_every: int = 10):
+    """
+    Upserts through the real Pinecone client to a local mock server that sleeps `latency`
+    per request and answers every `fail_every`-th one with a 503: sequential versus
+    concurrent requests on their own, then the ingestion pipeline against the same
+    pipeline upserting into an in-memory store, i.e. bound by embedding alone.
+    """
+    import tempfile
+    import bm25
+    import embed_scheduler
+    import embedder
+    import tracing
+    import vectorstore
+    from local_vectorstore import LocalVectorStore
+    from pipeline import ingest_stream
+
+    server = _mock_pinecone_server(latency, fail_every)
+    os.environ.update(PINECONE_API_KEY="benchmark", PINECONE_INDEX_NAME="benchmark",
+                      PINECONE_INDEX_HOST=f"http://127.0.0.1:{server.server_address[1]}")
+    pinecone_store = vectorstore.PineconeStore()
+    vectorstore.set_vector_store(pinecone_store)
+    embedder.set_embedding_cache(None)
+    embed_scheduler.set_rate_limit(1_000_000)
+
+    chunks = _sample_chunks(num_chunks)
+    embeddings = HashEmbedder()(chunks)
+    for in_flight in (1, 2, 4, 8):
+        server.requests = server.failures = 0
+        tracing.reset()
+        start = time.perf_counter()
+        with vectorstore.Upserter(max_in_flight=in_flight) as upserter:
+            vectorstore.store_in_pinecone(chunks, embeddings, upserter=upserter)
+            upserter.flush()
+        elapsed = time.perf_counter() - start
+        # The Pinecone client retries most 503s itself; "retried" counts those that outlasted its retries
+        retried = tracing.snapshot()["counters"].get("retry.transient", 0)
+        print(f"upsert    in_flight={in_flight:<2} requests={server.requests:<4} 503s={server.failures:<3} "
+              f"retried={retried:<3} "
+              f"time={elapsed:6.2f}s  vectors/sec={num_chunks / elapsed:8.1f}")
+
+    num_pages = max(1, num_chunks // 5)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bm25.set_bm25_index(bm25.BM25Index(os.path.join(tmp_dir, "bm25.sqlite")))
+        embed_bound = None
+        for label, store, in_flight in (("embed-only", LocalVectorStore(), 1), ("ingest", pinecone_store, 1),
+                                        ("ingest", pinecone_store, 4)):
+            embedder.set_embedding_backend(HashEmbedder(latency_per_call=embed_latency))
+            vectorstore.set_vector_store(store)
+            start = time.perf_counter()
+            result = ingest_stream(_sample_pages(num_pages), upsert_in_flight=in_flight)
+            elapsed = time.perf_counter() - start
+            embed_bound = embed_bound or elapsed
+            print(f"{label:<10} in_flight={in_flight:<2} chunks={result['upserted']:<5} time={elapsed:6.2f}s  "
+                  f"chunks/sec={result['upserted'] / elapsed:8.1f}  vs embed-only={elapsed / embed_bound:5.2f}x")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline RAG benchmarks")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    embed_parser = sub.add_parser("embed", help="Batched vs per-chunk embedding")
+    embed_parser.add_argument("--chunks", type=int, default=1000)
+    embed_parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per request")
+
+    schedule_parser = sub.add_parser("schedule", help="Sequential vs concurrent rate-limited embedding")
+    schedule_parser.add_argument("--chunks", type=int, default=2000)
+    schedule_parser.add_argument("--workers", type=int, default=8)
+    schedule_parser.add_argument("--quota", type=int, default=600, help="Simulated requests per minute")
+
+    cache_parser = sub.add_parser("cache", help="Cold vs warm embedding cache")
+    cache_parser.add_argument("--chunks", type=int, default=1000)
+
+    search_parser = sub.add_parser("search", help="Local vector store query latency")
+    search_parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    search_parser.add_argument("--dim", type=int, default=768)
+
+    ann_parser = sub.add_parser("ann", help="IVF recall vs latency against exact search")
+    ann_parser.add_argument("--size", type=int, default=100_000)
+    ann_parser.add_argument("--nlist", type=int, default=256)
+
+    compress_parser = sub.add_parser("compress", help="float32 vs int8 vs PQ storage")
+    compress_parser.add_argument("--size", type=int, default=100_000)
+
+    ingest_parser = sub.add_parser("ingest", help="Load-everything vs streaming ingestion")
+    ingest_parser.add_argument("--pages", type=int, default=500)
+
+    pdf_parser = sub.add_parser("pdf", help="Sequential vs parallel PDF text extraction")
+    pdf_parser.add_argument("--copies", type=int, default=20)
+    pdf_parser.add_argument("--workers", type=int, default=None)
+
+    e2e_parser = sub.add_parser("e2e", help="Offline end-to-end ingestion and query benchmark")
+    e2e_parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200], help="Document sizes in pages")
+    e2e_parser.add_argument("--queries", type=int, default=50)
+    e2e_parser.add_argument("--embed-latency", type=float, default=0.05, help="Simulated seconds per embedding request")
+    e2e_parser.add_argument("--llm-latency", type=float, default=0.3, help="Simulated seconds to first token")
+
+    startup_parser = sub.add_parser("startup", help="Import-time profile of the entry points")
+    startup_parser.add_argument("--modules", nargs="+", default=["QueryProcessor", "dataprocessor", "server"])
+
+    chunk_parser = sub.add_parser("chunk", help="Recursive vs sentence chunking of the bundled paper's text")
+    chunk_parser.add_argument("--copies", type=int, default=100)
+
+    upsert_parser = sub.add_parser("upsert", help="Sequential vs concurrent upserts against a mock Pinecone server")
+    upsert_parser.add_argument("--chunks", type=int, default=2000)
+    upsert_parser.add_argument("--latency", type=float, default=0.05, help="Simulated seconds per upsert request")
+    upsert_parser.add_argument("--fail-every", type=int, default=10, help="Answer every n-th request with a 503")
+
+    args = parser.parse_args()
+    if args.command == "embed":
+        bench_embedding(args.chunks, latency_per_call=args.latency)
+    elif args.command == "schedule":
+        bench_scheduler(args.chunks, quota_per_minute=args.quota, max_workers=args.workers)
+    elif args.command == "cache":
+        bench_cache(args.chunks)
+    elif args.command == "search":
+        bench_search(args.sizes, dim=args.dim)
+    elif args.command == "ann":
+        bench_ann(args.size, nlist=args.nlist)
+    elif args.command == "compress":
+        bench_compression(args.size)
+    elif args.command == "ingest":
+        bench_ingest(args.pages)
+    elif args.command == "pdf":
+        bench_pdf(args.copies, args.workers)
+    elif args.command == "e2e":
+        bench_end_to_end(args.sizes, args.queries, embed_latency=args.embed_latency, llm_first_token=args.llm_latency)
+    elif args.command == "startup":
+        bench_startup(args.modules)
+    elif args.command == "chunk":
+        bench_chunking(args.copies)
+    elif args.command == "upsert":
+        bench_upsert(args.chunks, latency=args.latency, fail_every=args.fail_every)
@@ -0,0 +1,188 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from typing import List, Optional
+
+BM25_INDEX_PATH = os.getenv("BM25_INDEX_PATH", ".cache/bm25.sqlite")
+
+TOKEN_PATTERN = re.compile(r"\w+")
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were what which with".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [token for token in TOKEN_PATTERN.findall(text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Local inverted index for keyword (BM25) retrieval, kept next to the vector store.
+
+    Postings and per-chunk lengths live in SQLite, per namespace, so chunks can be
+    added and deleted incrementally as documents are re-indexed.
+
+    :param path: SQLite file to use; parent directories are created.
+    :param k1: BM25 term-frequency saturation.
+    :param b: BM25 length normalization.
+    """
+
+    def __init__(self, path: str, k1: float = 1.2, b: float = 0.75):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS chunks (
+                namespace TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                document_id TEXT,
+                length INTEGER NOT NULL,
+                text TEXT NOT NULL,
+                PRIMARY KEY (namespace, chunk_id)
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                namespace TEXT NOT NULL,
+                term TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                tf INTEGER NOT NULL,
+                PRIMARY KEY (namespace, term, chunk_id)
+            );
+            CREATE INDEX IF NOT EXISTS idx_postings_chunk ON postings(namespace, chunk_id);
+            CREATE TABLE IF NOT EXISTS stats (
+                namespace TEXT PRIMARY KEY,
+                chunk_count INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            );
+            """
+        )
+        self.conn.commit()
+
+    def _adjust_stats(self, namespace: str, chunk_delta: int, length_delta: int) -> None:
+        self.conn.execute(
+            "INSERT INTO stats (namespace, chunk_count, total_length) VALUES (?, 0, 0) ON CONFLICT(namespace) DO NOTHING",
+            (namespace,),
+        )
+        self.conn.execute(
+            "UPDATE stats SET chunk_count = chunk_count + ?, total_length = total_length + ? WHERE namespace = ?",
+            (chunk_delta, length_delta, namespace),
+        )
+
+    def _delete_locked(self, namespace: str, chunk_ids: List[str]) -> None:
+        for chunk_id in chunk_ids:
+            row = self.conn.execute(
+                "SELECT length FROM chunks WHERE namespace = ? AND chunk_id = ?", (namespace, chunk_id)
+            ).fetchone()
+            if row is None:
+                continue
+            self.conn.execute("DELETE FROM chunks WHERE namespace = ? AND chunk_id = ?", (namespace, chunk_id))
+            self.conn.execute("DELETE FROM postings WHERE namespace = ? AND chunk_id = ?", (namespace, chunk_id))
+            self._adjust_stats(namespace, -1, -row[0])
+
+    def add(self, chunk_ids: List[str], texts: List[str], namespace: str = "",
+            document_ids: Optional[List[Optional[str]]] = None) -> None:
+        """
+        Indexes (or re-indexes) chunks under their ids.
+        """
+        document_ids = document_ids or [None] * len(chunk_ids)
+        with self.lock:
+            self._delete_locked(namespace, chunk_ids)
+            total_length = 0
+            for chunk_id, text, document_id in zip(chunk_ids, texts, document_ids):
+                terms = Counter(tokenize(text))
+                length = sum(terms.values())
+                total_length += length
+                self.conn.execute(
+                    "INSERT INTO chunks (namespace, chunk_id, document_id, length, text) VALUES (?, ?, ?, ?, ?)",
+                    (namespace, chunk_id, document_id, length, text),
+                )
+                self.conn.executemany(
+                    "INSERT INTO postings (namespace, term, chunk_id, tf) VALUES (?, ?, ?, ?)",
+                    [(namespace, term, chunk_id, tf) for term, tf in terms.items()],
+                )
+            self._adjust_stats(namespace, len(chunk_ids), total_length)
+            self.conn.commit()
+
+    def delete(self, chunk_ids: List[str], namespace: str = "") -> None:
+        with self.lock:
+            self._delete_locked(namespace, chunk_ids)
+            self.conn.commit()
+
+    def search(self, query: str, top_k: int = 10, namespace: str = "",
+               document_ids: Optional[List[str]] = None) -> List[dict]:
+        """
+        Best chunks for the query by BM25, as {"id", "score", "metadata": {"text", "document_id"}}.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self.lock:
+            stats = self.conn.execute(
+                "SELECT chunk_count, total_length FROM stats WHERE namespace = ?", (namespace,)
+            ).fetchone()
+            if stats is None or stats[0] == 0:
+                return []
+            chunk_count, total_length = stats
+            average_length = total_length / chunk_count
+
+            term_placeholders = ",".join("?" * len(terms))
+            sql = (
+                "SELECT p.term, p.chunk_id, p.tf, c.length FROM postings p "
+                "JOIN chunks c ON c.namespace = p.namespace AND c.chunk_id = p.chunk_id "
+                f"WHERE p.namespace = ? AND p.term IN ({term_placeholders})"
+            )
+            params = [namespace, *terms]
+            if document_ids:
+                sql += f" AND c.document_id IN ({','.join('?' * len(document_ids))})"
+                params += list(document_ids)
+            postings = self.conn.execute(sql, params).fetchall()
+
+        document_frequency = Counter(term for term, _, _, _ in postings)
+        scores = Counter()
+        for term, chunk_id, tf, length in postings:
+            idf = math.log(1 + (chunk_count - document_frequency[term] + 0.5) / (document_frequency[term] + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * length / average_length)
+            scores[chunk_id] += idf * tf * (self.k1 + 1) / norm
+
+        best = scores.most_common(top_k)
+        if not best:
+            return []
+        with self.lock:
+            rows = self.conn.execute(
+                f"SELECT chunk_id, text, document_id FROM chunks WHERE namespace = ? "
+                f"AND chunk_id IN ({','.join('?' * len(best))})",
+                [namespace, *(chunk_id for chunk_id, _ in best)],
+            ).fetchall()
+        texts = {chunk_id: (text, document_id) for chunk_id, text, document_id in rows}
+        return [
+            {"id": chunk_id, "score": score,
+             "metadata": {"text": texts[chunk_id][0], "document_id": texts[chunk_id][1]}}
+            for chunk_id, score in best
+        ]
+
+
+_index: Optional[BM25Index] = None
+
+
+def get_bm25_index() -> BM25Index:
+    """
+    Returns the shared BM25 index, opening it on first use.
+    """
+    global _index
+    if _index is None:
+        _index = BM25Index(BM25_INDEX_PATH)
+    return _index
+
+
+def set_bm25_index(index: BM25Index) -> None:
+    global _index
+    _index = index
@@ -1,5 +1,36 @@
-from typing import List
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+import os
+import string
+from bisect import bisect_left
+from typing import Iterable, Iterator, List, Tuple
+
+import numpy as np
+
+from context_packer import estimate_tokens
+
+# "sentence" (native, token-sized, with page metadata) or "recursive" (LangChain, character-sized)
+CHUNKER = os.getenv("CHUNKER", "sentence").lower()
+# ~700 characters of English prose, the size of the character-based chunks
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", "200"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "24"))
+
+# Pages are analysed in blocks of about this many characters (a few dozen pages)
+CHUNK_BLOCK_CHARS = 200_000
+# Joins the pages of a block; being a blank line, it also ends the last sentence of each page
+PAGE_SEPARATOR = "\n\n"
+
+# Character classes, indexed by min(code point, 128): anything beyond ASCII counts as a
+# word character, as most of it is (accented letters, CJK). Ordered so that symbols and
+# whitespace are each a range of values
+_OTHER, _SENTENCE_END, _WORD, _SPACE, _NEWLINE = range(5)
+_CHAR_CLASS = np.full(129, _OTHER, dtype=np.uint8)
+_CHAR_CLASS[[ord(c) for c in string.ascii_letters + string.digits + "_"]] = _WORD
+_CHAR_CLASS[128] = _WORD
+_CHAR_CLASS[[ord(c) for c in string.whitespace]] = _SPACE
+_CHAR_CLASS[[ord(c) for c in ".!?"]] = _SENTENCE_END
+_CHAR_CLASS[ord("\n")] = _NEWLINE
+# The same table for bytes.translate, which classifies ASCII text without a per-character array pass
+_ASCII_CLASSES = _CHAR_CLASS[np.minimum(np.arange(256), 128)].tobytes()
+
 
 def chunk_pages(pages: List[str], chunk_size: int = 700, overlap: int = 80) -> List[str]:
     """
@@ -10,6 +41,9 @@ def chunk_pages(pages: List[str], chunk_size: int = 700, overlap: int = 80) -> L
     :param overlap: The number of overlapping characters between chunks (default 80).
     :return: List of chunked strings.
     """
+    # Imported here: langchain takes ~0.3s to import and is only needed when ingesting
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
     text_splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size,
         chunk_overlap=overlap,
@@ -19,3 +53,319 @@ def chunk_pages(pages: List[str], chunk_size: int = 700, overlap: int = 80) -> L
     full_text = "".join(pages)
     chunks = text_splitter.split_text(full_text)
     return chunks
+
+
+def iter_chunks(pages: Iterable[str], chunk_size: int = 700, overlap: int = 80,
+                buffer_chunks: int = 10) -> Iterator[str]:
+    """
+    Streaming version of chunk_pages: pages are appended to a buffer that is split
+    once it holds about `buffer_chunks` chunks. Every chunk but the last is emitted;
+    the last one is kept as the start of the next buffer, so chunks and their overlap
+    come out close to splitting the joined text in one go, while memory stays bounded.
+
+    :param pages: Iterable of page texts, e.g. pdfreader.iter_pages(path).
+    :param chunk_size: The maximum size of each chunk (default 700).
+    :param overlap: The number of overlapping characters between chunks (default 80).
+    :param buffer_chunks: How many chunks' worth of text to buffer before splitting.
+    :return: Iterator over chunked strings.
+    """
+    # Imported here: langchain takes ~0.3s to import and is only needed when ingesting
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=overlap,
+        length_function=len
+    )
+
+    buffer = ""
+    for page in pages:
+        buffer += page or ""
+        if len(buffer) < buffer_chunks * chunk_size:
+            continue
+        chunks = text_splitter.split_text(buffer)
+        if len(chunks) > 1:
+            yield from chunks[:-1]
+            # The kept chunk's start is where the next split begins
+            buffer = buffer[buffer.rindex(chunks[-1]):]
+
+    if buffer:
+        yield from text_splitter.split_text(buffer)
+
+
+class _TokenCounts:
+    """
+    Estimated token counts of the spans of a text, as context_packer.estimate_tokens
+    counts them: a word run is one token per 4 characters, any other non-space character
+    one token. Valid for spans that start and end at word or whitespace boundaries.
+    """
+
+    def __init__(self, word_runs: np.ndarray, symbols: np.ndarray):
+        # Word runs by end offset with their cumulative tokens, and symbol offsets; both are
+        # sorted, so counting up to an offset is a binary search in each
+        run_starts, self.run_ends = word_runs[0::2], word_runs[1::2]
+        self.run_prefix = np.zeros(len(self.run_ends) + 1, dtype=np.int64)
+        np.cumsum((self.run_ends - run_starts + 3) // 4, out=self.run_prefix[1:])
+        self.symbols = symbols
+
+    def before(self, offsets):
+        # Tokens of the items ending at or before each offset
+        return (self.run_prefix[np.searchsorted(self.run_ends, offsets, side="right")]
+                + np.searchsorted(self.symbols, offsets))
+
+    def between(self, starts, ends):
+        return self.before(ends) - self.before(starts)
+
+
+def _classify(text: str) -> np.ndarray:
+    if text.isascii():
+        return np.frombuffer(text.encode("ascii").translate(_ASCII_CLASSES), dtype=np.uint8)
+    # "clip" maps every code point past the table to its last entry, a word character
+    return _CHAR_CLASS.take(np.frombuffer(text.encode("utf-32-le"), dtype=np.uint32), mode="clip")
+
+
+def _step_over_spaces(classes: np.ndarray, positions: np.ndarray, limits: np.ndarray, direction: int,
+                      steps: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+    # Moves each position over the whitespace after it (before it for a direction of -1), up
+    # to its limit and at most `steps` characters; also returns the indices of the positions
+    # that had further to go
+    positions = positions.copy()
+    ahead = 0 if direction > 0 else -1
+    moving = np.arange(len(positions))
+    for step in range(steps + 1):
+        at = positions[moving]
+        moving = moving[(at != limits[moving]) & (classes[np.minimum(at + ahead, len(classes) - 1)] >= _SPACE)]
+        if not len(moving) or step == steps:
+            break
+        positions[moving] += direction
+    return positions, moving
+
+
+def sentence_spans(text: str) -> Tuple[np.ndarray, np.ndarray, _TokenCounts]:
+    """
+    Start and end offsets of the sentences of `text` (without surrounding whitespace), and
+    its token counts. A sentence ends at ., ! or ? followed by whitespace, or at a blank line.
+
+    Only classifying characters is done per character (with NumPy); everything after works
+    on the positions of boundaries, words and symbols.
+    """
+    classes = _classify(text)
+    length = len(classes)
+    # Non-space characters are word runs and symbols, so they are found (and counted)
+    # from those two sorted arrays rather than from a per-character one
+    word = classes == _WORD
+    # Offsets where a word run starts or ends, in turn
+    word_runs = np.flatnonzero(word[1:] != word[:-1]) + 1
+    if length and word[0]:
+        word_runs = np.concatenate([[0], word_runs])
+    if len(word_runs) % 2:
+        word_runs = np.append(word_runs, length)
+    # Contiguous copies: searchsorted copies strided arrays on every call
+    run_starts, run_ends = word_runs[0::2].copy(), word_runs[1::2].copy()
+    symbols = np.flatnonzero(classes <= _SENTENCE_END)
+
+    # Cut points: just after sentence-ending punctuation followed by whitespace ...
+    ends_sentence = symbols[classes[symbols] == _SENTENCE_END]
+    followed_by = classes[np.minimum(ends_sentence + 1, length - 1)]
+    ends_sentence = ends_sentence[(ends_sentence + 1 == length) | (followed_by >= _SPACE)]
+    # ... and at a newline with only whitespace between it and the next newline
+    newlines = np.flatnonzero(classes == _NEWLINE)
+    line_ends, next_line_ends = newlines[:-1], newlines[1:]
+    following = classes[line_ends + 1]
+    blank = line_ends[following == _NEWLINE]
+    # A line of spaces is blank too; only those few lines need counting the items on them
+    spaced = following == _SPACE
+    if spaced.any():
+        line_ends, next_line_ends = line_ends[spaced], next_line_ends[spaced]
+        items_on_line = (np.searchsorted(run_starts, next_line_ends) - np.searchsorted(run_starts, line_ends)
+                         + np.searchsorted(symbols, next_line_ends) - np.searchsorted(symbols, line_ends))
+        blank = np.concatenate([blank, line_ends[items_on_line == 0]])
+    cuts = np.sort(np.concatenate([[0], ends_sentence + 1, blank, [length]]))
+    # Deduplicated by hand: np.unique is several times slower on these small arrays
+    cuts = cuts[np.concatenate([[True], cuts[1:] != cuts[:-1]])]
+
+    # Trim whitespace: a sentence runs from the first non-space at or after a cut to the
+    # last one before the next cut. Cuts are mostly a space or two from the text, so that
+    # whitespace is stepped over; the few longer runs of it are skipped with a binary search
+    first, pending = _step_over_spaces(classes, cuts[:-1], cuts[1:], 1)
+    if len(pending):
+        at = first[pending]
+        first[pending] = np.minimum(np.append(run_starts, length)[np.searchsorted(run_starts, at)],
+                                    np.append(symbols, length)[np.searchsorted(symbols, at)])
+    last, pending = _step_over_spaces(classes, cuts[1:], cuts[:-1], -1)
+    if len(pending):
+        at = last[pending]
+        last[pending] = np.maximum(np.concatenate([[0], run_ends])[np.searchsorted(run_ends, at, side="right")],
+                                   np.concatenate([[0], symbols + 1])[np.searchsorted(symbols, at)])
+    keep = first < last
+    starts, ends = first[keep], last[keep]
+
+    return starts, ends, _TokenCounts(word_runs, symbols)
+
+
+def _split_long_sentences(text: str, starts: np.ndarray, ends: np.ndarray, tokens: np.ndarray,
+                          counts: _TokenCounts, max_tokens: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    # "Sentences" longer than a chunk (tables, reference lists) are cut at whitespace. They
+    # are classified together, joined by spaces, and their words found in the joined text
+    long = np.flatnonzero(tokens > max_tokens)
+    long_starts, long_ends = starts[long], ends[long]
+    # Where each sentence starts in the joined text
+    joined_starts = np.zeros(len(long), dtype=np.int64)
+    np.cumsum(long_ends[:-1] - long_starts[:-1] + 1, out=joined_starts[1:])
+    spaces = _classify(" ".join([text[start:end] for start, end in zip(long_starts.tolist(), long_ends.tolist())])) >= _SPACE
+    # Sentences start and end with a word, so word starts and ends come in turn
+    bounds = np.concatenate([[0], np.flatnonzero(spaces[1:] != spaces[:-1]) + 1, [len(spaces)]])
+    sentence = np.searchsorted(joined_starts, bounds[0::2], side="right") - 1
+    shift = long_starts[sentence] - joined_starts[sentence]
+    word_starts, word_ends = bounds[0::2] + shift, bounds[1::2] + shift
+    word_tokens = counts.between(word_starts, word_ends)
+    if (word_tokens > max_tokens).any():
+        # A "word" longer than a chunk (a rule of ====, text extracted without spaces) is
+        # cut every max_tokens characters; no character counts for more than one token
+        items = []
+        for item in zip(word_starts.tolist(), word_ends.tolist(), word_tokens.tolist(), sentence.tolist()):
+            word_start, word_end, count, index = item
+            if count <= max_tokens:
+                items.append(item)
+                continue
+            for cut in range(word_start, word_end, max_tokens):
+                piece_end = min(cut + max_tokens, word_end)
+                items.append((cut, piece_end, estimate_tokens(text[cut:piece_end]), index))
+        word_starts, word_ends, word_tokens, sentence = (np.array(values, dtype=np.int64) for values in zip(*items))
+
+    # Greedy packing: each piece takes the most following words of its sentence that fit,
+    # and at least one
+    cumulative = np.zeros(len(word_tokens) + 1, dtype=np.int64)
+    np.cumsum(word_tokens, out=cumulative[1:])
+    reach = (np.searchsorted(cumulative, cumulative + max_tokens, side="right") - 1).tolist()
+    sentence_end = np.searchsorted(sentence, np.arange(len(long)), side="right").tolist()
+    piece_firsts, piece_lasts = [], []
+    first = 0
+    for end in sentence_end:
+        while first < end:
+            last = min(max(reach[first], first + 1), end)
+            piece_firsts.append(first)
+            piece_lasts.append(last)
+            first = last
+    piece_firsts, piece_lasts = np.array(piece_firsts), np.array(piece_lasts)
+
+    # The pieces replace their sentences
+    keep = np.ones(len(starts), dtype=bool)
+    keep[long] = False
+    order = np.argsort(np.concatenate([starts[keep], word_starts[piece_firsts]]), kind="stable")
+    return (np.concatenate([starts[keep], word_starts[piece_firsts]])[order],
+            np.concatenate([ends[keep], word_ends[piece_lasts - 1]])[order],
+            np.concatenate([tokens[keep], cumulative[piece_lasts] - cumulative[piece_firsts]])[order])
+
+
+def iter_sentence_chunks(pages: Iterable[str], max_tokens: int = CHUNK_TOKENS,
+                         overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                         block_chars: int = CHUNK_BLOCK_CHARS) -> Iterator[dict]:
+    """
+    Native streaming chunker: whole sentences are packed into chunks of at most `max_tokens`
+    (as estimated by context_packer.estimate_tokens), and the last sentences of a chunk, up
+    to `overlap_tokens`, are repeated at the start of the next one.
+
+    Pages are never glued together, so no words are merged across page breaks, and each
+    chunk records where it comes from for citations. Pages are analysed a block at a time
+    with NumPy, and where a chunk starting at each sentence would end is found for all
+    sentences at once, so the Python work is per chunk rather than per character or sentence.
+    Whitespace-free runs longer than a chunk are cut every `max_tokens` characters.
+
+    :param pages: Iterable of page texts, e.g. pdfreader.iter_pages(path).
+    :param max_tokens: Maximum estimated tokens per chunk.
+    :param overlap_tokens: Maximum estimated tokens repeated between consecutive chunks.
+    :param block_chars: Characters of pages buffered before analysing them.
+    :return: Iterator over {"text", "page", "start", "end_page", "end"}: 1-based first and
+        last page, and character offsets of the chunk in those pages' text.
+    """
+    block: List[str] = []
+    block_size = 0
+    first_page = 1  # page number of block[0]
+    # Where the current window starts and where its not yet emitted sentences start,
+    # as (index in block, offset in that page); None means at the start of the block
+    window_at = fresh_at = None
+
+    def process(final: bool):
+        nonlocal block, first_page, window_at, fresh_at
+        text = PAGE_SEPARATOR.join(block)
+        page_starts = [0]
+        for page in block[:-1]:
+            page_starts.append(page_starts[-1] + len(page) + len(PAGE_SEPARATOR))
+
+        starts, ends, counts = sentence_spans(text)
+        tokens = counts.between(starts, ends)
+        if (tokens > max_tokens).any():
+            starts, ends, tokens = _split_long_sentences(text, starts, ends, tokens, counts, max_tokens)
+        count = len(starts)
+        cumulative = np.zeros(count + 1, dtype=np.int64)
+        np.cumsum(tokens, out=cumulative[1:])
+        # For every sentence: where the longest run of sentences starting there that fits in
+        # a chunk ends, and where the overlap repeated after a chunk ending there starts
+        reach = (np.searchsorted(cumulative, cumulative + max_tokens, side="right") - 1).tolist()
+        overlap_from = np.searchsorted(cumulative, cumulative - overlap_tokens).tolist()
+        # Page (index in block) and offset in that page of every sentence's start and end
+        start_pages = np.searchsorted(page_starts, starts, side="right") - 1
+        end_pages = np.searchsorted(page_starts, ends, side="right") - 1
+        start_offsets = (starts - np.array(page_starts)[start_pages]).tolist()
+        end_offsets = (ends - np.array(page_starts)[end_pages]).tolist()
+        starts, ends, start_pages, end_pages = starts.tolist(), ends.tolist(), start_pages.tolist(), end_pages.tolist()
+
+        def sentence_at(position):
+            return 0 if position is None else bisect_left(starts, page_starts[position[0]] + position[1])
+
+        window, fresh = sentence_at(window_at), sentence_at(fresh_at)
+        while fresh < count:
+            end = reach[window]
+            if end <= fresh:
+                if window < fresh:
+                    # Not even one new sentence fits after the overlap: drop the overlap
+                    window = fresh
+                    continue
+                # Cannot happen once long sentences are split, but never stall on one
+                end = fresh + 1
+            elif end == count and not final:
+                break
+            last = end - 1
+            # Replacing line breaks keeps the length, so offsets match the page text
+            yield {"text": text[starts[window]:ends[last]].replace("\n", " "),
+                   "page": first_page + start_pages[window], "start": start_offsets[window],
+                   "end_page": first_page + end_pages[last], "end": end_offsets[last]}
+            # The next window repeats the trailing sentences that fit in the overlap,
+            # and always moves forward
+            next_window = overlap_from[end]
+            window = next_window if next_window > window else window + 1
+            fresh = end
+
+        if final:
+            return
+        # Keep the pages from the window start on for the next block
+        end_of_block = (len(block) - 1, len(block[-1]))
+        window_at = (start_pages[window], start_offsets[window]) if window < count else end_of_block
+        fresh_at = (start_pages[fresh], start_offsets[fresh]) if fresh < count else end_of_block
+        kept = window_at[0]
+        first_page += kept
+        block = block[kept:]
+        window_at = (0, window_at[1])
+        fresh_at = (fresh_at[0] - kept, fresh_at[1])
+
+    for page in pages:
+        block.append(page or "")
+        block_size += len(page or "")
+        if block_size >= block_chars:
+            yield from process(final=False)
+            block_size = sum(len(page) for page in block)
+    if block:
+        yield from process(final=True)
+
+
+def iter_document_chunks(pages: Iterable[str], chunker: str = CHUNKER) -> Iterator[dict]:
+    """
+    Chunks a document with the configured chunker, as {"text", ...metadata} dicts
+    (the "recursive" chunker has no page metadata).
+    """
+    if chunker == "recursive":
+        for chunk in iter_chunks(pages):
+            yield {"text": chunk}
+    else:
+        yield from iter_sentence_chunks(pages)
@@ -0,0 +1,60 @@
+import os
+import threading
+from dotenv import load_dotenv
+
+# Configuration comes from the environment / .env file; reading it is cheap, so it happens
+# once when this module is first imported. Clients are only created when first used.
+load_dotenv()
+
+# Connections kept open to Pinecone and shared by all threads
+PINECONE_POOL_SIZE = int(os.getenv("PINECONE_POOL_SIZE", "8"))
+
+_lock = threading.Lock()
+_genai = None
+_models = {}
+_pinecone_indexes = {}
+
+
+def get_genai():
+    """
+    Returns the google.generativeai module, configured with GEMINI_API_KEY.
+
+    The SDK takes most of a second to import, so it is imported and configured on
+    first use instead of when the RAG modules are imported.
+    """
+    global _genai
+    if _genai is None:
+        with _lock:
+            if _genai is None:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+                _genai = genai
+    return _genai
+
+
+def get_generative_model(name: str):
+    """
+    Shared GenerativeModel per model name.
+    """
+    if name not in _models:
+        genai = get_genai()
+        with _lock:
+            if name not in _models:
+                _models[name] = genai.GenerativeModel(name)
+    return _models[name]
+
+
+def get_pinecone_index(name: str = None):
+    """
+    Shared Pinecone index handle (PINECONE_INDEX_NAME by default), whose connection
+    pool is reused by every upsert, delete and query.
+    """
+    name = name or os.getenv("PINECONE_INDEX_NAME")
+    if name not in _pinecone_indexes:
+        with _lock:
+            if name not in _pinecone_indexes:
+                from pinecone import Pinecone
+                client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"), connection_pool_maxsize=PINECONE_POOL_SIZE)
+                # PINECONE_INDEX_HOST skips the host lookup, or points at a local mock server
+                _pinecone_indexes[name] = client.Index(name=name, host=os.getenv("PINECONE_INDEX_HOST") or "")
+    return _pinecone_indexes[name]
@@ -0,0 +1,77 @@
+import os
+import re
+from typing import List
+
+# Prompt budget for retrieved context, in (estimated) tokens
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "800"))
+# Retrieved chunks offered to the packer; it keeps as many as fit the budget
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "6"))
+
+# Words are split into pieces of at most 4 characters and punctuation counts on its own,
+# which tracks subword tokenizers closely enough for budgeting at a fraction of the cost
+TOKEN_PATTERN = re.compile(r"\w{1,4}|[^\w\s]")
+# Chunks share up to CHUNK_OVERLAP_TOKENS (24) tokens of whole sentences with their
+# neighbours, at most ~120 characters (80 with the recursive chunker), see chunker.py
+MAX_OVERLAP = 120
+MIN_OVERLAP = 20
+
+
+def estimate_tokens(text: str) -> int:
+    return len(TOKEN_PATTERN.findall(text))
+
+
+def _overlap(left: str, right: str) -> int:
+    """
+    Length of the longest suffix of `left` that is also a prefix of `right`
+    (0 if shorter than MIN_OVERLAP).
+    """
+    for size in range(min(MAX_OVERLAP, len(left), len(right)), MIN_OVERLAP - 1, -1):
+        if left.endswith(right[:size]):
+            return size
+    return 0
+
+
+def remove_overlap(text: str, packed: List[str]) -> str:
+    """
+    Strips the parts of `text` already present in the packed chunks: the whole text if
+    it is contained in one, otherwise a head or tail shared with a neighbouring chunk.
+    """
+    for other in packed:
+        if text in other:
+            return ""
+    for other in packed:
+        head = _overlap(other, text)
+        if head:
+            text = text[head:].lstrip()
+        tail = _overlap(text, other)
+        if tail:
+            text = text[:-tail].rstrip()
+    return text
+
+
+def pack_context(matches: List[dict], token_budget: int = CONTEXT_TOKEN_BUDGET) -> str:
+    """
+    Builds the LLM context from best-first matches: text shared between overlapping
+    chunks is kept once, and whole chunks are added by relevance as long as they fit
+    the token budget, so the best chunk is never cut off to make room for weaker ones.
+
+    :param matches: Retrieved matches, best first, with the chunk in metadata["text"].
+    :param token_budget: Maximum estimated tokens of context.
+    :return: The packed chunks, best first, separated by blank lines.
+    """
+    packed: List[str] = []
+    used = 0
+    for match in matches:
+        text = match.get("metadata", {}).get("text")
+        if not text:
+            continue
+        text = remove_overlap(text, packed)
+        if not text:
+            continue
+        tokens = estimate_tokens(text)
+        # A chunk that does not fit is skipped, a smaller, less relevant one may still fit
+        if used + tokens > token_budget:
+            continue
+        packed.append(text)
+        used += tokens
+    return "\n\n".join(packed)
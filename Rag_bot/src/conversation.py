@@ -0,0 +1,109 @@
+import os
+import re
+import threading
+from collections import deque
+from typing import List, Optional
+
+import numpy as np
+
+# Follow-ups are condensed with at most this many earlier questions of the same topic
+CONVERSATION_TURNS = int(os.getenv("CONVERSATION_TURNS", "3"))
+# Questions this short are taken as follow-ups even without a referring word ("why?"),
+# as long as they name no topic of their own ("What is BLEU?" is a new question)
+FOLLOW_UP_MAX_WORDS = int(os.getenv("FOLLOW_UP_MAX_WORDS", "4"))
+# A follow-up reuses the previous turn's candidates if its vector is at least this similar
+# to the one they were retrieved with
+CANDIDATE_REUSE_THRESHOLD = float(os.getenv("CANDIDATE_REUSE_THRESHOLD", "0.8"))
+
+# Words that only make sense with an earlier question: "explain that more", "why is it faster?"
+REFERRING_WORDS = re.compile(
+    r"\b(it|its|that|this|these|those|they|them|their|he|she|his|her|there|"
+    r"more|further|elaborate|else|above|previous|same|also|again)\b",
+    re.IGNORECASE,
+)
+
+# Words of a short question that do not make it about a topic: "why?", "how so?", "an example please"
+BARE_QUESTION_WORDS = frozenset(
+    "why how what when where who which whom whose is are was were do does did can could would should "
+    "so and or but then really why's how's what's example examples give show explain tell me us an a "
+    "the of for in on please ok okay".split()
+)
+WORDS = re.compile(r"[\w']+")
+
+
+def is_follow_up(query: str) -> bool:
+    if REFERRING_WORDS.search(query) is not None:
+        return True
+    words = WORDS.findall(query.lower())
+    return len(words) <= FOLLOW_UP_MAX_WORDS and all(word in BARE_QUESTION_WORDS for word in words)
+
+
+class ConversationMemory:
+    """
+    Per-session retrieval memory: the recent questions of the current topic, and the
+    candidate matches (with their embeddings) retrieved for the last turn.
+
+    condense() turns a follow-up such as "explain that more" into a standalone query by
+    prefixing the earlier questions, without an LLM call. reusable_candidates() returns the
+    last turn's candidates, re-scored for the new query, when the condensed query is close
+    to the one they were retrieved for, so the follow-up needs no vector search.
+    """
+
+    def __init__(self, turns: int = CONVERSATION_TURNS, reuse_threshold: float = CANDIDATE_REUSE_THRESHOLD):
+        self.reuse_threshold = reuse_threshold
+        self.questions = deque(maxlen=turns)
+        self.candidates: Optional[List[dict]] = None
+        self.candidates_vector: Optional[np.ndarray] = None
+        self.candidates_scope: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def condense(self, query: str) -> str:
+        """
+        Standalone form of `query`, and records it as the latest question.
+        """
+        query = query.strip()
+        with self._lock:
+            if not self.questions or not is_follow_up(query):
+                # A new topic: earlier questions would only pull retrieval off course
+                self.questions.clear()
+            condensed = " ".join([*self.questions, query])
+            self.questions.append(query)
+        return condensed
+
+    def reusable_candidates(self, query_vector: List[float], scope: str) -> Optional[List[dict]]:
+        """
+        The last turn's candidates ordered by similarity to `query_vector`, or None if they
+        were retrieved for another namespace/mode/corpus version or a different question.
+        """
+        with self._lock:
+            if self.candidates is None or scope != self.candidates_scope:
+                return None
+            query = _unit(query_vector)
+            if float(query @ self.candidates_vector) < self.reuse_threshold:
+                return None
+            candidates = self.candidates
+        vectors = np.array([match["values"] for match in candidates], dtype=np.float32)
+        scores = vectors @ query / np.maximum(np.linalg.norm(vectors, axis=1), 1e-12)
+        order = np.argsort(-scores, kind="stable")
+        return [{**candidates[index], "score": float(scores[index])} for index in order.tolist()]
+
+    def remember_candidates(self, query_vector: List[float], scope: str, candidates: List[dict]) -> None:
+        """
+        Keeps freshly retrieved candidates for the next turn. Only matches that carry
+        their embedding ("values") can be re-scored later, so the others are dropped.
+        """
+        candidates = [match for match in candidates if match.get("values") is not None]
+        with self._lock:
+            self.candidates = candidates or None
+            self.candidates_vector = _unit(query_vector)
+            self.candidates_scope = scope
+
+    def clear(self) -> None:
+        with self._lock:
+            self.questions.clear()
+            self.candidates = self.candidates_vector = self.candidates_scope = None
+
+
+def _unit(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype=np.float32)
+    return vector / (np.linalg.norm(vector) or 1.0)
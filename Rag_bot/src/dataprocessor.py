@@ -1,24 +1,60 @@
-from pdfreader import read_pdf
-from chunker import chunk_pages
-from embedder import embed_chunks
-from vectorstore import store_in_pinecone
-from typing import List
+import clients  # noqa: F401 - loads .env before any module reads its settings
+import os
+from typing import Callable, Iterable, List, Optional
+
+from bm25 import get_bm25_index
+from manifest import content_sha256, document_id_for, load_manifest, save_manifest
+from pdfreader import PdfSource, is_path, iter_pages_parallel
+from pipeline import ingest_stream
+from vectorstore import delete_from_pinecone
 
 pdf_path ="resources/Attention is all u need new.pdf"
-def run(pdf_path="resources/Attention is all u need new.pdf"):
-    # Read HR Policy PDF and extract text
-    pages = read_pdf(pdf_path)
+def run(pdf_path: PdfSource = "resources/Attention is all u need new.pdf", document_name: Optional[str] = None, namespace: str = "",
+        on_progress: Optional[Callable[[dict], None]] = None, on_stored: Optional[Callable[[List[str]], None]] = None,
+        stored_ids: Iterable[str] = ()):
+    """
+    Indexes a PDF incrementally: chunks already in the store (per the document's
+    manifest) are not embedded again, and chunks that disappeared are deleted.
+
+    :param pdf_path: Path to the PDF file, or the PDF itself as bytes, a memoryview or a
+        binary file object (e.g. an upload), which is parsed without a temporary file.
+    :param document_name: Name identifying the document across uploads (defaults to the file name).
+    :param namespace: Vector store namespace.
+    :param on_progress: Passed to pipeline.ingest_stream, called after every upserted batch.
+    :param on_stored: Passed to pipeline.ingest_stream, called with the ids of every upserted batch.
+    :param stored_ids: Chunk ids an interrupted run of this document already upserted; they
+        are not embedded again.
+    :return: Ingestion counters, plus "deleted" and "unchanged_document".
+    """
+    if not document_name:
+        name = pdf_path if is_path(pdf_path) else getattr(pdf_path, "name", None)
+        if not isinstance(name, (str, os.PathLike)):
+            raise ValueError("document_name is required when the PDF is not given as a file")
+        document_name = os.path.basename(name)
+    document_id = document_id_for(document_name)
+    # Hashed before any parsing, so re-uploading an unchanged document costs one pass over its bytes
+    content_hash = content_sha256(pdf_path)
+    manifest = load_manifest(document_id, namespace)
+
+    if manifest is not None and manifest["content_hash"] == content_hash:
+        print(f"{document_name} is unchanged since it was last indexed, skipping.")
+        return {"chunks": len(manifest["chunk_ids"]), "upserted": 0, "deleted": 0, "unchanged_document": True}
+
+    previous_ids = set(manifest["chunk_ids"]) if manifest is not None else set()
+
+    # Extract pages in worker processes, chunk, embed and store each batch as soon as it is ready,
+    # so memory stays flat and early chunks are searchable while the rest is processing
+    result = ingest_stream(iter_pages_parallel(pdf_path), namespace=namespace,
+                           document_id=document_id, skip_ids=previous_ids | set(stored_ids),
+                           on_progress=on_progress, on_stored=on_stored)
 
-    # Chunk the data into smaller pieces
-    chunks = chunk_pages(pages)
+    vanished = (previous_ids | set(stored_ids)) - set(result["chunk_ids"])
+    delete_from_pinecone(sorted(vanished), namespace=namespace)
+    get_bm25_index().delete(sorted(vanished), namespace=namespace)
+    save_manifest(document_id, document_name, content_hash, result["chunk_ids"], namespace)
 
-    # # Embed the chunks using OpenAI's embedding model to create vector representations
-    embedded_chunks = embed_chunks(chunks)
+    result.pop("chunk_ids")
+    return {**result, "deleted": len(vanished), "unchanged_document": False}
 
-    # # Store the chunks and their embeddings in Pinecone vector database
-    store_in_pinecone(chunks, embedded_chunks)
-    # print(len(embedded_chunks))
-    # print(embedded_chunks[0])
-    
 if __name__ == "__main__":
-    run()
\ No newline at end of file
+    run()
@@ -0,0 +1,127 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List
+
+from embedder import EMBED_BATCH_SIZE, embed_batch, embed_with_cache
+from retry import TokenBucket, call_with_retry
+
+# Keep a little under the provider quota so bursts never trip it
+EMBED_REQUESTS_PER_MINUTE = float(os.getenv("EMBED_REQUESTS_PER_MINUTE", "1400"))
+EMBED_MAX_WORKERS = int(os.getenv("EMBED_MAX_WORKERS", "8"))
+
+# Shared by every ingest in this process, since the quota is per API key
+_limiter = TokenBucket(rate=EMBED_REQUESTS_PER_MINUTE / 60, capacity=1)
+
+
+def set_rate_limit(requests_per_minute: float) -> None:
+    global _limiter
+    _limiter = TokenBucket(rate=requests_per_minute / 60, capacity=1)
+
+
+def embed_batch_limited(batch: List[str], model: str) -> List[List[float]]:
+    """
+    Embeds one batch through the shared rate limiter, retrying on 429s. Every request
+    takes a token, including those embed_batch sends for the halves of a rejected batch.
+    """
+    return call_with_retry(lambda: embed_batch(batch, model, acquire=lambda: _limiter.acquire()), max_retries=5)
+
+
+def embed_chunks_concurrent(chunks: List[str], model: str = "models/text-embedding-004",
+                            batch_size: int = EMBED_BATCH_SIZE,
+                            max_workers: int = EMBED_MAX_WORKERS) -> List[List[float]]:
+    """
+    Same contract as embedder.embed_chunks, but keeps up to `max_workers` batch requests
+    in flight, paced by the shared token bucket and retried with jittered backoff on 429s.
+    Chunks found in the embedding cache are not sent.
+
+    :param chunks: Texts to embed.
+    :param model: Embedding model name.
+    :param batch_size: Texts per request.
+    :param max_workers: Maximum number of concurrent requests.
+    :return: One embedding per chunk, in input order.
+    """
+    if not chunks:
+        return []
+
+    def embed_missing(texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+            results = executor.map(lambda batch: embed_batch_limited(batch, model), batches)
+            return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
+    start = time.perf_counter()
+    embeddings = embed_with_cache(chunks, model, embed_missing)
+    elapsed = time.perf_counter() - start
+
+    print(f"Embedded {len(chunks)} chunks in {elapsed:.2f}s ({len(chunks) / elapsed:.1f} chunks/sec)")
+    return embeddings
+
+
+class QueryBatcher:
+    """
+    Coalesces query embeddings from concurrent requests into batch requests.
+
+    Callers block in `embed` while a background thread collects queries for up to
+    `max_wait` seconds (or `max_batch` queries) and embeds them in one rate-limited
+    request, so a burst of N questions costs about N / max_batch API calls instead of N.
+
+    :param model: Embedding model name.
+    :param max_batch: Maximum number of queries per request.
+    :param max_wait: Seconds to wait for more queries once the first one arrived.
+    """
+
+    def __init__(self, model: str = "models/text-embedding-004", max_batch: int = EMBED_BATCH_SIZE,
+                 max_wait: float = 0.01):
+        self.model = model
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.requests = 0
+        self.batches = 0
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def embed(self, query: str) -> List[float]:
+        return self.submit(query).result()
+
+    def submit(self, query: str) -> Future:
+        """
+        Like `embed`, but returns at once with a Future of the embedding (for asyncio
+        callers, through asyncio.wrap_future).
+        """
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        future = Future()
+        self._queue.put((query, future))
+        return future
+
+    def _run(self) -> None:
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            texts = list(dict.fromkeys(query for query, _ in batch))
+            try:
+                embeddings = embed_with_cache(texts, self.model, lambda missing: embed_batch_limited(missing, self.model))
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.requests += len(batch)
+            self.batches += 1
+            by_text = dict(zip(texts, embeddings))
+            for query, future in batch:
+                future.set_result(by_text[query])
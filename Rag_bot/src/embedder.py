@@ -1,33 +1,174 @@
-import google.generativeai as genai
 import os
-from typing import List
-from dotenv import load_dotenv
+from typing import Callable, List, Optional
+from clients import get_genai
+from embedding_cache import EmbeddingCache
+from retry import call_with_retry
+from tracing import increment, span
 
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+# Gemini accepts up to 100 texts per batchEmbedContents request
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "100"))
 
-def embed_chunks(chunks: List[str], model: str = "models/text-embedding-004") -> List[List[float]]:
+# Set EMBED_CACHE_PATH to an empty string to disable the on-disk cache
+EMBED_CACHE_PATH = os.getenv("EMBED_CACHE_PATH", ".cache/embeddings.sqlite")
+EMBED_CACHE_MAX_ENTRIES = int(os.getenv("EMBED_CACHE_MAX_ENTRIES", "200000"))
+
+# A backend takes (texts, model) and returns one embedding per text, in order
+EmbeddingBackend = Callable[[List[str], str], List[List[float]]]
+
+
+def _gemini_embed_batch(texts: List[str], model: str) -> List[List[float]]:
+    response = get_genai().embed_content(
+        model=model,
+        content=texts
+    )
+    return response["embedding"]
+
+
+def _default_backend() -> EmbeddingBackend:
+    if os.getenv("EMBEDDING_BACKEND", "gemini").lower() == "local":
+        from local_models import HashEmbedder
+        return HashEmbedder()
+    return _gemini_embed_batch
+
+
+_backend: EmbeddingBackend = _default_backend()
+
+
+# Not opened yet; None means disabled
+_UNSET = object()
+_cache = _UNSET
+
+
+def set_embedding_backend(backend: EmbeddingBackend) -> None:
     """
-    Embeds the list of text chunks using Gemini's embedding model.
+    Replaces the function used to embed batches of text (e.g. with a local HashEmbedder).
+    """
+    global _backend
+    _backend = backend
+
+
+def set_embedding_cache(cache: Optional[EmbeddingCache]) -> None:
+    """
+    Replaces the embedding cache; pass None to disable caching.
+    """
+    global _cache
+    _cache = cache
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """
+    Returns the embedding cache (None when disabled), opening it on first use.
     """
+    global _cache
+    if _cache is _UNSET:
+        _cache = EmbeddingCache(EMBED_CACHE_PATH, EMBED_CACHE_MAX_ENTRIES) if EMBED_CACHE_PATH else None
+    return _cache
+
+
+def _cache_model(model: str) -> str:
+    # Keep vectors from stand-in backends apart from real Gemini ones
+    return getattr(_backend, "cache_prefix", "") + model
 
-    embeddings = []
-    for chunk in chunks:
-        response = genai.embed_content(
-            model=model,
-            content=chunk
-        )
-        embedding = response["embedding"]
-        embeddings.append(embedding)
 
+def embed_with_cache(texts: List[str], model: str,
+                     embed_missing: Callable[[List[str]], List[List[float]]]) -> List[List[float]]:
+    """
+    Serves what it can from the embedding cache and calls `embed_missing` once with the
+    remaining texts, storing the new embeddings. The result lines up with `texts`.
+    """
+    cache = get_embedding_cache()
+    if cache is None:
+        return embed_missing(texts)
+
+    cache_model = _cache_model(model)
+    embeddings = cache.get_many(cache_model, texts)
+    missing = [i for i, embedding in enumerate(embeddings) if embedding is None]
+    increment("embedding_cache.hit", len(texts) - len(missing))
+    increment("embedding_cache.miss", len(missing))
+    if missing:
+        missing_texts = [texts[i] for i in missing]
+        new_embeddings = embed_missing(missing_texts)
+        cache.put_many(cache_model, missing_texts, new_embeddings)
+        for i, embedding in zip(missing, new_embeddings):
+            embeddings[i] = embedding
     return embeddings
 
+
+class ChunkRejected(Exception):
+    """
+    The provider rejected a single text (e.g. too long, or content it will not embed);
+    `text` is that text, and the provider's error is the cause.
+    """
+
+    def __init__(self, text: str):
+        super().__init__(f"The embedding request was rejected for this chunk: {text[:80]!r}")
+        self.text = text
+
+
+class _CountMismatch(ValueError):
+    pass
+
+
+def _is_batch_error(error: Exception) -> bool:
+    """
+    True for errors a smaller batch may not hit: the provider rejecting the request's size
+    or content (InvalidArgument, HTTP 400 or 413) or answering with the wrong number of
+    embeddings. Gemini reports an invalid API key as InvalidArgument too, so that is excluded;
+    auth, permission, quota and configuration errors are never split.
+    """
+    if isinstance(error, _CountMismatch):
+        return True
+    status = getattr(error, "code", None) or getattr(error, "status_code", None)
+    invalid = any(cls.__name__ == "InvalidArgument" for cls in type(error).__mro__) or status in (400, 413)
+    return invalid and "API key" not in str(error) and "API_KEY" not in str(error)
+
+
+def embed_batch(batch: List[str], model: str, acquire: Optional[Callable[[], None]] = None) -> List[List[float]]:
+    """
+    Embeds one batch. If the provider rejects the request for its size or content, the
+    batch is split in half and each half retried, down to the single chunk at fault, which
+    raises ChunkRejected. Any other error is re-raised as is, without further requests.
+
+    :param acquire: Called before every request, including those of the split halves,
+        e.g. a rate limiter's acquire.
+    """
+    try:
+        if acquire is not None:
+            acquire()
+        with span("embed.request", size=len(batch)):
+            embeddings = _backend(batch, model)
+        if len(embeddings) != len(batch):
+            raise _CountMismatch(f"Expected {len(batch)} embeddings, got {len(embeddings)}")
+        return embeddings
+    except Exception as e:
+        if not _is_batch_error(e):
+            raise
+        if len(batch) == 1:
+            raise ChunkRejected(batch[0]) from e
+        increment("embed.split")
+        middle = len(batch) // 2
+        return embed_batch(batch[:middle], model, acquire) + embed_batch(batch[middle:], model, acquire)
+
+
+def embed_chunks(chunks: List[str], model: str = "models/text-embedding-004", batch_size: int = EMBED_BATCH_SIZE) -> List[List[float]]:
+    """
+    Embeds the list of text chunks using Gemini's embedding model.
+
+    Chunks are sent `batch_size` at a time; the returned list lines up with `chunks`.
+    Chunks already in the embedding cache are not sent at all.
+    """
+
+    def embed_missing(texts: List[str]) -> List[List[float]]:
+        embeddings = []
+        for start in range(0, len(texts), batch_size):
+            batch = texts[start:start + batch_size]
+            embeddings.extend(call_with_retry(lambda: embed_batch(batch, model)))
+        return embeddings
+
+    return embed_with_cache(chunks, model, embed_missing)
+
 def embed_User_query(query: str, model: str = "models/text-embedding-004") -> List[float]:
     """
     Embeds a single query string.
     """
-    response = genai.embed_content(
-        model=model,
-        content=query
-    )
-    return response["embedding"]
+    return embed_with_cache([query], model, lambda texts: call_with_retry(lambda: embed_batch(texts, model)))[0]
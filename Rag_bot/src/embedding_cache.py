@@ -0,0 +1,114 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from typing import List, Optional
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk embedding cache keyed by (model name, sha256 of text).
+
+    Vectors are stored as float32 blobs in SQLite. Once more than `max_entries`
+    rows exist, the least recently used ones are evicted.
+
+    :param path: SQLite file to use; parent directories are created.
+    :param max_entries: Maximum number of cached embeddings across all models.
+    """
+
+    def __init__(self, path: str, max_entries: int = 200_000):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        # Streamlit reruns the script on different threads, so share one connection under a lock
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )"""
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self.conn.commit()
+        self.size = self.conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """
+        Returns the cached embedding for each text, or None where it is not cached.
+        """
+        keys = [text_key(text) for text in texts]
+        found = {}
+        with self.lock:
+            # SQLite limits bound parameters per statement, so look up in slices
+            for start in range(0, len(keys), 500):
+                batch = list(set(keys[start:start + 500]))
+                placeholders = ",".join("?" * len(batch))
+                rows = self.conn.execute(
+                    f"SELECT text_hash, embedding FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                found.update(rows)
+
+            if found:
+                now = time.time()
+                self.conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, key) for key in found],
+                )
+                self.conn.commit()
+
+        results = []
+        for key in keys:
+            blob = found.get(key)
+            if blob is None:
+                self.misses += 1
+                results.append(None)
+            else:
+                self.hits += 1
+                results.append(array("f", blob).tolist())
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]) -> None:
+        now = time.time()
+        rows = [(model, text_key(text), array("f", embedding).tobytes(), now)
+                for text, embedding in zip(texts, embeddings)]
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, embedding, last_used) VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            self.size += self.conn.total_changes - before
+            if self.size > self.max_entries:
+                self._evict(self.size - self.max_entries)
+            self.conn.commit()
+
+    def _evict(self, count: int) -> None:
+        self.conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used LIMIT ?)",
+            (count,),
+        )
+        self.size -= count
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": self.size,
+        }
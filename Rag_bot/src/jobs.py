@@ -0,0 +1,441 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import List, Optional
+
+from manifest import document_id_for, load_manifest
+from pdfreader import PdfSource, is_path
+from vectorstore import VECTOR_BACKEND
+
+JOBS_PATH = os.getenv("JOBS_PATH", ".cache/jobs.sqlite")
+# Uploads are copied here until their job is done, so a failed or cancelled job can resume
+JOBS_UPLOAD_DIR = os.getenv("JOBS_UPLOAD_DIR", ".cache/uploads")
+# Ingests running at once
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+# "process" runs ingests in worker processes. The local vector index lives in the memory
+# of the process that queries it, so with VECTOR_BACKEND=local jobs run in threads instead.
+JOB_EXECUTOR = os.getenv("JOB_EXECUTOR", "thread" if VECTOR_BACKEND == "local" else "process").lower()
+# A running job's owner renews its lease every quarter of this many seconds; another process
+# (the app and server.py share the job table) only takes the job over once it expired, or
+# once the owner's process is gone
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED = "queued", "running", "done", "failed", "cancelled"
+PROGRESS_FIELDS = ("pages", "chunks", "skipped", "embedded", "upserted")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobStore:
+    """
+    SQLite table of ingestion jobs: status, per-stage progress counters and, for resuming,
+    the ids of the chunks each job has already upserted. Every process opens its own
+    connection; WAL mode lets the app read progress while workers write it.
+
+    :param path: SQLite file to use; parent directories are created.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                namespace TEXT NOT NULL,
+                document_name TEXT NOT NULL,
+                pdf_path TEXT NOT NULL,
+                content_hash TEXT,
+                status TEXT NOT NULL,
+                pages INTEGER NOT NULL DEFAULT 0,
+                chunks INTEGER NOT NULL DEFAULT 0,
+                skipped INTEGER NOT NULL DEFAULT 0,
+                embedded INTEGER NOT NULL DEFAULT 0,
+                upserted INTEGER NOT NULL DEFAULT 0,
+                cancel_requested INTEGER NOT NULL DEFAULT 0,
+                owner TEXT,
+                heartbeat_at REAL,
+                error TEXT,
+                result TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_jobs_namespace ON jobs(namespace, created_at);
+            CREATE TABLE IF NOT EXISTS job_chunks (
+                job_id TEXT NOT NULL,
+                chunk_id TEXT NOT NULL,
+                PRIMARY KEY (job_id, chunk_id)
+            );
+            """
+        )
+        columns = {row["name"] for row in self.conn.execute("PRAGMA table_info(jobs)")}
+        # Tables created before uploads were hashed
+        if "content_hash" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN content_hash TEXT")
+        # ... and before running jobs had an owner
+        if "owner" not in columns:
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            self.conn.execute("ALTER TABLE jobs ADD COLUMN heartbeat_at REAL")
+        self.conn.commit()
+
+    def _execute(self, sql: str, parameters=()) -> sqlite3.Cursor:
+        with self.lock:
+            cursor = self.conn.execute(sql, parameters)
+            self.conn.commit()
+            return cursor
+
+    def create(self, job_id: str, namespace: str, document_name: str, pdf_path: str,
+               content_hash: Optional[str] = None, status: str = QUEUED, result: Optional[dict] = None) -> None:
+        now = time.time()
+        self._execute(
+            "INSERT INTO jobs (id, namespace, document_name, pdf_path, content_hash, status, result, "
+            "created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (job_id, namespace, document_name, pdf_path, content_hash, status,
+             json.dumps(result) if result is not None else None, now, now),
+        )
+
+    def find_active(self, namespace: str, document_name: str, content_hash: str) -> Optional[str]:
+        """
+        Id of a queued or running job for the same upload, if there is one.
+        """
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT id FROM jobs WHERE namespace = ? AND document_name = ? AND content_hash = ? "
+                "AND status IN (?, ?)", (namespace, document_name, content_hash, QUEUED, RUNNING)).fetchone()
+        return row["id"] if row is not None else None
+
+    @staticmethod
+    def _to_dict(row: sqlite3.Row) -> dict:
+        job = dict(row)
+        job["cancel_requested"] = bool(job["cancel_requested"])
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        return job
+
+    def get(self, job_id: str) -> Optional[dict]:
+        with self.lock:
+            row = self.conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row is not None else None
+
+    def list(self, namespace: Optional[str] = None, limit: int = 50) -> List[dict]:
+        """
+        Most recent jobs first, optionally only those of one namespace.
+        """
+        with self.lock:
+            if namespace is None:
+                rows = self.conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,))
+            else:
+                rows = self.conn.execute("SELECT * FROM jobs WHERE namespace = ? ORDER BY created_at DESC LIMIT ?",
+                                         (namespace, limit))
+            return [self._to_dict(row) for row in rows.fetchall()]
+
+    def with_status(self, *statuses: str) -> List[str]:
+        with self.lock:
+            rows = self.conn.execute(f"SELECT id FROM jobs WHERE status IN ({','.join('?' * len(statuses))}) "
+                                     "ORDER BY created_at", statuses).fetchall()
+        return [row["id"] for row in rows]
+
+    def transition(self, job_id: str, from_statuses: tuple, status: str, error: Optional[str] = None,
+                   result: Optional[dict] = None) -> bool:
+        """
+        Moves a job to `status` if it is currently in one of `from_statuses`; returns
+        whether it did, so two callers can never both start or finish the same job.
+        """
+        cursor = self._execute(
+            f"UPDATE jobs SET status = ?, error = ?, result = ?, updated_at = ? "
+            f"WHERE id = ? AND status IN ({','.join('?' * len(from_statuses))})",
+            (status, error, json.dumps(result) if result is not None else None, time.time(), job_id, *from_statuses),
+        )
+        return cursor.rowcount == 1
+
+    def claim(self, job_id: str, owner: str) -> bool:
+        """
+        Moves a queued job to running under `owner`, with a fresh lease; like transition,
+        only one caller can succeed.
+        """
+        now = time.time()
+        cursor = self._execute("UPDATE jobs SET status = ?, owner = ?, heartbeat_at = ?, updated_at = ? "
+                               "WHERE id = ? AND status = ?", (RUNNING, owner, now, now, job_id, QUEUED))
+        return cursor.rowcount == 1
+
+    def heartbeat(self, job_id: str, owner: str) -> None:
+        self._execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND owner = ? AND status = ?",
+                      (time.time(), job_id, owner, RUNNING))
+
+    def release_abandoned(self, lease: float) -> List[str]:
+        """
+        Queues again the running jobs whose owner is gone: its lease expired, or it ran on
+        this host in a process that no longer exists. Returns their ids.
+        """
+        with self.lock:
+            rows = self.conn.execute("SELECT id, owner, heartbeat_at FROM jobs WHERE status = ?", (RUNNING,)).fetchall()
+        released = []
+        for row in rows:
+            if row["heartbeat_at"] is not None and row["heartbeat_at"] > time.time() - lease and _owner_alive(row["owner"]):
+                continue
+            # Only if nobody renewed the lease or took the job in the meantime
+            cursor = self._execute("UPDATE jobs SET status = ?, owner = NULL, updated_at = ? WHERE id = ? "
+                                   "AND status = ? AND owner IS ? AND heartbeat_at IS ?",
+                                   (QUEUED, time.time(), row["id"], RUNNING, row["owner"], row["heartbeat_at"]))
+            if cursor.rowcount == 1:
+                released.append(row["id"])
+        return released
+
+    def update_progress(self, job_id: str, progress: dict) -> bool:
+        """
+        Records the pipeline's counters; returns True if the job should stop.
+        """
+        self._execute(
+            f"UPDATE jobs SET {', '.join(f'{field} = ?' for field in PROGRESS_FIELDS)}, updated_at = ? WHERE id = ?",
+            (*(progress.get(field, 0) for field in PROGRESS_FIELDS), time.time(), job_id),
+        )
+        with self.lock:
+            row = self.conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return bool(row["cancel_requested"])
+
+    def set_cancel_requested(self, job_id: str, requested: bool) -> None:
+        self._execute("UPDATE jobs SET cancel_requested = ?, updated_at = ? WHERE id = ?",
+                      (int(requested), time.time(), job_id))
+
+    def add_chunks(self, job_id: str, chunk_ids: List[str]) -> None:
+        with self.lock:
+            self.conn.executemany("INSERT OR IGNORE INTO job_chunks (job_id, chunk_id) VALUES (?, ?)",
+                                  [(job_id, chunk_id) for chunk_id in chunk_ids])
+            self.conn.commit()
+
+    def chunk_ids(self, job_id: str) -> List[str]:
+        with self.lock:
+            rows = self.conn.execute("SELECT chunk_id FROM job_chunks WHERE job_id = ?", (job_id,)).fetchall()
+        return [row["chunk_id"] for row in rows]
+
+    def clear_chunks(self, job_id: str) -> None:
+        self._execute("DELETE FROM job_chunks WHERE job_id = ?", (job_id,))
+
+
+def _job_owner() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _owner_alive(owner: Optional[str]) -> bool:
+    # Another host's processes cannot be checked, only its lease
+    host, _, pid = (owner or "").rpartition(":")
+    if host != socket.gethostname() or not pid.isdigit():
+        return owner is not None
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def run_job(path: str, job_id: str) -> str:
+    """
+    Runs one queued job to completion (in a worker process or thread) and returns its
+    final status. Progress is written after every upserted batch, which is also where a
+    cancel request is noticed; the upserted chunk ids are checkpointed so a resumed job
+    skips them.
+    """
+    # Imported here: worker processes only need the pipeline once they run a job
+    from dataprocessor import run as process_pdf
+
+    store = JobStore(path)
+    owner = _job_owner()
+    if not store.claim(job_id, owner):
+        return store.get(job_id)["status"]
+    job = store.get(job_id)
+    if job["cancel_requested"]:
+        store.transition(job_id, (RUNNING,), CANCELLED)
+        return CANCELLED
+
+    def on_progress(progress: dict) -> None:
+        if store.update_progress(job_id, progress):
+            raise JobCancelled(job_id)
+
+    # Renews the lease while the job runs, however long a batch takes
+    finished = threading.Event()
+
+    def keep_lease() -> None:
+        while not finished.wait(JOB_LEASE_SECONDS / 4):
+            store.heartbeat(job_id, owner)
+
+    threading.Thread(target=keep_lease, daemon=True, name=f"job-lease-{job_id}").start()
+    try:
+        result = process_pdf(job["pdf_path"], document_name=job["document_name"], namespace=job["namespace"],
+                             on_progress=on_progress, on_stored=lambda ids: store.add_chunks(job_id, ids),
+                             stored_ids=store.chunk_ids(job_id))
+    except JobCancelled:
+        store.transition(job_id, (RUNNING,), CANCELLED)
+        return CANCELLED
+    except Exception as e:
+        store.transition(job_id, (RUNNING,), FAILED, error=f"{type(e).__name__}: {e}")
+        return FAILED
+    finally:
+        finished.set()
+
+    store.transition(job_id, (RUNNING,), DONE, result=result)
+    # The document is indexed and in its manifest, the checkpoint and upload are not needed
+    store.clear_chunks(job_id)
+    if os.path.exists(job["pdf_path"]):
+        os.remove(job["pdf_path"])
+    return DONE
+
+
+def _write_and_hash(pdf: PdfSource, path: str, block_size: int = 1 << 20) -> str:
+    # One pass over the upload: each block is hashed and written, no whole-file copy is made
+    digest = hashlib.sha256()
+    with open(path, "wb") as out:
+        if isinstance(pdf, (bytes, bytearray, memoryview)):
+            view = memoryview(pdf).cast("B")
+            for start in range(0, len(view), block_size):
+                digest.update(view[start:start + block_size])
+                out.write(view[start:start + block_size])
+        else:
+            source = open(pdf, "rb") if is_path(pdf) else pdf
+            try:
+                for block in iter(lambda: source.read(block_size), b""):
+                    digest.update(block)
+                    out.write(block)
+            finally:
+                if source is not pdf:
+                    source.close()
+    return digest.hexdigest()
+
+
+class JobQueue:
+    """
+    Background ingestion: uploads are queued in a JobStore and indexed by a pool of
+    `workers` processes (or threads), so the caller returns immediately and a closed
+    browser tab does not stop the work.
+
+    Queued jobs, and running jobs whose owner is gone (see JobStore.release_abandoned), are
+    picked up on start, resuming from their checkpoint. Jobs another live process is running,
+    e.g. the app's while server.py starts, are left to it.
+
+    :param path: SQLite file of the job table.
+    :param upload_dir: Directory the uploaded PDFs are copied to.
+    :param workers: Ingests running at once.
+    :param executor: "process" or "thread".
+    """
+
+    def __init__(self, path: str = JOBS_PATH, upload_dir: str = JOBS_UPLOAD_DIR, workers: int = JOB_WORKERS,
+                 executor: str = JOB_EXECUTOR):
+        self.path = path
+        self.upload_dir = upload_dir
+        os.makedirs(upload_dir, exist_ok=True)
+        self.store = JobStore(path)
+        if executor == "process":
+            # Not forked: the app's threads could hold locks the children would inherit
+            self.executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingest-job")
+        self.futures = {}
+
+        self.store.release_abandoned(JOB_LEASE_SECONDS)
+        for job_id in self.store.with_status(QUEUED):
+            self._schedule(job_id)
+
+    def _schedule(self, job_id: str) -> None:
+        future = self.executor.submit(run_job, self.path, job_id)
+        self.futures[job_id] = future
+        future.add_done_callback(lambda done: self._finished(job_id, done))
+
+    def _finished(self, job_id: str, future: Future) -> None:
+        self.futures.pop(job_id, None)
+        # run_job records its own outcome; this only catches a worker that died
+        if future.exception() is not None:
+            self.store.transition(job_id, (QUEUED, RUNNING), FAILED, error=repr(future.exception()))
+
+    def submit(self, pdf: PdfSource, document_name: str, namespace: str = "") -> str:
+        """
+        Queues a PDF (a path, the file's bytes or memoryview, or a binary file object) for
+        ingestion. The upload is hashed while it is written to `upload_dir`, and never
+        parsed here: an upload identical to the indexed version of the document, or to a
+        job already in progress, gets no new ingest.
+
+        :return: The job id (of the job already in progress, for a repeated upload).
+        """
+        job_id = uuid.uuid4().hex[:16]
+        pdf_path = os.path.abspath(os.path.join(self.upload_dir, f"{job_id}.pdf"))
+        content_hash = _write_and_hash(pdf, pdf_path)
+
+        manifest = load_manifest(document_id_for(document_name), namespace)
+        duplicate = manifest is not None and manifest["content_hash"] == content_hash
+        active = None if duplicate else self.store.find_active(namespace, document_name, content_hash)
+        if duplicate or active is not None:
+            os.remove(pdf_path)
+        if active is not None:
+            return active
+        if duplicate:
+            self.store.create(job_id, namespace, document_name, pdf_path, content_hash, status=DONE,
+                              result={"chunks": len(manifest["chunk_ids"]), "upserted": 0, "deleted": 0,
+                                      "unchanged_document": True})
+            return job_id
+
+        self.store.create(job_id, namespace, document_name, pdf_path, content_hash)
+        self._schedule(job_id)
+        return job_id
+
+    def get(self, job_id: str) -> Optional[dict]:
+        return self.store.get(job_id)
+
+    def list_jobs(self, namespace: Optional[str] = None, limit: int = 50) -> List[dict]:
+        return self.store.list(namespace, limit)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Stops a queued or running job; a running one stops after its current batch.
+        Returns False if the job already finished.
+        """
+        self.store.set_cancel_requested(job_id, True)
+        if self.store.transition(job_id, (QUEUED,), CANCELLED):
+            return True
+        return self.store.get(job_id)["status"] == RUNNING
+
+    def resume(self, job_id: str) -> bool:
+        """
+        Queues a cancelled or failed job again; chunks it already upserted are skipped.
+        """
+        self.store.set_cancel_requested(job_id, False)
+        if not self.store.transition(job_id, (CANCELLED, FAILED), QUEUED):
+            return False
+        self._schedule(job_id)
+        return True
+
+    def shutdown(self, wait: bool = True) -> None:
+        self.executor.shutdown(wait=wait)
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """
+    The process-wide job queue, started on first use.
+    """
+    global _queue
+    if _queue is None:
+        with _queue_lock:
+            if _queue is None:
+                _queue = JobQueue()
+    return _queue
+
+
+def set_job_queue(queue: Optional[JobQueue]) -> None:
+    global _queue
+    _queue = queue
@@ -1,46 +1,75 @@
-import google.generativeai as genai
 import os
-from dotenv import load_dotenv
-import time
-from google.api_core.exceptions import ResourceExhausted
-from functools import lru_cache
-
-load_dotenv()
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+from typing import Callable, Iterator
+from clients import get_generative_model
+from retry import call_with_retry, is_rate_limited
+from tracing import span
 
 # Step 4: Use a cheaper / higher-limit model (Gemini 1.5 Flash -> gemini-flash-latest)
-model = genai.GenerativeModel('models/gemini-flash-latest')
+LLM_MODEL = 'models/gemini-flash-latest'
 
-# Step 5: Cache responses
-@lru_cache(maxsize=100)
-def query_llm_with_context(query: str, context: str) -> str:
-    # Step 3: Add a HARD token guardrail (Truncate context)
-    MAX_CONTEXT_CHARS = 3000
-    if len(context) > MAX_CONTEXT_CHARS:
-        context = context[:MAX_CONTEXT_CHARS]
+RATE_LIMIT_MESSAGE = "I apologize, but I am currently experiencing high traffic (Rate Limit Exceeded). Please try again in a minute."
+
+# A backend takes a prompt, sends the request and returns an iterator over the response text
+# as it is generated (errors such as rate limits are raised by the call itself)
+LLMBackend = Callable[[str], Iterator[str]]
+
+
+def _gemini_generate(prompt: str) -> Iterator[str]:
+    # With stream=True the request is sent and the first chunk received here,
+    # the rest of the answer arrives while iterating
+    response = get_generative_model(LLM_MODEL).generate_content(prompt, stream=True)
+    return (chunk.text for chunk in response if chunk.parts)
+
+
+def _default_backend() -> LLMBackend:
+    if os.getenv("LLM_BACKEND", "gemini").lower() == "local":
+        from local_models import FakeLLM
+        return FakeLLM()
+    return _gemini_generate
+
+
+_backend: LLMBackend = _default_backend()
 
+
+def set_llm_backend(backend: LLMBackend) -> None:
+    """
+    Replaces the function used to generate answers (e.g. with a local FakeLLM).
+    """
+    global _backend
+    _backend = backend
+
+
+def build_prompt(query: str, context: str) -> str:
+    # Step 3: The context is already packed under a token budget (see context_packer.py)
     # Step 6: Smart prompt (short + strict)
     system_instruction = """Answer the question using ONLY the given context.
 If the answer is not found, say "Not available in document".
 """
 
-    prompt = f"{system_instruction}\n\nContext:\n{context}\n\nQuestion:\n{query}"
-    
-    max_retries = 3
-    for attempt in range(max_retries):
-        try:
-            response = model.generate_content(prompt)
-            return response.text
-        except ResourceExhausted:
-            wait_time = (2 ** attempt) * 5  # 5s, 10s, 20s
-            print(f"Quota exceeded. Retrying in {wait_time} seconds...")
-            time.sleep(wait_time)
-        except Exception as e:
-            if "429" in str(e):
-                wait_time = (2 ** attempt) * 5
-                print(f"Quota exceeded (429). Retrying in {wait_time} seconds...")
-                time.sleep(wait_time)
-            else:
-                raise e
-    
-    return "I apologize, but I am currently experiencing high traffic (Rate Limit Exceeded). Please try again in a minute."
+    return f"{system_instruction}\n\nContext:\n{context}\n\nQuestion:\n{query}"
+
+
+def stream_llm_with_context(query: str, context: str) -> Iterator[str]:
+    """
+    Yields the answer piece by piece as the model generates it, so the first words can
+    be shown long before the whole answer is ready.
+
+    If the model is still rate limited after retrying, the apology RATE_LIMIT_MESSAGE
+    is yielded instead of an answer.
+    """
+    prompt = build_prompt(query, context)
+    try:
+        # Until the first chunk arrives, retries included
+        with span("llm.request"):
+            pieces = call_with_retry(lambda: _backend(prompt))
+    except Exception as e:
+        if not is_rate_limited(e):
+            raise
+        yield RATE_LIMIT_MESSAGE
+        return
+    yield from pieces
+
+
+# Step 5: Responses are cached semantically by QueryProcessor (see answer_cache.py)
+def query_llm_with_context(query: str, context: str) -> str:
+    return "".join(stream_llm_with_context(query, context))
@@ -0,0 +1,123 @@
+import hashlib
+import math
+import re
+import threading
+import time
+from collections import deque
+from typing import Iterator, List
+
+TOKEN_PATTERN = re.compile(r"\w+")
+
+
+class HashEmbedder:
+    """
+    Deterministic offline stand-in for the Gemini embedding API.
+
+    Each token is hashed into one of `dim` buckets (feature hashing), so texts
+    sharing words get similar vectors. Optional sleeps emulate the round-trip
+    cost of the real API so batching can be benchmarked without a key.
+
+    :param dim: Embedding dimension (default 768, same as text-embedding-004).
+    :param latency_per_call: Seconds to sleep for every request.
+    :param latency_per_item: Extra seconds to sleep for every text in a request.
+    :param requests_per_minute: If set, raise ResourceExhausted once more requests
+        than this arrive within a sliding 60s window, like the real quota does.
+    """
+
+    def __init__(self, dim: int = 768, latency_per_call: float = 0.0, latency_per_item: float = 0.0,
+                 requests_per_minute: int = None):
+        self.dim = dim
+        self.cache_prefix = f"hash-{dim}:"
+        self.latency_per_call = latency_per_call
+        self.latency_per_item = latency_per_item
+        self.requests_per_minute = requests_per_minute
+        self.calls = 0
+        self.rejected = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def embed_one(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for token in TOKEN_PATTERN.findall(text.lower()):
+            digest = hashlib.md5(token.encode("utf-8")).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+
+        norm = math.sqrt(sum(v * v for v in vector))
+        if norm > 0:
+            vector = [v / norm for v in vector]
+        return vector
+
+    def __call__(self, texts: List[str], model: str = "") -> List[List[float]]:
+        with self._lock:
+            self.calls += 1
+            if self.requests_per_minute is not None:
+                now = time.monotonic()
+                while self._recent and now - self._recent[0] > 60:
+                    self._recent.popleft()
+                if len(self._recent) >= self.requests_per_minute:
+                    self.rejected += 1
+                    from google.api_core.exceptions import ResourceExhausted
+                    raise ResourceExhausted("429 Quota exceeded (HashEmbedder)")
+                self._recent.append(now)
+
+        delay = self.latency_per_call + self.latency_per_item * len(texts)
+        if delay > 0:
+            time.sleep(delay)
+        return [self.embed_one(text) for text in texts]
+
+
+class FakeLLM:
+    """
+    Deterministic offline stand-in for the Gemini generative model.
+
+    The "answer" is the start of the prompt's context, streamed word by word, or
+    "Not available in document" when the context is empty. Optional sleeps emulate
+    time-to-first-token and generation speed so streaming can be tested without a key.
+
+    :param answer_words: Maximum number of words in an answer.
+    :param latency_first_token: Seconds before the first word (paid when called).
+    :param latency_per_token: Seconds between two words.
+    :param requests_per_minute: If set, raise ResourceExhausted once more requests
+        than this arrive within a sliding 60s window, like the real quota does.
+    """
+
+    def __init__(self, answer_words: int = 40, latency_first_token: float = 0.0, latency_per_token: float = 0.0,
+                 requests_per_minute: int = None):
+        self.answer_words = answer_words
+        self.latency_first_token = latency_first_token
+        self.latency_per_token = latency_per_token
+        self.requests_per_minute = requests_per_minute
+        self.calls = 0
+        self.rejected = 0
+        self._recent = deque()
+        self._lock = threading.Lock()
+
+    def answer_for(self, prompt: str) -> str:
+        context = prompt.split("Context:\n", 1)[-1].split("\n\nQuestion:", 1)[0]
+        words = context.split()[:self.answer_words]
+        return " ".join(words) if words else "Not available in document"
+
+    def __call__(self, prompt: str) -> Iterator[str]:
+        with self._lock:
+            self.calls += 1
+            if self.requests_per_minute is not None:
+                now = time.monotonic()
+                while self._recent and now - self._recent[0] > 60:
+                    self._recent.popleft()
+                if len(self._recent) >= self.requests_per_minute:
+                    self.rejected += 1
+                    from google.api_core.exceptions import ResourceExhausted
+                    raise ResourceExhausted("429 Quota exceeded (FakeLLM)")
+                self._recent.append(now)
+
+        if self.latency_first_token > 0:
+            time.sleep(self.latency_first_token)
+        return self._stream(self.answer_for(prompt))
+
+    def _stream(self, answer: str) -> Iterator[str]:
+        for index, word in enumerate(answer.split(" ")):
+            if index and self.latency_per_token > 0:
+                time.sleep(self.latency_per_token)
+            yield word if index == 0 else " " + word
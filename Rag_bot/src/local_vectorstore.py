@@ -0,0 +1,409 @@
+import json
+import os
+import threading
+from typing import Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_NAMESPACE_DIR = "_default"
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+
+def top_k_indices(scores: np.ndarray, top_k: int) -> np.ndarray:
+    """
+    Indices of the `top_k` highest scores, best first, without sorting the whole array.
+    """
+    if top_k >= len(scores):
+        return np.argsort(-scores)
+    candidates = np.argpartition(-scores, top_k)[:top_k]
+    return candidates[np.argsort(-scores[candidates])]
+
+
+class GrowableArray:
+    """
+    A (rows, width) array that grows by doubling. With a `path` it is a memory-mapped
+    file whose capacity is derived from the file size, so it survives restarts.
+    """
+
+    def __init__(self, width: int, dtype, path: Optional[str] = None):
+        self.width = width
+        self.dtype = np.dtype(dtype)
+        self.path = path
+        self.data = None
+        if path and os.path.exists(path):
+            capacity = os.path.getsize(path) // (width * self.dtype.itemsize)
+            self.data = np.memmap(path, dtype=self.dtype, mode="r+", shape=(capacity, width))
+
+    def __len__(self) -> int:
+        return 0 if self.data is None else len(self.data)
+
+    def reserve(self, capacity: int, used: int) -> None:
+        current = len(self)
+        if capacity <= current:
+            return
+        new_capacity = max(capacity, current * 2, 1024)
+
+        if self.path is None:
+            grown = np.zeros((new_capacity, self.width), dtype=self.dtype)
+            if self.data is not None:
+                grown[:used] = self.data[:used]
+            self.data = grown
+            return
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        if self.data is not None:
+            self.data.flush()
+            self.data = None
+        with open(self.path, "ab") as f:
+            f.truncate(new_capacity * self.width * self.dtype.itemsize)
+        self.data = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(new_capacity, self.width))
+
+    def flush(self) -> None:
+        if isinstance(self.data, np.memmap):
+            self.data.flush()
+
+
+class LocalNamespace:
+    """
+    One namespace of the local store: a float32 matrix of unit-length vectors plus ids
+    and metadata. With a `path`, vectors live in a memory-mapped file that grows by
+    doubling, and metadata is appended to a JSONL log that is replayed on load.
+
+    With `index_type="ivf"`, an IVFIndex is trained once `train_threshold` vectors
+    exist and then answers queries approximately; until then search stays exact.
+
+    With `compression="int8"` or `"pq"`, a quantizer is trained at the same threshold
+    and queries are scored against compact codes held in RAM. The best
+    `rerank_candidates` are then re-scored with the full-precision vectors, which
+    stay in the memory-mapped file and are only paged in for those rows.
+
+    Deleted rows become tombstones that searches skip and later inserts reuse.
+
+    Searches can take a Pinecone-style metadata filter ({"field": value},
+    {"field": {"$eq": value}} or {"field": {"$in": [...]}}). Each filtered field gets
+    an in-memory value -> rows index, so only the matching rows are scored.
+    """
+
+    def __init__(self, path: Optional[str] = None, index_type: str = "flat", nlist: int = 1024,
+                 nprobe: int = 16, train_threshold: int = 50_000, compression: str = "none",
+                 pq_subvectors: int = 96, rerank_candidates: int = 100):
+        self.path = path
+        self.train_threshold = train_threshold
+        self.compression = compression
+        self.pq_subvectors = pq_subvectors
+        self.rerank_candidates = rerank_candidates
+        self.ann = None
+        if index_type == "ivf":
+            from ann_index import IVFIndex
+            self.ann = IVFIndex(nlist=nlist, nprobe=nprobe, path=path)
+        self.quantizer = None
+        self.codes: Optional[GrowableArray] = None
+        self.dim = None
+        self.count = 0
+        self.vector_store: Optional[GrowableArray] = None
+        self.ids: List[Optional[str]] = []
+        self.metadata: List[Optional[dict]] = []
+        self.id_to_row: Dict[str, int] = {}
+        self.free_rows: List[int] = []
+        self.field_index: Dict[str, Dict[object, set]] = {}
+        if path and os.path.exists(os.path.join(path, "header.json")):
+            self._load()
+
+    @property
+    def vectors(self) -> np.ndarray:
+        return self.vector_store.data
+
+    def _file(self, name: str) -> Optional[str]:
+        return os.path.join(self.path, name) if self.path else None
+
+    def _load(self) -> None:
+        with open(self._file("header.json")) as f:
+            header = json.load(f)
+        self.dim = header["dim"]
+        self.vector_store = GrowableArray(self.dim, np.float32, self._file("vectors.f32"))
+
+        with open(self._file("metadata.jsonl"), encoding="utf-8") as f:
+            for line in f:
+                record = json.loads(line)
+                if record.get("deleted"):
+                    self._clear_row(record["row"])
+                else:
+                    self._set_row(record["row"], record["id"], record["metadata"])
+
+        if self.compression != "none" and os.path.exists(self._file("quantizer.npz")):
+            from quantization import load_quantizer
+            self.quantizer = load_quantizer(self._file("quantizer.npz"))
+            self.codes = GrowableArray(self.quantizer.code_size, np.uint8, self._file("codes.u8"))
+
+    @property
+    def live_count(self) -> int:
+        return self.count - len(self.free_rows)
+
+    def _set_row(self, row: int, vector_id: str, metadata: dict) -> None:
+        if row == len(self.ids):
+            self.ids.append(vector_id)
+            self.metadata.append(metadata)
+        else:
+            if self.ids[row] is None:
+                self.free_rows.remove(row)
+            else:
+                self._unindex_fields(row)
+            self.ids[row] = vector_id
+            self.metadata[row] = metadata
+        self.id_to_row[vector_id] = row
+        self.count = len(self.ids)
+        for field, values in self.field_index.items():
+            if field in metadata:
+                values.setdefault(metadata[field], set()).add(row)
+
+    def _unindex_fields(self, row: int) -> None:
+        metadata = self.metadata[row]
+        for field, values in self.field_index.items():
+            if field in metadata:
+                values.get(metadata[field], set()).discard(row)
+
+    def _clear_row(self, row: int) -> None:
+        vector_id = self.ids[row]
+        if vector_id is None:
+            return
+        self._unindex_fields(row)
+        del self.id_to_row[vector_id]
+        self.ids[row] = None
+        self.metadata[row] = None
+        self.free_rows.append(row)
+
+    def _train_quantizer(self) -> None:
+        from quantization import make_quantizer, save_quantizer
+
+        self.quantizer = make_quantizer(self.compression, self.pq_subvectors)
+        self.quantizer.train(self.vectors[:self.count])
+        self.codes = GrowableArray(self.quantizer.code_size, np.uint8, self._file("codes.u8"))
+        self.codes.reserve(len(self.vector_store), 0)
+        for start in range(0, self.count, 65536):
+            end = min(start + 65536, self.count)
+            self.codes.data[start:end] = self.quantizer.encode(self.vectors[start:end])
+        self.codes.flush()
+        if self.path:
+            save_quantizer(self.quantizer, self._file("quantizer.npz"))
+
+    def add(self, ids: List[str], embeddings, metadatas: List[dict]) -> None:
+        """
+        Inserts or overwrites vectors by id.
+        """
+        embeddings = normalize_rows(embeddings)
+        if self.dim is None:
+            self.dim = embeddings.shape[1]
+            self.vector_store = GrowableArray(self.dim, np.float32, self._file("vectors.f32"))
+            if self.path:
+                os.makedirs(self.path, exist_ok=True)
+                with open(self._file("header.json"), "w") as f:
+                    json.dump({"dim": self.dim}, f)
+        elif embeddings.shape[1] != self.dim:
+            raise ValueError(f"Expected {self.dim}-dimensional vectors, got {embeddings.shape[1]}")
+
+        new_ids = len({vector_id for vector_id in ids if vector_id not in self.id_to_row})
+        # Rows in use before this add, the ones worth copying when an array grows
+        used = self.count
+        self.vector_store.reserve(used + max(0, new_ids - len(self.free_rows)), used)
+
+        rows = []
+        for vector_id, metadata in zip(ids, metadatas):
+            row = self.id_to_row.get(vector_id)
+            if row is None:
+                row = self.free_rows[-1] if self.free_rows else self.count
+            self._set_row(row, vector_id, metadata)
+            rows.append(row)
+        self.vectors[rows] = embeddings
+
+        if self.quantizer is not None:
+            self.codes.reserve(len(self.vector_store), used)
+            self.codes.data[rows] = self.quantizer.encode(embeddings)
+            self.codes.flush()
+        elif self.compression != "none" and self.count >= self.train_threshold:
+            self._train_quantizer()
+
+        if self.ann is not None:
+            if self.ann.is_trained:
+                self.ann.add(rows, embeddings)
+            elif self.count >= self.train_threshold:
+                self.ann.train(self.vectors[:self.count])
+
+        if self.path is not None:
+            self.vector_store.flush()
+            with open(self._file("metadata.jsonl"), "a", encoding="utf-8") as f:
+                for row, vector_id, metadata in zip(rows, ids, metadatas):
+                    f.write(json.dumps({"row": row, "id": vector_id, "metadata": metadata}) + "\n")
+
+    def delete(self, ids: List[str]) -> int:
+        """
+        Removes vectors by id; unknown ids are ignored. Returns how many were removed.
+        """
+        rows = [self.id_to_row[vector_id] for vector_id in set(ids) if vector_id in self.id_to_row]
+        for row in rows:
+            self._clear_row(row)
+        if self.ann is not None:
+            self.ann.remove(rows)
+        if self.path is not None and rows:
+            with open(self._file("metadata.jsonl"), "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps({"row": row, "deleted": True}) + "\n")
+        return len(rows)
+
+    def _rows_with(self, field: str, value) -> set:
+        if field not in self.field_index:
+            values: Dict[object, set] = {}
+            for row, metadata in enumerate(self.metadata):
+                if metadata is not None and field in metadata:
+                    values.setdefault(metadata[field], set()).add(row)
+            self.field_index[field] = values
+        return self.field_index[field].get(value, set())
+
+    def filter_rows(self, metadata_filter: dict) -> np.ndarray:
+        """
+        Sorted rows whose metadata matches every condition of the filter.
+        """
+        matched = None
+        for field, condition in metadata_filter.items():
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+            rows = set()
+            for operator, operand in condition.items():
+                if operator == "$eq":
+                    rows |= self._rows_with(field, operand)
+                elif operator == "$in":
+                    for value in operand:
+                        rows |= self._rows_with(field, value)
+                else:
+                    raise ValueError(f"Unsupported filter operator '{operator}', expected '$eq' or '$in'")
+            matched = rows if matched is None else matched & rows
+        return np.array(sorted(matched or ()), dtype=np.int64)
+
+    def _mask_deleted(self, scores: np.ndarray, rows: Optional[np.ndarray]) -> None:
+        if not self.free_rows:
+            return
+        if rows is None:
+            scores[self.free_rows] = -np.inf
+        else:
+            scores[np.isin(rows, self.free_rows)] = -np.inf
+
+    def _exact_scores(self, query: np.ndarray, rows: Optional[np.ndarray]) -> np.ndarray:
+        if rows is None:
+            return self.vectors[:self.count] @ query
+        return self.vectors[rows] @ query
+
+    def search(self, query_vector, top_k: int, nprobe: Optional[int] = None, exact: bool = False,
+               metadata_filter: Optional[dict] = None, include_values: bool = False) -> List[dict]:
+        """
+        Top-k rows by cosine similarity. Uses the IVF index and compressed codes when
+        they are trained, unless `exact` is set. With a `metadata_filter`, only the
+        matching rows are scored (the IVF index is bypassed, the partition is already small).
+        With `include_values`, each match carries its (normalized) vector as "values".
+        """
+        if self.count == 0:
+            return []
+        query = normalize_rows(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+
+        # None means every row; otherwise a sorted array of candidate rows
+        rows = None
+        if metadata_filter:
+            rows = self.filter_rows(metadata_filter)
+            if len(rows) == 0:
+                return []
+        elif self.ann is not None and self.ann.is_trained and not exact:
+            rows = self.ann.candidates(query, nprobe)
+
+        if self.quantizer is not None and not exact:
+            codes = self.codes.data[:self.count] if rows is None else self.codes.data[rows]
+            approximate = self.quantizer.scores(codes, query)
+            self._mask_deleted(approximate, rows)
+            shortlist = top_k_indices(approximate, max(top_k, self.rerank_candidates))
+            rows = shortlist if rows is None else rows[shortlist]
+            rows.sort()  # sequential reads from the memory-mapped matrix
+
+        scores = self._exact_scores(query, rows)
+        self._mask_deleted(scores, rows)
+        best = top_k_indices(scores, top_k)
+        best_rows = best if rows is None else rows[best]
+        matches = [
+            {"id": self.ids[row], "score": float(score), "metadata": self.metadata[row]}
+            for row, score in zip(best_rows.tolist(), scores[best].tolist())
+        ]
+        if include_values:
+            for match, values in zip(matches, self.vectors[best_rows]):
+                match["values"] = values
+        return [match for match in matches if match["id"] is not None]
+
+    def fetch(self, ids: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Stored (normalized) vectors of the given ids; unknown ids are left out.
+        """
+        rows = [(vector_id, self.id_to_row[vector_id]) for vector_id in ids if vector_id in self.id_to_row]
+        # Copies: the memory-mapped matrix may be remapped when it grows
+        return {vector_id: np.array(self.vectors[row]) for vector_id, row in rows}
+
+    def memory_footprint(self) -> dict:
+        """
+        Bytes of vector data that searches touch for every row versus only for re-ranked rows.
+        """
+        full = self.live_count * (self.dim or 0) * 4
+        if self.quantizer is None:
+            return {"scanned_bytes": full, "full_precision_bytes": full}
+        return {"scanned_bytes": self.live_count * self.quantizer.code_size, "full_precision_bytes": full}
+
+
+class LocalVectorStore:
+    """
+    In-process replacement for the Pinecone index with the same upsert/query shape,
+    so nothing needs the network. Similarity is cosine, computed as a dot product of
+    normalized float32 vectors.
+
+    :param path: Directory to persist namespaces in; None keeps everything in memory.
+    :param index_options: Passed to each LocalNamespace (index_type, nlist, nprobe,
+        train_threshold, compression, pq_subvectors, rerank_candidates).
+    """
+
+    def __init__(self, path: Optional[str] = None, **index_options):
+        self.path = path
+        self.index_options = index_options
+        self.namespaces: Dict[str, LocalNamespace] = {}
+        # Upserts arrive concurrently (see vectorstore.Upserter) and namespaces are not thread-safe
+        self.lock = threading.RLock()
+
+    def namespace(self, namespace: str = "") -> LocalNamespace:
+        with self.lock:
+            if namespace not in self.namespaces:
+                path = None
+                if self.path is not None:
+                    path = os.path.join(self.path, namespace or DEFAULT_NAMESPACE_DIR)
+                self.namespaces[namespace] = LocalNamespace(path, **self.index_options)
+            return self.namespaces[namespace]
+
+    def upsert(self, vectors: List[dict], namespace: str = "") -> None:
+        if not vectors:
+            return
+        with self.lock:
+            self.namespace(namespace).add(
+                [vector["id"] for vector in vectors],
+                [vector["values"] for vector in vectors],
+                [vector.get("metadata", {}) for vector in vectors],
+            )
+
+    def query(self, vector: List[float], top_k: int = 3, namespace: str = "", filter: Optional[dict] = None,
+              include_values: bool = False) -> List[dict]:
+        with self.lock:
+            return self.namespace(namespace).search(vector, top_k, metadata_filter=filter,
+                                                    include_values=include_values)
+
+    def fetch(self, ids: List[str], namespace: str = "") -> Dict[str, np.ndarray]:
+        with self.lock:
+            return self.namespace(namespace).fetch(ids)
+
+    def delete(self, ids: List[str], namespace: str = "") -> None:
+        with self.lock:
+            self.namespace(namespace).delete(ids)
@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+import time
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+# One JSON manifest per indexed document, recording which chunk ids are in the vector store
+MANIFEST_DIR = os.getenv("MANIFEST_DIR", ".cache/manifests")
+# A namespace directory's {document_id: content_hash}, by directory, with the modification
+# time it was read at; saving a manifest renames a file into the directory, which changes it
+_versions_cache: Dict[str, Tuple[int, Dict[str, str]]] = {}
+# Listings of directories modified more recently than this are not cached: a manifest saved
+# within the file system's timestamp granularity could leave the modification time unchanged
+_RACY_WINDOW_NS = 2_000_000_000
+
+
+def document_id_for(document_name: str) -> str:
+    """
+    Stable id for a document name, shared by every version of that document.
+    """
+    return hashlib.sha256(document_name.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_id_for(document_id: str, chunk: str) -> str:
+    """
+    Vector id of a chunk: the same text in the same document always gets the same id,
+    so unchanged chunks can be recognised on re-ingest.
+    """
+    return f"{document_id}-{hashlib.sha256(chunk.encode('utf-8')).hexdigest()[:24]}"
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def content_sha256(source: Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]) -> str:
+    """
+    Content hash of a file given as a path, a bytes-like object (hashed in place, without
+    a copy) or a binary file object (read in blocks, then rewound to where it was).
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return file_sha256(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return hashlib.sha256(source).hexdigest()
+    position = source.tell()
+    digest = hashlib.sha256()
+    for block in iter(lambda: source.read(1 << 20), b""):
+        digest.update(block)
+    source.seek(position)
+    return digest.hexdigest()
+
+
+def _manifest_path(document_id: str, namespace: str = "") -> str:
+    return os.path.join(MANIFEST_DIR, namespace or "_default", f"{document_id}.json")
+
+
+def load_manifest(document_id: str, namespace: str = "") -> Optional[dict]:
+    path = _manifest_path(document_id, namespace)
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(document_id: str, document_name: str, content_hash: str, chunk_ids, namespace: str = "") -> dict:
+    manifest = {
+        "document_id": document_id,
+        "document_name": document_name,
+        "namespace": namespace,
+        "content_hash": content_hash,
+        "chunk_ids": list(chunk_ids),
+        "indexed_at": time.time(),
+    }
+    path = _manifest_path(document_id, namespace)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write then rename so a crash never leaves a half-written manifest behind
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def list_manifests(namespace: str = "") -> List[dict]:
+    """
+    Manifests of every document indexed in a namespace, most recently indexed first.
+    """
+    directory = os.path.join(MANIFEST_DIR, namespace or "_default")
+    if not os.path.isdir(directory):
+        return []
+    manifests = []
+    for name in os.listdir(directory):
+        if name.endswith(".json"):
+            with open(os.path.join(directory, name), encoding="utf-8") as f:
+                manifests.append(json.load(f))
+    return sorted(manifests, key=lambda manifest: manifest["indexed_at"], reverse=True)
+
+
+def corpus_version(namespace: str = "", document_ids: Optional[List[str]] = None) -> str:
+    """
+    Fingerprint of the document versions a query searches: changes whenever one of
+    those documents is added, re-indexed with new content or removed.
+
+    :param namespace: Vector store namespace.
+    :param document_ids: Documents the query is restricted to (all of the namespace if empty).
+    """
+    versions = sorted(
+        (document_id, content_hash)
+        for document_id, content_hash in _document_versions(namespace).items()
+        if not document_ids or document_id in document_ids
+    )
+    return hashlib.sha256(json.dumps(versions).encode("utf-8")).hexdigest()[:16]
+
+
+def _document_versions(namespace: str = "") -> Dict[str, str]:
+    """
+    {document_id: content_hash} of a namespace. Runs on every query, so the manifests
+    (chunk id lists included) are only read again after the directory has changed.
+    """
+    directory = os.path.join(MANIFEST_DIR, namespace or "_default")
+    try:
+        modified = os.stat(directory).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    cached = _versions_cache.get(directory)
+    if cached is not None and cached[0] == modified:
+        return cached[1]
+    versions = {manifest["document_id"]: manifest["content_hash"] for manifest in list_manifests(namespace)}
+    if time.time_ns() - modified > _RACY_WINDOW_NS:
+        _versions_cache[directory] = (modified, versions)
+    return versions
@@ -1,12 +1,171 @@
-import os 
+import io
+import os
+import signal
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Iterator, List, Optional, Union
 from pypdf import PdfReader
 
+# A PDF given as a path, its bytes (bytes, bytearray, memoryview) or a binary file object
+PdfSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO]
 
-def read_pdf(pdf_path):
-    if not os.path.exists(pdf_path):
-        raise FileNotFoundError(f"The file {pdf_path} does not exist.")
-    reader = PdfReader(pdf_path)
-    pages = []
-    for page in reader.pages:
-        pages.append(page.extract_text())
-    return pages
\ No newline at end of file
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+PDF_PAGES_PER_SHARD = int(os.getenv("PDF_PAGES_PER_SHARD", "16"))
+# Seconds one page may take before it is skipped. Needs SIGALRM, so iter_pages_parallel
+# extracts in worker processes whenever it is set (even with PDF_WORKERS=1)
+PDF_PAGE_TIMEOUT = float(os.getenv("PDF_PAGE_TIMEOUT", "30"))
+
+
+class BufferReader(io.RawIOBase):
+    """
+    Seekable, read-only file over a bytes-like object. Unlike io.BytesIO, which copies a
+    memoryview or bytearray, it reads straight from the caller's buffer.
+    """
+
+    def __init__(self, buffer):
+        self.view = memoryview(buffer).cast("B")
+        self.position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        size = max(0, min(len(target), len(self.view) - self.position))
+        target[:size] = self.view[self.position:self.position + size]
+        self.position += size
+        return size
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.position, io.SEEK_END: len(self.view)}[whence]
+        self.position = max(0, base + offset)
+        return self.position
+
+    def tell(self) -> int:
+        return self.position
+
+
+def is_path(source: PdfSource) -> bool:
+    return isinstance(source, (str, os.PathLike))
+
+
+def open_pdf(source: PdfSource) -> PdfReader:
+    """
+    PdfReader over a path, a bytes-like object or a binary file object, without
+    copying in-memory uploads to a temporary file first.
+    """
+    if is_path(source):
+        if not os.path.exists(source):
+            raise FileNotFoundError(f"The file {source} does not exist.")
+        return PdfReader(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return PdfReader(BufferReader(source))
+    return PdfReader(source)
+
+
+def iter_pages(pdf_path: PdfSource, page_timeout: float = PDF_PAGE_TIMEOUT) -> Iterator[str]:
+    """
+    Yields the text of each page in order, extracting one page at a time. A page that
+    exceeds `page_timeout` seconds yields "", but only when iterated on the main thread
+    (see _can_time_out); iter_pages_parallel enforces it on any thread.
+    """
+    reader = open_pdf(pdf_path)
+    for number, page in enumerate(reader.pages):
+        yield _extract_page(page, number, page_timeout)
+
+
+def read_pdf(pdf_path: PdfSource):
+    return list(iter_pages(pdf_path))
+
+
+class PageTimeout(Exception):
+    pass
+
+
+def _raise_timeout(signum, frame):
+    raise PageTimeout()
+
+
+def _can_time_out() -> bool:
+    # SIGALRM handlers can only be installed from the main thread
+    return hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread()
+
+
+def _extract_page(page, page_number: int, timeout: float) -> str:
+    if timeout <= 0 or not _can_time_out():
+        return page.extract_text()
+    previous = signal.signal(signal.SIGALRM, _raise_timeout)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return page.extract_text()
+    except PageTimeout:
+        print(f"Page {page_number + 1} took longer than {timeout}s to extract, skipping it.")
+        return ""
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+
+
+# The in-memory PDF a worker process was started with, parsed once per worker
+_worker_reader = None
+
+
+def _open_in_worker(data: bytes) -> None:
+    global _worker_reader
+    _worker_reader = PdfReader(io.BytesIO(data))
+
+
+def _extract_page_range(pdf_path: Optional[str], start: int, stop: int, timeout: float) -> List[str]:
+    # Runs in a worker process; each worker parses a file once per shard (None means the
+    # worker's in-memory PDF)
+    reader = PdfReader(pdf_path) if pdf_path is not None else _worker_reader
+    return [_extract_page(reader.pages[number], number, timeout) for number in range(start, stop)]
+
+
+def iter_pages_parallel(pdf_path: PdfSource, workers: int = PDF_WORKERS, pages_per_shard: int = PDF_PAGES_PER_SHARD,
+                        page_timeout: float = PDF_PAGE_TIMEOUT) -> Iterator[str]:
+    """
+    Like iter_pages, but extracts page ranges in a process pool. Pages are still
+    yielded in document order, and only about two shards per worker are in flight
+    so memory stays bounded. A page that exceeds `page_timeout` seconds yields "".
+
+    The timeout relies on SIGALRM in the worker processes' main thread, which is why a
+    single worker is still a separate process while a timeout is set: pages are usually
+    pulled from a pipeline thread, where the signal cannot be used.
+
+    :param pdf_path: Path to the PDF file, or the PDF in memory (bytes or a file object).
+        Each worker process is sent an in-memory PDF once, when it starts.
+    :param workers: Number of worker processes; with 1 and no timeout (or no SIGALRM,
+        as on Windows), pages are extracted by iter_pages in this process.
+    :param pages_per_shard: Pages extracted per task.
+    :param page_timeout: Per-page extraction limit in seconds (0 disables it).
+    :return: Iterator over page texts.
+    """
+    can_time_out = page_timeout > 0 and hasattr(signal, "setitimer")
+    if workers <= 1 and not can_time_out:
+        yield from iter_pages(pdf_path, page_timeout)
+        return
+    workers = max(1, workers)
+
+    pool_options = {}
+    if not is_path(pdf_path):
+        # One copy, sent to each worker as it starts rather than with every shard
+        data = bytes(pdf_path) if isinstance(pdf_path, (bytes, bytearray, memoryview)) else pdf_path.read()
+        pool_options = {"initializer": _open_in_worker, "initargs": (data,)}
+        pdf_path = data
+    page_count = len(open_pdf(pdf_path).pages)
+    shards = [(start, min(start + pages_per_shard, page_count)) for start in range(0, page_count, pages_per_shard)]
+    shard_path = pdf_path if is_path(pdf_path) else None
+
+    with ProcessPoolExecutor(max_workers=min(workers, max(1, len(shards))), **pool_options) as executor:
+        pending = deque()
+        next_shard = 0
+        while next_shard < len(shards) or pending:
+            while next_shard < len(shards) and len(pending) < 2 * workers:
+                start, stop = shards[next_shard]
+                pending.append(executor.submit(_extract_page_range, shard_path, start, stop, page_timeout))
+                next_shard += 1
+            yield from pending.popleft().result()
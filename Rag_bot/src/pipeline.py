@@ -0,0 +1,194 @@
+import queue
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Set
+
+from bm25 import get_bm25_index
+from chunker import iter_document_chunks
+from embed_scheduler import EMBED_MAX_WORKERS, embed_batch_limited
+from embedder import EMBED_BATCH_SIZE, embed_with_cache
+from manifest import chunk_id_for
+from tracing import span
+from vectorstore import UPSERT_MAX_IN_FLIGHT, Upserter, store_in_pinecone
+
+# Marks the end of a stage's output
+_DONE = object()
+
+
+def _put(q: queue.Queue, item, stop: threading.Event) -> bool:
+    """
+    Blocking put that gives up once the pipeline is stopping, so a failed
+    downstream stage cannot leave an upstream one waiting forever.
+    """
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            pass
+    return False
+
+
+def _get(q: queue.Queue, stop: threading.Event):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.1)
+        except queue.Empty:
+            pass
+    return _DONE
+
+
+def ingest_stream(pages: Iterable[str], namespace: str = "", model: str = "models/text-embedding-004",
+                  batch_size: int = EMBED_BATCH_SIZE, embed_workers: int = EMBED_MAX_WORKERS,
+                  queue_size: int = 4, on_progress: Optional[Callable[[dict], None]] = None,
+                  document_id: Optional[str] = None, skip_ids: Optional[Set[str]] = None,
+                  on_stored: Optional[Callable[[List[str]], None]] = None,
+                  upsert_in_flight: int = UPSERT_MAX_IN_FLIGHT) -> dict:
+    """
+    Ingests a document as a pipeline of pages -> chunks -> embedding batches -> upserts.
+
+    Stages run in their own threads and are joined by queues of at most `queue_size`
+    batches, so memory stays flat however long the document is and each batch is
+    searchable as soon as it is upserted. Upserts overlap with embedding, up to
+    `upsert_in_flight` at a time.
+
+    :param pages: Iterable of page texts, e.g. pdfreader.iter_pages(path).
+    :param namespace: Vector store namespace to upsert into.
+    :param model: Embedding model name.
+    :param batch_size: Chunks per embedding request and per upsert.
+    :param embed_workers: Number of batches embedded concurrently.
+    :param queue_size: Maximum number of batches waiting between two stages.
+    :param on_progress: Called with the progress counters after every upserted batch
+        (from an upsert thread).
+    :param document_id: If set, chunk ids are derived from it and the chunk text
+        (see manifest.chunk_id_for) instead of chunk_{index}, and repeated chunks are dropped.
+    :param skip_ids: Chunk ids already in the store; those chunks are not embedded or upserted.
+    :param on_stored: Called with the chunk ids of every upserted batch, e.g. to checkpoint
+        an ingest so a resumed one can pass them as `skip_ids`.
+    :param upsert_in_flight: Maximum number of upsert requests sent concurrently.
+    :return: Counters for pages read, chunks produced, chunks skipped, chunks embedded and
+        vectors upserted, plus "chunk_ids", the ids of all the document's chunks in order.
+    """
+    progress = {"pages": 0, "chunks": 0, "skipped": 0, "embedded": 0, "upserted": 0}
+    chunk_ids = []
+    skip_ids = skip_ids or set()
+    lock = threading.Lock()
+    stop = threading.Event()
+    errors = []
+    chunk_batches = queue.Queue(maxsize=queue_size)
+    embedded_batches = queue.Queue(maxsize=queue_size)
+
+    def count_pages():
+        for page in pages:
+            progress["pages"] += 1
+            yield page
+
+    def read_and_chunk():
+        try:
+            seen = set()
+            indices, ids, batch, extras = [], [], [], []
+            for index, entry in enumerate(iter_document_chunks(count_pages())):
+                chunk = entry["text"]
+                progress["chunks"] += 1
+                chunk_id = chunk_id_for(document_id, chunk) if document_id else f"chunk_{index}"
+                if chunk_id in seen:
+                    continue
+                seen.add(chunk_id)
+                chunk_ids.append(chunk_id)
+                if chunk_id in skip_ids:
+                    progress["skipped"] += 1
+                    continue
+                indices.append(index)
+                ids.append(chunk_id)
+                batch.append(chunk)
+                # Page and offsets of the chunk, for citations
+                extras.append({key: value for key, value in entry.items() if key != "text"})
+                if len(batch) == batch_size:
+                    if not _put(chunk_batches, (indices, ids, batch, extras), stop):
+                        return
+                    indices, ids, batch, extras = [], [], [], []
+            if batch:
+                _put(chunk_batches, (indices, ids, batch, extras), stop)
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            for _ in range(embed_workers):
+                _put(chunk_batches, _DONE, stop)
+
+    def embed():
+        try:
+            while True:
+                item = _get(chunk_batches, stop)
+                if item is _DONE:
+                    break
+                indices, ids, batch, extras = item
+                with span("ingest.embed", size=len(batch)):
+                    embeddings = embed_with_cache(batch, model, lambda texts: embed_batch_limited(texts, model))
+                with lock:
+                    progress["embedded"] += len(batch)
+                if not _put(embedded_batches, (indices, ids, batch, extras, embeddings), stop):
+                    break
+        except Exception as e:
+            errors.append(e)
+            stop.set()
+        finally:
+            _put(embedded_batches, _DONE, stop)
+
+    # Batches are upserted concurrently while the next ones are embedded; the upserter
+    # blocks the upsert loop when too many are in flight, which in turn pauses embedding.
+    # Created before any stage starts, so a store that cannot be reached fails fast
+    upserter = Upserter(namespace, max_in_flight=upsert_in_flight)
+
+    def stored(ids: List[str]) -> None:
+        with lock:
+            progress["upserted"] += len(ids)
+            snapshot = dict(progress)
+        if on_stored is not None:
+            on_stored(ids)
+        if on_progress is not None:
+            on_progress(snapshot)
+
+    threads = [threading.Thread(target=read_and_chunk, daemon=True)]
+    threads += [threading.Thread(target=embed, daemon=True) for _ in range(embed_workers)]
+    for thread in threads:
+        thread.start()
+
+    start_time = time.perf_counter()
+    finished_workers = 0
+    try:
+        while finished_workers < embed_workers:
+            item = _get(embedded_batches, stop)
+            if item is _DONE:
+                finished_workers += 1
+                if stop.is_set():
+                    break
+                continue
+            indices, ids, batch, extras, embeddings = item
+            metadata = [{"chunk_index": index, **extra} for index, extra in zip(indices, extras)]
+            if document_id:
+                for entry in metadata:
+                    entry["document_id"] = document_id
+            # Time spent waiting for an upsert slot; the requests themselves are "vector.upsert" spans
+            with span("ingest.upsert", size=len(batch)):
+                store_in_pinecone(batch, embeddings, ids=ids, metadata=metadata, upserter=upserter,
+                                  on_done=lambda ids=ids: stored(ids))
+            # Keep the keyword index in step with the vectors for hybrid retrieval
+            with span("ingest.bm25", size=len(batch)):
+                get_bm25_index().add(ids, batch, namespace=namespace, document_ids=[document_id] * len(ids))
+        upserter.flush()
+    except Exception as e:
+        errors.append(e)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+        upserter.close()
+
+    if errors:
+        raise errors[0]
+
+    elapsed = time.perf_counter() - start_time
+    print(f"Ingested {progress['pages']} pages, {progress['upserted']} chunks in {elapsed:.2f}s "
+          f"({progress['upserted'] / max(elapsed, 1e-9):.1f} chunks/sec, {progress['skipped']} unchanged)")
+    return {**progress, "chunk_ids": chunk_ids}
@@ -0,0 +1,152 @@
+import os
+from typing import Optional
+
+import numpy as np
+
+from ann_index import cluster_sums
+
+# Rows are scored in slices small enough for the temporaries to stay in cache
+BLOCK_ROWS = 4096
+
+
+class ScalarQuantizer:
+    """
+    Per-dimension int8 scalar quantization: each value becomes one byte on a
+    [min, max] grid learned from training data (4x smaller than float32).
+
+    The inner product with a query is computed straight from the codes:
+    q . x ~= q . low + (q * step) . code
+    """
+
+    kind = "int8"
+
+    def __init__(self):
+        self.low: Optional[np.ndarray] = None
+        self.step: Optional[np.ndarray] = None
+
+    @property
+    def code_size(self) -> int:
+        return len(self.low)
+
+    def train(self, vectors: np.ndarray) -> None:
+        self.low = vectors.min(axis=0).astype(np.float32)
+        high = vectors.max(axis=0).astype(np.float32)
+        self.step = np.maximum(high - self.low, 1e-12) / 255
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        codes = np.rint((np.asarray(vectors, dtype=np.float32) - self.low) / self.step)
+        return np.clip(codes, 0, 255).astype(np.uint8)
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        scaled = query * self.step
+        offset = float(query @ self.low)
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), BLOCK_ROWS):
+            out[start:start + BLOCK_ROWS] = codes[start:start + BLOCK_ROWS].astype(np.float32) @ scaled + offset
+        return out
+
+    def state(self) -> dict:
+        return {"low": self.low, "step": self.step}
+
+    def load_state(self, state) -> None:
+        self.low = state["low"]
+        self.step = state["step"]
+
+
+def _kmeans(vectors: np.ndarray, k: int, iterations: int, rng) -> np.ndarray:
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        # argmin |x - c|^2 == argmax (x . c - |c|^2 / 2)
+        assignments = np.argmax(vectors @ centroids.T - 0.5 * (centroids ** 2).sum(axis=1), axis=1)
+        sums, counts = cluster_sums(vectors, assignments, k)
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None]
+    return centroids
+
+
+class ProductQuantizer:
+    """
+    Product quantization: vectors are split into `m` sub-vectors and each is replaced
+    by the index of its nearest of 256 sub-centroids, i.e. `m` bytes per vector
+    (96 bytes instead of 3 KB for 768-d with the default m=96).
+
+    Scoring uses asymmetric distance computation: the query stays in float32 and a
+    (m, 256) table of sub-inner-products is looked up once per code.
+
+    :param m: Number of sub-vectors; must divide the embedding dimension.
+    """
+
+    kind = "pq"
+    ksub = 256
+
+    def __init__(self, m: int = 96):
+        self.m = m
+        self.codebooks: Optional[np.ndarray] = None
+
+    @property
+    def code_size(self) -> int:
+        return self.m
+
+    def train(self, vectors: np.ndarray, iterations: int = 10, sample_size: int = 16384) -> None:
+        dim = vectors.shape[1]
+        if dim % self.m:
+            raise ValueError(f"PQ sub-vector count {self.m} must divide the dimension {dim}")
+        rng = np.random.default_rng(0)
+        if len(vectors) > sample_size:
+            vectors = vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+        vectors = np.asarray(vectors, dtype=np.float32)
+        ksub = min(self.ksub, len(vectors))
+        dsub = dim // self.m
+        self.codebooks = np.stack([
+            _kmeans(np.ascontiguousarray(vectors[:, j * dsub:(j + 1) * dsub]), ksub, iterations, rng)
+            for j in range(self.m)
+        ])
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        dsub = self.codebooks.shape[2]
+        codes = np.empty((len(vectors), self.m), dtype=np.uint8)
+        half_norms = 0.5 * (self.codebooks ** 2).sum(axis=2)
+        for j in range(self.m):
+            sub = vectors[:, j * dsub:(j + 1) * dsub]
+            codes[:, j] = np.argmax(sub @ self.codebooks[j].T - half_norms[j], axis=1)
+        return codes
+
+    def scores(self, codes: np.ndarray, query: np.ndarray) -> np.ndarray:
+        dsub = self.codebooks.shape[2]
+        # tables[j, c] = query sub-vector j . codebook j centroid c
+        tables = np.einsum("jkd,jd->jk", self.codebooks, query.reshape(self.m, dsub))
+        flat = tables.ravel()
+        offsets = (np.arange(self.m) * tables.shape[1]).astype(np.intp)
+        out = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), BLOCK_ROWS):
+            block = codes[start:start + BLOCK_ROWS].astype(np.intp) + offsets
+            out[start:start + BLOCK_ROWS] = flat[block].sum(axis=1)
+        return out
+
+    def state(self) -> dict:
+        return {"codebooks": self.codebooks}
+
+    def load_state(self, state) -> None:
+        self.codebooks = state["codebooks"]
+        self.m = len(self.codebooks)
+
+
+def make_quantizer(kind: str, pq_subvectors: int = 96):
+    if kind == "int8":
+        return ScalarQuantizer()
+    if kind == "pq":
+        return ProductQuantizer(pq_subvectors)
+    raise ValueError(f"Unknown compression '{kind}', expected 'int8' or 'pq'")
+
+
+def save_quantizer(quantizer, path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.savez(path, kind=quantizer.kind, **quantizer.state())
+
+
+def load_quantizer(path: str):
+    with np.load(path) as state:
+        quantizer = make_quantizer(str(state["kind"]))
+        quantizer.load_state({key: state[key] for key in state.files if key != "kind"})
+    return quantizer
@@ -0,0 +1,53 @@
+import os
+from typing import List
+
+import numpy as np
+
+# "mmr" (Maximal Marginal Relevance over the candidates' embeddings) or "none"
+RERANK_MODE = os.getenv("RERANK_MODE", "mmr").lower()
+# Candidates retrieved before re-ranking down to the requested top_k
+RERANK_FETCH = int(os.getenv("RERANK_FETCH", "20"))
+# 1.0 ranks by relevance only, lower values penalise chunks similar to ones already chosen
+MMR_LAMBDA = float(os.getenv("MMR_LAMBDA", "0.7"))
+
+
+def _unit_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def mmr(query_vector: List[float], matches: List[dict], top_k: int, lambda_: float = MMR_LAMBDA) -> List[dict]:
+    """
+    Picks `top_k` of the best-first `matches` with Maximal Marginal Relevance: each pick
+    maximises lambda * (cosine similarity to the query) - (1 - lambda) * (highest cosine
+    similarity to a chunk already picked), so overlapping or near-duplicate chunks do not
+    fill the whole context.
+
+    The first pick is always the retriever's best match (in hybrid mode, the best fused
+    one). Similarities come from each match's "values", its stored embedding, so nothing
+    is embedded again; a match without values counts as unrelated to the query and to
+    every other chunk.
+    """
+    if len(matches) <= 1 or top_k <= 0:
+        return matches[:top_k]
+    query = _unit_rows(np.asarray(query_vector, dtype=np.float32).reshape(1, -1))[0]
+    vectors = np.zeros((len(matches), len(query)), dtype=np.float32)
+    for row, match in enumerate(matches):
+        if match.get("values") is not None:
+            vectors[row] = match["values"]
+    vectors = _unit_rows(vectors)
+    relevance = vectors @ query
+    similarity = vectors @ vectors.T
+
+    chosen = [0]
+    # Highest similarity of every candidate to the chunks chosen so far
+    redundancy = similarity[0].copy()
+    available = np.ones(len(matches), dtype=bool)
+    available[0] = False
+    while len(chosen) < min(top_k, len(matches)):
+        gain = np.where(available, lambda_ * relevance - (1 - lambda_) * redundancy, -np.inf)
+        best = int(np.argmax(gain))
+        chosen.append(best)
+        available[best] = False
+        np.maximum(redundancy, similarity[best], out=redundancy)
+    return [matches[index] for index in chosen]
@@ -0,0 +1,97 @@
+import os
+from typing import Dict, List, Optional
+
+from bm25 import get_bm25_index
+from reranker import RERANK_FETCH, RERANK_MODE, mmr
+from tracing import span
+from vectorstore import document_filter, fetch_values, search_matches
+
+# "dense" (vector search only) or "hybrid" (vector + BM25 fused with reciprocal rank fusion)
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid").lower()
+RETRIEVAL_MODES = ("dense", "hybrid")
+# How many candidates each retriever contributes before fusion
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", "20"))
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings: List[List[dict]], k: int = RRF_K) -> List[dict]:
+    """
+    Merges several best-first match lists: each match scores sum(1 / (k + rank)) over
+    the lists it appears in, so chunks ranked well by both retrievers rise to the top
+    without having to calibrate BM25 scores against cosine similarities.
+    """
+    fused: Dict[str, float] = {}
+    matches: Dict[str, dict] = {}
+    for ranking in rankings:
+        for rank, match in enumerate(ranking, start=1):
+            fused[match["id"]] = fused.get(match["id"], 0.0) + 1.0 / (k + rank)
+            matches.setdefault(match["id"], match)
+    order = sorted(fused, key=fused.get, reverse=True)
+    return [{**matches[match_id], "score": fused[match_id]} for match_id in order]
+
+
+def hybrid_search(query: str, query_vector: List[float], top_k: int = 3, namespace: str = "",
+                  document_ids: Optional[List[str]] = None, candidates: int = HYBRID_CANDIDATES,
+                  include_values: bool = False) -> List[dict]:
+    """
+    Dense and BM25 retrieval over the same namespace/documents, fused with RRF.
+    """
+    dense = search_matches(query_vector, top_k=candidates, namespace=namespace,
+                           filter=document_filter(document_ids), include_values=include_values)
+    with span("bm25.search"):
+        keyword = get_bm25_index().search(query, top_k=candidates, namespace=namespace, document_ids=document_ids)
+    with span("retrieve.fuse"):
+        return reciprocal_rank_fusion([list(dense), keyword])[:top_k]
+
+
+def retrieve_candidates(query: str, query_vector: List[float], top_k: int = RERANK_FETCH, namespace: str = "",
+                        document_ids: Optional[List[str]] = None, mode: str = RETRIEVAL_MODE,
+                        include_values: bool = False) -> List[dict]:
+    """
+    Best-first `top_k` matches before re-ranking. With `include_values`, every match that
+    is still stored carries its embedding as "values".
+    """
+    if mode == "hybrid":
+        matches = hybrid_search(query, query_vector, top_k, namespace, document_ids,
+                                candidates=max(HYBRID_CANDIDATES, top_k), include_values=include_values)
+    else:
+        matches = list(search_matches(query_vector, top_k=top_k, namespace=namespace,
+                                      filter=document_filter(document_ids), include_values=include_values))
+    if not include_values:
+        return matches
+
+    # Keyword-only matches from BM25 come without embeddings
+    missing = [match["id"] for match in matches if match.get("values") is None]
+    if missing:
+        values = fetch_values(missing, namespace)
+        matches = [match if match.get("values") is not None or match["id"] not in values
+                   else {**match, "values": values[match["id"]]} for match in matches]
+    return matches
+
+
+def rerank_matches(query_vector: List[float], candidates: List[dict], top_k: int = 3,
+                   rerank: str = RERANK_MODE) -> List[dict]:
+    if rerank != "mmr" or len(candidates) <= top_k:
+        return candidates[:top_k]
+    with span("retrieve.rerank", candidates=len(candidates)):
+        return mmr(query_vector, candidates, top_k)
+
+
+def retrieve(query: str, query_vector: List[float], top_k: int = 3, namespace: str = "",
+             document_ids: Optional[List[str]] = None, mode: str = RETRIEVAL_MODE,
+             rerank: str = RERANK_MODE) -> List[dict]:
+    """
+    Best `top_k` matches for the query. With rerank="mmr", RERANK_FETCH candidates are
+    retrieved with their embeddings and re-ranked with Maximal Marginal Relevance, so
+    near-duplicate chunks do not crowd out the rest.
+    """
+    if rerank != "mmr":
+        return retrieve_candidates(query, query_vector, top_k, namespace, document_ids, mode)
+    candidates = retrieve_candidates(query, query_vector, max(top_k, RERANK_FETCH), namespace, document_ids,
+                                     mode, include_values=True)
+    return rerank_matches(query_vector, candidates, top_k, rerank)
+
+
+def matches_to_context(matches: List[dict]) -> str:
+    contexts = [match["metadata"]["text"] for match in matches if "text" in match["metadata"]]
+    return "\n\n".join(contexts)
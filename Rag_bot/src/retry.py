@@ -0,0 +1,95 @@
+import random
+import threading
+import time
+from typing import Callable, TypeVar
+
+from tracing import increment, span
+
+T = TypeVar("T")
+
+
+def is_rate_limited(error: Exception) -> bool:
+    """
+    True for Gemini quota errors, whether raised as ResourceExhausted or a plain HTTP 429.
+
+    Matched by class name so the (slow to import) Google API core is not loaded just for this.
+    """
+    return any(cls.__name__ == "ResourceExhausted" for cls in type(error).__mro__) or "429" in str(error)
+
+
+# HTTP statuses worth retrying: throttling and server-side hiccups
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+
+def is_transient(error: Exception) -> bool:
+    """
+    True for errors a later attempt may not hit: rate limits, 5xx responses (Pinecone's
+    exceptions carry a `status_code`, or `status` in older clients) and dropped or
+    timed-out connections.
+    """
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if is_rate_limited(error) or status in TRANSIENT_STATUSES:
+        return True
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    # urllib3's errors, matched by name like ResourceExhausted above
+    return any(cls.__name__ in ("ProtocolError", "MaxRetryError", "NewConnectionError", "ReadTimeoutError")
+               for cls in type(error).__mro__)
+
+
+def backoff_delay(attempt: int, base_delay: float = 5.0) -> float:
+    """
+    Exponential backoff (5s, 10s, 20s, ...) with equal jitter, so parallel workers
+    that were throttled together do not all retry at the same instant.
+    """
+    wait_time = base_delay * (2 ** attempt)
+    return wait_time / 2 + random.uniform(0, wait_time / 2)
+
+
+def call_with_retry(fn: Callable[[], T], max_retries: int = 3, base_delay: float = 5.0,
+                    retry_on: Callable[[Exception], bool] = is_rate_limited) -> T:
+    """
+    Calls `fn`, retrying with jittered backoff while it fails with an error `retry_on`
+    accepts (by default, rate limit errors). Other errors, and the last retried one, are re-raised.
+    """
+    for attempt in range(max_retries):
+        try:
+            return fn()
+        except Exception as e:
+            if not retry_on(e):
+                raise
+            if attempt == max_retries - 1:
+                increment("retry.exhausted")
+                raise
+            rate_limited = is_rate_limited(e)
+            increment("retry.rate_limited" if rate_limited else "retry.transient")
+            wait_time = backoff_delay(attempt, base_delay)
+            print(f"{'Quota exceeded' if rate_limited else type(e).__name__}. Retrying in {wait_time:.1f} seconds...")
+            with span("retry.backoff", attempt=attempt):
+                time.sleep(wait_time)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens are added per second, up to `capacity`.
+    `acquire` blocks until a token is available.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0) -> None:
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= tokens:
+                    self.tokens -= tokens
+                    return
+                wait_time = (tokens - self.tokens) / self.rate
+            time.sleep(wait_time)
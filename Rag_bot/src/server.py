@@ -0,0 +1,411 @@
+"""
+Headless HTTP API and batch mode for the RAG pipeline. Run from Rag_bot/src:
+
+    python server.py serve --port 8000
+    python server.py serve --port 8000 --async
+    python server.py batch questions.jsonl answers.jsonl --workers 8
+
+Endpoints:
+
+    GET  /health
+    GET  /metrics        (per-stage latency percentiles and counters, see tracing.py)
+    POST /ingest?name=<document name>&namespace=<namespace>   (body: the PDF file)
+    POST /jobs?name=<document name>&namespace=<namespace>     (same, but queued: returns a job id at once)
+    GET  /jobs?namespace=<namespace>, GET /jobs/<id>          (status and progress counters)
+    POST /jobs/<id>/cancel, POST /jobs/<id>/resume
+    POST /query          (body: {"query", "namespace", "document_ids", "mode"})
+    POST /stream-query   (same body; the answer is streamed back as chunked text/plain)
+
+`--async` serves the same endpoints from one asyncio event loop: queries go through
+async_query (speculative retrieval prefetch, blocking SDK calls on one bounded pool), so
+concurrent chat sessions do not each hold a thread. Ingests still run on threads.
+
+Batch input is one JSON object per line with the same fields as /query; each output
+line holds the answer, the context and the seconds spent in every stage.
+"""
+import argparse
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from pypdf.errors import PyPdfError
+
+from async_query import aprocess_user_query, astream_user_query
+from dataprocessor import run as process_pdf
+from embed_scheduler import QueryBatcher
+from jobs import get_job_queue
+from QueryProcessor import process_user_query, stream_user_query
+from retrieval import RETRIEVAL_MODE, RETRIEVAL_MODES
+from tracing import dump_metrics, snapshot
+
+# Requests handled at once (queries and ingests); the rest wait for a slot
+SERVER_MAX_CONCURRENCY = int(os.getenv("SERVER_MAX_CONCURRENCY", "8"))
+# Seconds a request may wait for a slot before getting a 503
+SERVER_QUEUE_TIMEOUT = float(os.getenv("SERVER_QUEUE_TIMEOUT", "30"))
+
+# Namespaces double as directory names for the local index, keep them path-safe
+NAMESPACE_PATTERN = re.compile(r"[A-Za-z0-9_-]*")
+
+_batcher = QueryBatcher()
+_slots = threading.BoundedSemaphore(SERVER_MAX_CONCURRENCY)
+
+
+def _query_arguments(request: dict) -> dict:
+    if not isinstance(request, dict):
+        raise ValueError("the request body must be a JSON object")
+    query = request.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError("'query' must be a non-empty string")
+    namespace = request.get("namespace", "")
+    if not isinstance(namespace, str) or not NAMESPACE_PATTERN.fullmatch(namespace):
+        raise ValueError("'namespace' must be a string of letters, digits, '_' and '-'")
+    document_ids = request.get("document_ids")
+    # A bare string would otherwise be searched as a list of its characters
+    if document_ids is not None and (not isinstance(document_ids, list)
+                                     or not all(isinstance(document_id, str) for document_id in document_ids)):
+        raise ValueError("'document_ids' must be a list of strings")
+    # Anything but "hybrid" would otherwise quietly run dense retrieval
+    mode = request.get("mode", RETRIEVAL_MODE)
+    if mode not in RETRIEVAL_MODES:
+        raise ValueError(f"'mode' must be one of {', '.join(RETRIEVAL_MODES)}")
+    return {"query": query, "namespace": namespace, "document_ids": document_ids or None, "mode": mode}
+
+
+def answer_query(request: dict) -> dict:
+    """
+    Answers one /query request; the query embedding is batched with concurrent requests.
+
+    :return: {"query", "answer", "context", "timings"}.
+    """
+    arguments = _query_arguments(request)
+    timings: Dict[str, float] = {}
+    start = time.perf_counter()
+    query_vector = _batcher.embed(arguments["query"])
+    timings["embed"] = time.perf_counter() - start
+    answer, context = process_user_query(**arguments, query_vector=query_vector, timings=timings)
+    timings["total"] = time.perf_counter() - start
+    return {"query": arguments["query"], "answer": answer, "context": context, "timings": timings}
+
+
+def _get_response(url) -> Tuple[int, dict]:
+    path = url.path
+    if path == "/metrics":
+        return 200, snapshot()
+    if path == "/jobs":
+        namespace = parse_qs(url.query).get("namespace", [None])[0]
+        return 200, {"jobs": get_job_queue().list_jobs(namespace)}
+    if path.startswith("/jobs/"):
+        job = get_job_queue().get(path[len("/jobs/"):])
+        return (200, job) if job is not None else (404, {"error": "no such job"})
+    if path != "/health":
+        return 404, {"error": "not found"}
+    return 200, {
+        "status": "ok",
+        "max_concurrency": SERVER_MAX_CONCURRENCY,
+        "embedded_queries": _batcher.requests,
+        "embedding_batches": _batcher.batches,
+    }
+
+
+def _job_action_response(path: str) -> Optional[Tuple[int, dict]]:
+    # POST /jobs/<id>/cancel and /resume; None for any other path
+    job_action = re.fullmatch(r"/jobs/([0-9a-f]+)/(cancel|resume)", path)
+    if job_action is None:
+        return None
+    queue = get_job_queue()
+    job_id, action = job_action.groups()
+    if queue.get(job_id) is None:
+        return 404, {"error": "no such job"}
+    changed = queue.cancel(job_id) if action == "cancel" else queue.resume(job_id)
+    return 200 if changed else 409, queue.get(job_id)
+
+
+def _upload_arguments(body: bytes, params: dict):
+    name = params.get("name", [""])[0]
+    namespace = params.get("namespace", [""])[0]
+    if not name:
+        raise ValueError("the 'name' query parameter is required")
+    if not NAMESPACE_PATTERN.fullmatch(namespace):
+        raise ValueError("'namespace' may only contain letters, digits, '_' and '-'")
+    # PDF readers accept the header anywhere in the first kilobyte
+    if b"%PDF-" not in body[:1024]:
+        raise ValueError("the request body must be the PDF file")
+    return name, namespace
+
+
+def submit_job(body: bytes, params: dict) -> dict:
+    name, namespace = _upload_arguments(body, params)
+    job_id = get_job_queue().submit(memoryview(body), document_name=name, namespace=namespace)
+    return get_job_queue().get(job_id)
+
+
+def ingest(body: bytes, params: dict) -> dict:
+    name, namespace = _upload_arguments(body, params)
+    # Parsed straight from the request body, no temporary file
+    try:
+        return process_pdf(memoryview(body), document_name=name, namespace=namespace)
+    except PyPdfError as e:
+        raise ValueError(f"the PDF could not be read: {e}") from e
+
+
+class RAGRequestHandler(BaseHTTPRequestHandler):
+    # HTTP/1.1 for chunked transfer encoding on /stream-query
+    protocol_version = "HTTP/1.1"
+
+    def _send_json(self, status: int, payload: dict) -> None:
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_body(self) -> bytes:
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        self._send_json(*_get_response(urlparse(self.path)))
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        body = self._read_body()
+        handlers = {"/ingest": self._ingest, "/jobs": self._submit_job, "/query": self._query,
+                    "/stream-query": self._stream_query}
+        handler = handlers.get(url.path)
+        # Only flips the job's state, no need to wait for a slot
+        job_action = _job_action_response(url.path)
+        if job_action is not None:
+            self._send_json(*job_action)
+            return
+        if handler is None:
+            self._send_json(404, {"error": "not found"})
+            return
+
+        if not _slots.acquire(timeout=SERVER_QUEUE_TIMEOUT):
+            self._send_json(503, {"error": "server busy, try again later"})
+            return
+        try:
+            handler(body, parse_qs(url.query))
+        except ValueError as e:
+            self._send_json(400, {"error": str(e)})
+        except Exception as e:
+            self._send_json(500, {"error": str(e)})
+        finally:
+            _slots.release()
+
+    def _submit_job(self, body: bytes, params: dict) -> None:
+        self._send_json(202, submit_job(body, params))
+
+    def _ingest(self, body: bytes, params: dict) -> None:
+        self._send_json(200, ingest(body, params))
+
+    def _query(self, body: bytes, params: dict) -> None:
+        self._send_json(200, answer_query(json.loads(body or b"{}")))
+
+    def _stream_query(self, body: bytes, params: dict) -> None:
+        arguments = _query_arguments(json.loads(body or b"{}"))
+        query_vector = _batcher.embed(arguments["query"])
+        answer_pieces, _ = stream_user_query(**arguments, query_vector=query_vector)
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; charset=utf-8")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for piece in answer_pieces:
+                data = piece.encode("utf-8")
+                if data:
+                    self.wfile.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                    self.wfile.flush()
+        except Exception as e:
+            # The status is already sent, so a failure mid-answer just ends the stream
+            print(f"Stream for {arguments['query']!r} aborted: {e}")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+async def _aembed(query: str) -> List[float]:
+    # Batched with the other sessions' queries, awaited without holding a thread
+    return await asyncio.wrap_future(_batcher.submit(query))
+
+
+def _http_head(status: int, headers: Dict[str, str]) -> bytes:
+    lines = [f"HTTP/1.1 {status} {HTTPStatus(status).phrase}"] + [f"{name}: {value}" for name, value in headers.items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+
+async def _write_json(writer: asyncio.StreamWriter, status: int, payload: dict) -> None:
+    body = json.dumps(payload).encode("utf-8")
+    writer.write(_http_head(status, {"Content-Type": "application/json", "Content-Length": str(len(body))}) + body)
+    await writer.drain()
+
+
+async def _astream_query(writer: asyncio.StreamWriter, body: bytes) -> None:
+    arguments = _query_arguments(json.loads(body or b"{}"))
+    answer_pieces, _ = await astream_user_query(**arguments, embed=_aembed)
+
+    writer.write(_http_head(200, {"Content-Type": "text/plain; charset=utf-8", "Transfer-Encoding": "chunked"}))
+    try:
+        async for piece in answer_pieces:
+            data = piece.encode("utf-8")
+            if data:
+                writer.write(f"{len(data):X}\r\n".encode("ascii") + data + b"\r\n")
+                await writer.drain()
+    except Exception as e:
+        # The status is already sent, so a failure mid-answer just ends the stream
+        print(f"Stream for {arguments['query']!r} aborted: {e}")
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+
+
+async def _arespond(writer: asyncio.StreamWriter, method: str, url, body: bytes) -> None:
+    loop = asyncio.get_running_loop()
+    params = parse_qs(url.query)
+    try:
+        if method == "GET":
+            # The job table is SQLite: read off the event loop
+            await _write_json(writer, *await loop.run_in_executor(None, _get_response, url))
+        elif method != "POST":
+            await _write_json(writer, 405, {"error": "method not allowed"})
+        elif url.path == "/query":
+            arguments = _query_arguments(json.loads(body or b"{}"))
+            timings: Dict[str, float] = {}
+            start = time.perf_counter()
+            answer, context = await aprocess_user_query(**arguments, embed=_aembed, timings=timings)
+            timings["total"] = time.perf_counter() - start
+            await _write_json(writer, 200, {"query": arguments["query"], "answer": answer, "context": context,
+                                            "timings": timings})
+        elif url.path == "/stream-query":
+            await _astream_query(writer, body)
+        elif url.path in ("/ingest", "/jobs"):
+            # Ingests are blocking end to end; they run on the loop's default thread pool,
+            # apart from the query pool
+            handler, status = (ingest, 200) if url.path == "/ingest" else (submit_job, 202)
+            await _write_json(writer, status, await loop.run_in_executor(None, handler, body, params))
+        else:
+            job_action = await loop.run_in_executor(None, _job_action_response, url.path)
+            await _write_json(writer, *(job_action or (404, {"error": "not found"})))
+    except ValueError as e:
+        await _write_json(writer, 400, {"error": str(e)})
+    except Exception as e:
+        await _write_json(writer, 500, {"error": str(e)})
+
+
+async def _ahandle_connection(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+    # HTTP/1.1 with keep-alive: requests are answered in turn until the client closes
+    try:
+        while True:
+            request_line = (await reader.readline()).decode("latin-1").split()
+            if len(request_line) != 3:
+                break
+            method, target, _ = request_line
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode("latin-1")
+                if not line.strip():
+                    break
+                name, _, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            await _arespond(writer, method, urlparse(target), body)
+            if headers.get("connection", "").lower() == "close":
+                break
+    except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _aserve(host: str, port: int) -> None:
+    server = await asyncio.start_server(_ahandle_connection, host, port)
+    print(f"Serving RAG API on http://{host}:{port} (asyncio)")
+    async with server:
+        await server.serve_forever()
+
+
+def serve(host: str = "127.0.0.1", port: int = 8000, use_async: bool = False) -> None:
+    if use_async:
+        try:
+            asyncio.run(_aserve(host, port))
+        except KeyboardInterrupt:
+            pass
+        return
+    server = ThreadingHTTPServer((host, port), RAGRequestHandler)
+    print(f"Serving RAG API on http://{host}:{port} (max {SERVER_MAX_CONCURRENCY} concurrent requests)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def run_batch(input_path: str, output_path: str, workers: int = SERVER_MAX_CONCURRENCY,
+              metrics_path: Optional[str] = None) -> None:
+    """
+    Answers every question of a JSONL file with `workers` in parallel and writes one
+    result per line, in input order. A failed question gets an "error" instead of an answer.
+    If `metrics_path` is set, the latency histograms of the run are dumped there as JSON.
+    """
+    with open(input_path, encoding="utf-8") as f:
+        requests = [json.loads(line) for line in f if line.strip()]
+
+    def answer(request: dict) -> dict:
+        try:
+            return answer_query(request)
+        except Exception as e:
+            return {"query": request.get("query") if isinstance(request, dict) else None, "error": str(e)}
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(answer, requests))
+    elapsed = time.perf_counter() - start
+
+    with open(output_path, "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result) + "\n")
+
+    answered = [result for result in results if "error" not in result]
+    print(f"Answered {len(answered)}/{len(results)} questions in {elapsed:.2f}s "
+          f"({len(results) / max(elapsed, 1e-9):.1f} questions/sec, "
+          f"{_batcher.batches} embedding requests)")
+    stages = sorted({stage for result in answered for stage in result["timings"]})
+    for stage in stages:
+        samples = [result["timings"][stage] for result in answered if stage in result["timings"]]
+        print(f"  {stage:12s} mean={sum(samples) / len(samples) * 1000:8.1f}ms  max={max(samples) * 1000:8.1f}ms")
+    if metrics_path:
+        dump_metrics(metrics_path)
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("serve", help="run the HTTP API")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8000)
+    p.add_argument("--async", dest="use_async", action="store_true",
+                   help="serve from one asyncio event loop instead of a thread per request")
+
+    p = sub.add_parser("batch", help="answer a JSONL file of questions")
+    p.add_argument("input", help="JSONL file, one {\"query\": ...} per line")
+    p.add_argument("output", help="where to write the JSONL results")
+    p.add_argument("--workers", type=int, default=SERVER_MAX_CONCURRENCY)
+    p.add_argument("--metrics", help="also write latency histograms (JSON) to this file")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        serve(args.host, args.port, args.use_async)
+    elif args.command == "batch":
+        run_batch(args.input, args.output, args.workers, args.metrics)
+
+
+if __name__ == "__main__":
+    main()
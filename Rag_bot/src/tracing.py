@@ -0,0 +1,121 @@
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from typing import Deque, Dict, List, Optional
+
+# Latest samples kept per span name for the percentiles
+TRACE_MAX_SAMPLES = int(os.getenv("TRACE_MAX_SAMPLES", "10000"))
+# Latest finished spans kept with their attributes, for inspecting single requests
+TRACE_RECENT_SPANS = int(os.getenv("TRACE_RECENT_SPANS", "500"))
+
+_lock = threading.Lock()
+_samples: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=TRACE_MAX_SAMPLES))
+_counters: Dict[str, int] = defaultdict(int)
+_recent: Deque[dict] = deque(maxlen=TRACE_RECENT_SPANS)
+_current: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    def __init__(self, name: str, parent: Optional["Span"], attributes: dict):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.start = time.perf_counter()
+        self.duration = 0.0
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Times the enclosed block as a span called `name`. Spans opened inside it (in the
+    same thread or task) record it as their parent; the duration goes into the
+    histogram of `name` and is available as `.duration` once the block exits.
+    """
+    current = Span(name, _current.get(), attributes)
+    token = _current.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        _current.reset(token)
+        current.duration = time.perf_counter() - current.start
+        record(name, current.duration, current)
+
+
+def record(name: str, seconds: float, finished: Optional[Span] = None) -> None:
+    """
+    Adds a duration measured elsewhere (e.g. time to first token) to the histogram of `name`.
+    """
+    parent = finished.parent if finished is not None else _current.get()
+    entry = {
+        "name": name,
+        "parent": parent.name if parent is not None else None,
+        "seconds": seconds,
+        "at": time.time(),
+        **(finished.attributes if finished is not None else {}),
+    }
+    with _lock:
+        _samples[name].append(seconds)
+        _recent.append(entry)
+
+
+def increment(name: str, amount: int = 1) -> None:
+    """
+    Counts an event, such as a retry or a cache hit.
+    """
+    with _lock:
+        _counters[name] += amount
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def snapshot() -> dict:
+    """
+    Histogram summary (count, mean, p50/p95/p99, max in ms) per span name, plus counters.
+    """
+    with _lock:
+        samples = {name: sorted(values) for name, values in _samples.items() if values}
+        counters = dict(_counters)
+    spans = {
+        name: {
+            "count": len(values),
+            "mean_ms": sum(values) / len(values) * 1000,
+            "p50_ms": _percentile(values, 50) * 1000,
+            "p95_ms": _percentile(values, 95) * 1000,
+            "p99_ms": _percentile(values, 99) * 1000,
+            "max_ms": values[-1] * 1000,
+        }
+        for name, values in sorted(samples.items())
+    }
+    return {"spans": spans, "counters": counters}
+
+
+def recent_spans(limit: int = 50) -> List[dict]:
+    with _lock:
+        return list(_recent)[-limit:]
+
+
+def dump_metrics(path: str) -> None:
+    """
+    Writes the snapshot and the recent spans to a JSON file.
+    """
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({**snapshot(), "recent": recent_spans(TRACE_RECENT_SPANS)}, f, indent=2)
+
+
+def reset() -> None:
+    with _lock:
+        _samples.clear()
+        _counters.clear()
+        _recent.clear()
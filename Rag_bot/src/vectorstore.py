@@ -1,45 +1,314 @@
-from pinecone import Pinecone
+import json
 import os
-from dotenv import load_dotenv
-from typing import List
-
-# Load environment variables from .env file
-load_dotenv()
-
-# Initialize Pinecone client
-pinecone_client = Pinecone(api_key=os.getenv("PINECONE_API_KEY"))
-index = pinecone_client.Index(os.getenv("PINECONE_INDEX_NAME"))
-
-def store_in_pinecone(chunks: List[str], embeddings: List[List[float]], namespace: str = ""):
-    vectors_to_upsert = []
-    
-    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
-        vector_data = {
-            "id": f"chunk_{i}",
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Optional
+
+from clients import get_pinecone_index
+from retry import call_with_retry, is_transient
+from tracing import span
+
+# "pinecone" (default) or "local" for the in-process NumPy index
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone").lower()
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", ".cache/vector_index")
+
+# "flat" for exact search, "ivf" for the approximate inverted-file index
+LOCAL_INDEX_TYPE = os.getenv("LOCAL_INDEX_TYPE", "flat").lower()
+IVF_NLIST = int(os.getenv("IVF_NLIST", "1024"))
+IVF_NPROBE = int(os.getenv("IVF_NPROBE", "16"))
+IVF_TRAIN_THRESHOLD = int(os.getenv("IVF_TRAIN_THRESHOLD", "50000"))
+
+# "none", "int8" (4x smaller) or "pq" (product quantization, PQ_SUBVECTORS bytes per vector);
+# compressed scores are re-ranked against the full-precision vectors on disk
+LOCAL_COMPRESSION = os.getenv("LOCAL_COMPRESSION", "none").lower()
+PQ_SUBVECTORS = int(os.getenv("PQ_SUBVECTORS", "96"))
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", "100"))
+
+# Upsert requests in flight at once; past that, callers wait (backpressure on ingestion)
+UPSERT_MAX_IN_FLIGHT = int(os.getenv("UPSERT_MAX_IN_FLIGHT", "4"))
+# Pinecone rejects upserts over 2 MB or 1000 vectors; requests are packed up to these limits
+UPSERT_MAX_BYTES = int(os.getenv("UPSERT_MAX_BYTES", str(1_800_000)))
+UPSERT_MAX_VECTORS = int(os.getenv("UPSERT_MAX_VECTORS", "1000"))
+UPSERT_MAX_RETRIES = int(os.getenv("UPSERT_MAX_RETRIES", "4"))
+UPSERT_RETRY_DELAY = float(os.getenv("UPSERT_RETRY_DELAY", "0.5"))
+
+
+class PineconeStore:
+    """
+    Thin wrapper so the Pinecone index and LocalVectorStore share one upsert/query shape.
+    """
+
+    def __init__(self):
+        # One shared client and connection pool per process, created on first use
+        self.index = get_pinecone_index()
+
+    def upsert(self, vectors: List[dict], namespace: str = "") -> None:
+        self.index.upsert(vectors=vectors, namespace=namespace)
+
+    def delete(self, ids: List[str], namespace: str = "") -> None:
+        # Pinecone accepts at most 1000 ids per delete request
+        for i in range(0, len(ids), 1000):
+            self.index.delete(ids=ids[i:i + 1000], namespace=namespace)
+
+    def query(self, vector: List[float], top_k: int = 3, namespace: str = "", filter: Optional[dict] = None,
+              include_values: bool = False) -> list:
+        results = self.index.query(
+            vector=vector,
+            top_k=top_k,
+            include_metadata=True,
+            include_values=include_values,
+            namespace=namespace,
+            filter=filter
+        )
+        # Plain dicts, like LocalVectorStore returns
+        matches = []
+        for match in results["matches"]:
+            entry = {"id": match["id"], "score": match["score"], "metadata": match["metadata"] or {}}
+            if include_values:
+                entry["values"] = match["values"]
+            matches.append(entry)
+        return matches
+
+    def fetch(self, ids: List[str], namespace: str = "") -> dict:
+        # Pinecone accepts at most 1000 ids per fetch request
+        values = {}
+        for i in range(0, len(ids), 1000):
+            response = self.index.fetch(ids=ids[i:i + 1000], namespace=namespace)
+            values.update({vector_id: vector.values for vector_id, vector in response.vectors.items()})
+        return values
+
+
+_store = None
+
+
+def get_vector_store():
+    """
+    Returns the configured vector store, creating it on first use.
+    """
+    global _store
+    if _store is None:
+        if VECTOR_BACKEND == "local":
+            from local_vectorstore import LocalVectorStore
+            _store = LocalVectorStore(
+                LOCAL_INDEX_DIR,
+                index_type=LOCAL_INDEX_TYPE,
+                nlist=IVF_NLIST,
+                nprobe=IVF_NPROBE,
+                train_threshold=IVF_TRAIN_THRESHOLD,
+                compression=LOCAL_COMPRESSION,
+                pq_subvectors=PQ_SUBVECTORS,
+                rerank_candidates=RERANK_CANDIDATES,
+            )
+        else:
+            _store = PineconeStore()
+    return _store
+
+
+def set_vector_store(store) -> None:
+    """
+    Replaces the vector store, e.g. with LocalVectorStore() for offline runs.
+    """
+    global _store
+    _store = store
+
+
+def payload_bytes(vector: dict) -> int:
+    """
+    Upper estimate of a vector's size in an upsert request body (JSON floats take up
+    to ~20 characters each).
+    """
+    return len(vector["id"]) + 21 * len(vector["values"]) + len(json.dumps(vector.get("metadata", {}))) + 64
+
+
+def pack_upserts(vectors: Iterable[dict], max_bytes: int = UPSERT_MAX_BYTES,
+                 max_vectors: int = UPSERT_MAX_VECTORS) -> Iterator[List[dict]]:
+    """
+    Groups vectors into upsert requests of at most `max_bytes` (estimated) and
+    `max_vectors`, so requests are as large as allowed whatever the embedding size
+    and chunk length.
+    """
+    request, size = [], 0
+    for vector in vectors:
+        vector_size = payload_bytes(vector)
+        if request and (size + vector_size > max_bytes or len(request) == max_vectors):
+            yield request
+            request, size = [], 0
+        request.append(vector)
+        size += vector_size
+    if request:
+        yield request
+
+
+class Upserter:
+    """
+    Sends upserts from a pool of `max_in_flight` threads. submit() returns as soon as
+    its requests are handed to the pool, and blocks while `max_in_flight` requests are
+    outstanding, so a fast producer is slowed to the store's pace instead of queueing
+    without bound. Requests are packed by payload size (see pack_upserts) and retried
+    on transient errors; the first error that survives its retries is raised by the
+    next submit() or by flush().
+
+    :param namespace: Vector store namespace to upsert into.
+    :param max_in_flight: Upsert requests sent concurrently.
+    """
+
+    def __init__(self, namespace: str = "", max_in_flight: int = UPSERT_MAX_IN_FLIGHT,
+                 max_bytes: int = UPSERT_MAX_BYTES, max_vectors: int = UPSERT_MAX_VECTORS,
+                 max_retries: int = UPSERT_MAX_RETRIES, retry_delay: float = UPSERT_RETRY_DELAY):
+        self.namespace = namespace
+        self.max_bytes = max_bytes
+        self.max_vectors = max_vectors
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.store = get_vector_store()
+        self.executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="upsert")
+        self.slots = threading.BoundedSemaphore(max_in_flight)
+        self.lock = threading.Lock()
+        self.pending = []
+        self.errors = []
+
+    def _raise_error(self) -> None:
+        if self.errors:
+            raise self.errors[0]
+
+    def _send(self, request: List[dict], remaining: List[int], on_done: Optional[Callable[[], None]]) -> None:
+        # Errors are recorded rather than raised, and on_done runs before the future
+        # completes, so flush() returning means every callback has run
+        try:
+            with span("vector.upsert", size=len(request)):
+                call_with_retry(lambda: self.store.upsert(vectors=request, namespace=self.namespace),
+                                max_retries=self.max_retries, base_delay=self.retry_delay, retry_on=is_transient)
+            with self.lock:
+                remaining[0] -= 1
+                done = remaining[0] == 0
+            if done and on_done is not None:
+                on_done()
+        except Exception as e:
+            with self.lock:
+                self.errors.append(e)
+        finally:
+            self.slots.release()
+
+    def submit(self, vectors: Iterable[dict], on_done: Optional[Callable[[], None]] = None) -> None:
+        """
+        Queues the vectors for upserting; `on_done` is called (from a pool thread) once
+        all of them are stored.
+        """
+        self._raise_error()
+        requests = list(pack_upserts(vectors, self.max_bytes, self.max_vectors))
+        # Requests of this submit() not yet stored
+        remaining = [len(requests)]
+        for request in requests:
+            self.slots.acquire()
+            if self.errors:
+                self.slots.release()
+                self._raise_error()
+            future = self.executor.submit(self._send, request, remaining, on_done)
+            with self.lock:
+                self.pending = [pending for pending in self.pending if not pending.done()] + [future]
+        if not requests and on_done is not None:
+            on_done()
+
+    def flush(self) -> None:
+        """
+        Waits for every submitted upsert, then raises the first error, if any.
+        """
+        with self.lock:
+            pending = list(self.pending)
+        for future in pending:
+            future.result()
+        self._raise_error()
+
+    def close(self) -> None:
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self) -> "Upserter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+def _vectors(chunks: List[str], embeddings: List[List[float]], start_index: int,
+             ids: Optional[List[str]], metadata: Optional[List[dict]]) -> Iterator[dict]:
+    for i, (chunk, embedding) in enumerate(zip(chunks, embeddings), start=start_index):
+        position = i - start_index
+        yield {
+            "id": ids[position] if ids is not None else f"chunk_{i}",
             "values": embedding,
             "metadata": {
                 "text": chunk,
-                "chunk_index": i
+                "chunk_index": i,
+                **(metadata[position] if metadata is not None else {})
             }
         }
-        vectors_to_upsert.append(vector_data)
-
-    # Upsert vectors in batches (Pinecone recommends batch size of 100)
-    batch_size = 100
-    for i in range(0, len(vectors_to_upsert), batch_size):
-        batch = vectors_to_upsert[i:i + batch_size]
-        index.upsert(vectors=batch, namespace=namespace)
-
-def search_in_pinecone(query_vector: List[float], top_k: int = 3, namespace: str = "") -> str:
-    """
-    Searches Pinecone for similar vectors and returns the concatenated text context.
-    """
-    results = index.query(
-        vector=query_vector,
-        top_k=top_k,
-        include_metadata=True,
-        namespace=namespace
-    )
-    
-    contexts = [match["metadata"]["text"] for match in results["matches"] if "text" in match["metadata"]]
-    return "\n\n".join(contexts)
\ No newline at end of file
+
+
+def store_in_pinecone(chunks: List[str], embeddings: List[List[float]], namespace: str = "", start_index: int = 0,
+                      ids: Optional[List[str]] = None, metadata: Optional[List[dict]] = None,
+                      upserter: Optional[Upserter] = None, on_done: Optional[Callable[[], None]] = None):
+    """
+    Upserts chunks with their embeddings. `start_index` is the position of the first
+    chunk in its document, so a document can be stored in several calls.
+
+    `ids` default to chunk_{index}; entries of `metadata` are merged into each
+    vector's {"text", "chunk_index"} metadata.
+
+    Without an `upserter`, the vectors are sent concurrently and stored when this returns.
+    With one (as the ingestion pipeline does), they are only queued on it, in its namespace,
+    and `on_done` is called once they are stored.
+    """
+    vectors = _vectors(chunks, embeddings, start_index, ids, metadata)
+    if upserter is not None:
+        upserter.submit(vectors, on_done)
+        return
+    with Upserter(namespace) as own_upserter:
+        own_upserter.submit(vectors, on_done)
+        own_upserter.flush()
+
+def delete_from_pinecone(ids: List[str], namespace: str = "") -> None:
+    if ids:
+        get_vector_store().delete(list(ids), namespace=namespace)
+
+def document_filter(document_ids: Optional[List[str]]) -> Optional[dict]:
+    """
+    Metadata filter restricting a search to the given documents (None means all).
+    """
+    if not document_ids:
+        return None
+    return {"document_id": {"$in": list(document_ids)}}
+
+def search_matches(query_vector: List[float], top_k: int = 3, namespace: str = "",
+                   filter: Optional[dict] = None, include_values: bool = False) -> list:
+    """
+    Searches the vector store and returns the raw matches ({"id", "score", "metadata"}), best first.
+    With `include_values`, each match also carries its stored embedding as "values".
+    """
+    with span("vector.search", top_k=top_k, filtered=filter is not None):
+        return get_vector_store().query(
+            vector=query_vector,
+            top_k=top_k,
+            namespace=namespace,
+            filter=filter,
+            include_values=include_values
+        )
+
+def fetch_values(ids: List[str], namespace: str = "") -> dict:
+    """
+    Stored embeddings of the given vector ids, as {id: values}; unknown ids are left out.
+    """
+    if not ids:
+        return {}
+    with span("vector.fetch", size=len(ids)):
+        return get_vector_store().fetch(list(ids), namespace=namespace)
+
+def search_in_pinecone(query_vector: List[float], top_k: int = 3, namespace: str = "",
+                       filter: Optional[dict] = None) -> str:
+    """
+    Searches the vector store for similar vectors and returns the concatenated text context.
+    `filter` is a Pinecone-style metadata filter, e.g. document_filter([...]).
+    """
+    matches = search_matches(query_vector, top_k, namespace, filter)
+
+    contexts = [match["metadata"]["text"] for match in matches if "text" in match["metadata"]]
+    return "\n\n".join(contexts)
@@ -0,0 +1,43 @@
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from chunker import iter_sentence_chunks
+from context_packer import estimate_tokens
+
+
+def _chunks_within(pages, timeout: float = 10.0):
+    # The chunker used to loop forever on these inputs, so a hang fails the test instead of stalling it
+    result = []
+    thread = threading.Thread(target=lambda: result.extend(iter_sentence_chunks(pages, max_tokens=200)), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), "iter_sentence_chunks did not finish"
+    return result
+
+
+@pytest.mark.parametrize("pages", [
+    ["Intro. " + "=" * 300 + " end."],
+    ["x" * 1000],
+    ["a " + "é" * 999 + " b"],
+    ["=" * 5000, "Next page. " * 50],
+])
+def test_oversized_words_are_cut(pages):
+    chunks = _chunks_within(pages)
+    assert chunks
+    assert all(estimate_tokens(chunk["text"]) <= 200 for chunk in chunks)
+    # Nothing is dropped: chunks run from the start of the first page to the end of the last
+    assert (chunks[0]["page"], chunks[0]["start"]) == (1, 0)
+    assert (chunks[-1]["end_page"], chunks[-1]["end"]) == (len(pages), len(pages[-1].rstrip()))
+
+
+def test_long_whitespace_runs_are_trimmed():
+    # Longer than the few characters of whitespace that are stepped over before falling back to a search
+    pages = ["First one." + " " * 40 + "Second one.\n" + " \t" * 30 + "\nThird" + " " * 50]
+    chunks = list(iter_sentence_chunks(pages, max_tokens=4, overlap_tokens=0))
+    assert [chunk["text"] for chunk in chunks] == ["First one.", "Second one.", "Third"]
+    assert [chunk["start"] for chunk in chunks] == [0, 50, pages[0].index("Third")]
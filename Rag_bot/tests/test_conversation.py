@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from conversation import ConversationMemory, is_follow_up
+
+
+@pytest.mark.parametrize("query, expected", [
+    ("why?", True),
+    ("How so?", True),
+    ("explain that more", True),
+    ("Why is it faster?", True),
+    ("What is BLEU?", False),
+    ("Define dropout", False),
+])
+def test_is_follow_up(query, expected):
+    assert is_follow_up(query) is expected
+
+
+def test_short_new_question_is_not_condensed():
+    memory = ConversationMemory()
+    memory.condense("How does the transformer encoder work?")
+    assert memory.condense("What is BLEU?") == "What is BLEU?"
+    assert memory.condense("why?") == "What is BLEU? why?"
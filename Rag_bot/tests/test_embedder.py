@@ -0,0 +1,84 @@
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import embedder
+from embedder import ChunkRejected, embed_batch
+
+
+class InvalidArgument(Exception):
+    # Matched by name, like google.api_core.exceptions.InvalidArgument
+    code = 400
+
+
+class PermissionDenied(Exception):
+    code = 403
+
+
+class FakeBackend:
+    def __init__(self, error_for=lambda texts: None):
+        self.error_for = error_for
+        self.requests = 0
+
+    def __call__(self, texts, model):
+        self.requests += 1
+        error = self.error_for(texts)
+        if error is not None:
+            raise error
+        return [[float(len(text))] for text in texts]
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    def install(error_for):
+        fake = FakeBackend(error_for)
+        monkeypatch.setattr(embedder, "_backend", fake)
+        return fake
+    return install
+
+
+def test_auth_errors_are_not_split(backend):
+    fake = backend(lambda texts: PermissionDenied("403 The caller does not have permission"))
+    with pytest.raises(PermissionDenied):
+        embed_batch([f"chunk {i}" for i in range(100)], "model")
+    assert fake.requests == 1
+
+
+def test_invalid_api_key_is_not_split(backend):
+    fake = backend(lambda texts: InvalidArgument("400 API key not valid. Please pass a valid API key."))
+    with pytest.raises(InvalidArgument):
+        embed_batch([f"chunk {i}" for i in range(100)], "model")
+    assert fake.requests == 1
+
+
+def test_rejected_chunk_is_isolated(backend):
+    backend(lambda texts: InvalidArgument("400 Request payload is invalid") if "bad" in texts else None)
+    batch = [f"chunk {i}" for i in range(10)]
+    batch[6] = "bad"
+    with pytest.raises(ChunkRejected) as raised:
+        embed_batch(batch, "model")
+    assert raised.value.text == "bad"
+    assert isinstance(raised.value.__cause__, InvalidArgument)
+
+
+def test_oversized_batch_is_split(backend):
+    fake = backend(lambda texts: InvalidArgument("400 Request payload size exceeds the limit") if len(texts) > 4 else None)
+    batch = [f"chunk {i}" for i in range(10)]
+    assert embed_batch(batch, "model") == [[float(len(text))] for text in batch]
+    assert fake.requests == 7
+
+
+def test_every_request_of_a_split_takes_a_rate_limit_token(backend, monkeypatch):
+    import embed_scheduler
+    from retry import TokenBucket
+
+    fake = backend(lambda texts: InvalidArgument("400 Request payload size exceeds the limit") if len(texts) > 4 else None)
+    limiter = TokenBucket(rate=1000, capacity=1)
+    acquired = []
+    monkeypatch.setattr(limiter, "acquire", lambda tokens=1.0: acquired.append(tokens))
+    monkeypatch.setattr(embed_scheduler, "_limiter", limiter)
+    embed_scheduler.embed_batch_limited([f"chunk {i}" for i in range(10)], "model")
+    assert fake.requests == len(acquired) == 7
@@ -0,0 +1,43 @@
+import os
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from jobs import QUEUED, RUNNING, JobStore, _job_owner
+
+
+def _running_job(store: JobStore, job_id: str, owner: str) -> None:
+    store.create(job_id, "", "doc.pdf", "/tmp/doc.pdf")
+    assert store.claim(job_id, owner)
+
+
+def _dead_pid() -> int:
+    process = subprocess.Popen([sys.executable, "-c", "pass"])
+    process.wait()
+    return process.pid
+
+
+def test_jobs_of_a_live_owner_are_not_taken_over(tmp_path):
+    path = str(tmp_path / "jobs.sqlite")
+    _running_job(JobStore(path), "live", _job_owner())
+    # A second process opening the same table
+    other = JobStore(path)
+    assert other.release_abandoned(lease=60) == []
+    assert other.get("live")["status"] == RUNNING
+
+
+def test_jobs_of_a_dead_or_silent_owner_are_queued_again(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    _running_job(store, "dead", f"{socket.gethostname()}:{_dead_pid()}")
+    _running_job(store, "silent", "another-host:1234")
+    _running_job(store, "remote", "another-host:5678")
+    store._execute("UPDATE jobs SET heartbeat_at = ? WHERE id = ?", (time.time() - 120, "silent"))
+
+    assert sorted(store.release_abandoned(lease=60)) == ["dead", "silent"]
+    assert store.get("dead")["status"] == store.get("silent")["status"] == QUEUED
+    assert store.get("remote")["status"] == RUNNING
+    # Queued again, the job can be claimed by the new owner
+    assert store.claim("dead", _job_owner())
@@ -0,0 +1,22 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), "..", "src"))
+
+from local_vectorstore import LocalNamespace
+
+
+@pytest.mark.parametrize("compression", ["int8", "pq"])
+def test_compressed_in_memory_namespace_grows_after_training(compression):
+    namespace = LocalNamespace(None, compression=compression, train_threshold=500, pq_subvectors=8)
+    vectors = np.random.default_rng(0).standard_normal((1600, 32)).astype(np.float32)
+    for start in range(0, 1600, 400):
+        namespace.add([f"v{i}" for i in range(start, start + 400)], vectors[start:start + 400], [{}] * 400)
+
+    assert namespace.count == 1600
+    # Codes written before the arrays grew are kept
+    for row in (100, 700, 1500):
+        assert namespace.search(vectors[row], 1)[0]["id"] == f"v{row}"